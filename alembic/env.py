@@ -4,12 +4,8 @@ from sqlalchemy import pool
 from alembic import context
 from src.database.db import SQLALCHEMY_DATABASE_URL
 from src.database.models import Base
-from dotenv import load_dotenv
 import os
 
-
-load_dotenv()
-
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -0,0 +1,77 @@
+"""contact phone e164
+
+Adds contacts.phone_e164 and fills it in batches of BATCH_SIZE contacts, each committed on its own, so the
+table is never locked for the whole backfill. Numbers without a country code are read as numbers of
+PHONE_DEFAULT_REGION (default UA), like src.services.phone does.
+If the backfill is interrupted, running the migration again starts it over.
+
+Revision ID: 4f6a8e3b2c91
+Revises: 9b1d4c2e7a10
+Create Date: 2026-10-18 11:03:17.204815
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import phonenumbers
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f6a8e3b2c91'
+down_revision: Union[str, None] = '9b1d4c2e7a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+REGION = os.getenv("PHONE_DEFAULT_REGION", "UA")
+
+
+def to_e164(number: str) -> str | None:
+    # a copy of src.services.phone.to_e164 as of this revision; importing the app would load its whole configuration
+    try:
+        parsed = phonenumbers.parse(number, REGION)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(parsed):
+        return None
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    # the column may be there already if a previous run was interrupted during the backfill
+    if 'phone_e164' not in {column['name'] for column in sa.inspect(conn).get_columns('contacts')}:
+        op.add_column('contacts', sa.Column('phone_e164', sa.String(length=16), nullable=True))
+
+    # Backfill in keyset-paginated batches, each in a transaction of its own
+    contacts = sa.table('contacts', sa.column('id', sa.Integer), sa.column('phonenumber', sa.String),
+                        sa.column('phone_e164', sa.String))
+    with op.get_context().autocommit_block():
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                sa.select(contacts.c.id, contacts.c.phonenumber)
+                .where(contacts.c.id > last_id)
+                .order_by(contacts.c.id)
+                .limit(BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            numbers = [(row.id, to_e164(row.phonenumber)) for row in rows if row.phonenumber]
+            numbers = [(row_id, number) for row_id, number in numbers if number]
+            if numbers:
+                # one statement per batch: in autocommit mode every statement is a transaction
+                batch = sa.values(sa.column('row_id', sa.Integer), sa.column('phone_e164', sa.String),
+                                  name='batch').data(numbers)
+                conn.execute(contacts.update().where(contacts.c.id == batch.c.row_id)
+                             .values(phone_e164=batch.c.phone_e164))
+            last_id = rows[-1].id
+
+    op.create_index('ix_contacts_user_id_phone_e164', 'contacts', ['user_id', 'phone_e164'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_phone_e164', table_name='contacts')
+    op.drop_column('contacts', 'phone_e164')
@@ -0,0 +1,53 @@
+"""contacts soft delete
+
+Adds contacts.deleted_at and limits the indexes used by the API to live contacts.
+The column is nullable without a default, so adding it does not rewrite the table.
+
+Revision ID: a5c8e2f17d94
+Revises: d71f0b5e8a23
+Create Date: 2026-10-18 15:02:44.183520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5c8e2f17d94'
+down_revision: Union[str, None] = 'd71f0b5e8a23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LIVE = sa.text('deleted_at IS NULL')
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.drop_constraint('uq_contacts_user_id_email', 'contacts', type_='unique')
+    op.create_index('uq_contacts_user_id_email', 'contacts', ['user_id', 'email'], unique=True,
+                    postgresql_where=LIVE)
+    op.drop_index('ix_contacts_user_id_updated_at', table_name='contacts')
+    op.create_index('ix_contacts_user_id_updated_at', 'contacts', ['user_id', 'updated_at', 'id'], unique=False,
+                    postgresql_where=LIVE)
+    op.drop_index('ix_contacts_user_id_phone_e164', table_name='contacts')
+    op.create_index('ix_contacts_user_id_phone_e164', 'contacts', ['user_id', 'phone_e164'], unique=False,
+                    postgresql_where=LIVE)
+    op.create_index('ix_contacts_deleted_at', 'contacts', ['deleted_at'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def downgrade() -> None:
+    # contacts waiting for the purge are purged now, they would break the unique constraint
+    op.execute('DELETE FROM contact_tags WHERE (contact_id, user_id) IN '
+               '(SELECT id, user_id FROM contacts WHERE deleted_at IS NOT NULL)')
+    op.execute('DELETE FROM contacts WHERE deleted_at IS NOT NULL')
+    op.drop_index('ix_contacts_deleted_at', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_phone_e164', table_name='contacts')
+    op.create_index('ix_contacts_user_id_phone_e164', 'contacts', ['user_id', 'phone_e164'], unique=False)
+    op.drop_index('ix_contacts_user_id_updated_at', table_name='contacts')
+    op.create_index('ix_contacts_user_id_updated_at', 'contacts', ['user_id', 'updated_at', 'id'], unique=False)
+    op.drop_index('uq_contacts_user_id_email', table_name='contacts')
+    op.create_unique_constraint('uq_contacts_user_id_email', 'contacts', ['user_id', 'email'])
+    op.drop_column('contacts', 'deleted_at')
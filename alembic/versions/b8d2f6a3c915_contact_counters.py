@@ -0,0 +1,50 @@
+"""contact counters
+
+Creates contact_counters and fills it from the live contacts with one grouped query per kind of counter.
+
+Revision ID: b8d2f6a3c915
+Revises: a5c8e2f17d94
+Create Date: 2026-10-18 16:20:31.540917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d2f6a3c915'
+down_revision: Union[str, None] = 'a5c8e2f17d94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('contact_counters',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=32), nullable=False),
+    sa.Column('value', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'name')
+    )
+    op.execute("""
+        INSERT INTO contact_counters (user_id, name, value)
+        SELECT user_id, 'total', count(*) FROM contacts WHERE deleted_at IS NULL GROUP BY user_id
+    """)
+    op.execute("""
+        INSERT INTO contact_counters (user_id, name, value)
+        SELECT user_id, 'birth_month:' || to_char(birthdate, 'MM'), count(*) FROM contacts
+        WHERE deleted_at IS NULL AND birthdate IS NOT NULL GROUP BY user_id, to_char(birthdate, 'MM')
+    """)
+    # only the days served as recently added, see STATS_ADDED_DAYS
+    op.execute("""
+        INSERT INTO contact_counters (user_id, name, value)
+        SELECT user_id, 'added:' || to_char(created_at, 'YYYY-MM-DD'), count(*) FROM contacts
+        WHERE deleted_at IS NULL AND created_at >= current_date - 30
+        GROUP BY user_id, to_char(created_at, 'YYYY-MM-DD')
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('contact_counters')
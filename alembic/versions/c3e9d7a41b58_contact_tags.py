@@ -0,0 +1,47 @@
+"""contact tags
+
+Revision ID: c3e9d7a41b58
+Revises: 4f6a8e3b2c91
+Create Date: 2026-10-18 12:26:50.918344
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e9d7a41b58'
+down_revision: Union[str, None] = '4f6a8e3b2c91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('tags',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('contact_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'name', name='uq_tags_user_id_name')
+    )
+    op.create_table('contact_tags',
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('contact_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['contact_id'], ['contacts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('tag_id', 'contact_id')
+    )
+    op.create_index('ix_contact_tags_contact_id', 'contact_tags', ['contact_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contact_tags_contact_id', table_name='contact_tags')
+    op.drop_table('contact_tags')
+    op.drop_table('tags')
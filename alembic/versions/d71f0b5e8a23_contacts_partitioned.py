@@ -0,0 +1,103 @@
+"""contacts partitioned
+
+Hash-partitions the contacts table on user_id (PostgreSQL 12+).
+
+The rows are copied into the new table in a single INSERT ... SELECT, which locks contacts for the duration;
+run it in a maintenance window on large installations. Contacts without a user cannot be placed in a
+partition and are not copied; the API never returned them.
+The number of partitions is read from CONTACTS_PARTITIONS (default 16) and cannot be changed later without
+repeating the copy.
+
+Revision ID: d71f0b5e8a23
+Revises: c3e9d7a41b58
+Create Date: 2026-10-18 13:41:07.662190
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd71f0b5e8a23'
+down_revision: Union[str, None] = 'c3e9d7a41b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONS = int(os.getenv("CONTACTS_PARTITIONS", "16"))
+
+COLUMNS = ("id, first_name, last_name, email, phonenumber, phone_e164, birthdate, additional_info, "
+           "created_at, updated_at, user_id")
+
+
+def upgrade() -> None:
+    # the sequence must outlive the old table, which owns it
+    op.execute("ALTER SEQUENCE contacts_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE contacts_partitioned (
+            id integer NOT NULL DEFAULT nextval('contacts_id_seq'),
+            first_name varchar(50) NOT NULL,
+            last_name varchar(50) NOT NULL,
+            email varchar(50) NOT NULL,
+            phonenumber varchar(13) NOT NULL,
+            phone_e164 varchar(16),
+            birthdate date,
+            additional_info varchar(300),
+            created_at timestamp without time zone NOT NULL,
+            updated_at timestamp without time zone NOT NULL,
+            user_id integer NOT NULL REFERENCES users (id)
+        ) PARTITION BY HASH (user_id)
+    """)
+    for remainder in range(PARTITIONS):
+        op.execute(f"CREATE TABLE contacts_p{remainder} PARTITION OF contacts_partitioned "
+                   f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})")
+    op.execute(f"INSERT INTO contacts_partitioned ({COLUMNS}) "
+               f"SELECT {COLUMNS} FROM contacts WHERE user_id IS NOT NULL")
+
+    op.drop_constraint('contact_tags_contact_id_fkey', 'contact_tags', type_='foreignkey')
+    op.execute("DELETE FROM contact_tags WHERE contact_id NOT IN (SELECT id FROM contacts_partitioned)")
+    op.drop_table('contacts')
+    op.rename_table('contacts_partitioned', 'contacts')
+    op.execute("ALTER TABLE contacts RENAME CONSTRAINT contacts_partitioned_user_id_fkey TO contacts_user_id_fkey")
+    op.execute("ALTER SEQUENCE contacts_id_seq OWNED BY contacts.id")
+
+    # unique constraints of a partitioned table must include the partition key
+    op.create_primary_key('contacts_pkey', 'contacts', ['id', 'user_id'])
+    op.create_unique_constraint('uq_contacts_user_id_email', 'contacts', ['user_id', 'email'])
+    op.create_index('ix_contacts_user_id_updated_at', 'contacts', ['user_id', 'updated_at', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_phone_e164', 'contacts', ['user_id', 'phone_e164'], unique=False)
+    op.create_foreign_key('fk_contact_tags_contact', 'contact_tags', 'contacts',
+                          ['contact_id', 'user_id'], ['id', 'user_id'], ondelete='CASCADE')
+    op.execute("ANALYZE contacts")
+
+
+def downgrade() -> None:
+    op.execute("ALTER SEQUENCE contacts_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE contacts_unpartitioned (
+            id integer NOT NULL DEFAULT nextval('contacts_id_seq') PRIMARY KEY,
+            first_name varchar(50) NOT NULL,
+            last_name varchar(50) NOT NULL,
+            email varchar(50) NOT NULL,
+            phonenumber varchar(13) NOT NULL,
+            phone_e164 varchar(16),
+            birthdate date,
+            additional_info varchar(300),
+            created_at timestamp without time zone NOT NULL,
+            updated_at timestamp without time zone NOT NULL,
+            user_id integer REFERENCES users (id)
+        )
+    """)
+    op.execute(f"INSERT INTO contacts_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM contacts")
+    op.drop_constraint('fk_contact_tags_contact', 'contact_tags', type_='foreignkey')
+    op.drop_table('contacts')
+    op.rename_table('contacts_unpartitioned', 'contacts')
+    op.execute("ALTER TABLE contacts RENAME CONSTRAINT contacts_unpartitioned_pkey TO contacts_pkey")
+    op.execute("ALTER TABLE contacts RENAME CONSTRAINT contacts_unpartitioned_user_id_fkey TO contacts_user_id_fkey")
+    op.execute("ALTER SEQUENCE contacts_id_seq OWNED BY contacts.id")
+    # emails were unique per user only, so the old global unique constraint cannot be restored
+    op.create_index('ix_contacts_user_id_updated_at', 'contacts', ['user_id', 'updated_at', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_phone_e164', 'contacts', ['user_id', 'phone_e164'], unique=False)
+    op.create_foreign_key('contact_tags_contact_id_fkey', 'contact_tags', 'contacts',
+                          ['contact_id'], ['id'], ondelete='CASCADE')
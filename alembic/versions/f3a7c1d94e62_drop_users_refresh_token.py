@@ -0,0 +1,28 @@
+"""drop users refresh_token
+
+Refresh tokens are tracked per session in Redis, the column has not been written since.
+
+Revision ID: f3a7c1d94e62
+Revises: b8d2f6a3c915
+Create Date: 2026-10-19 09:12:44.208316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a7c1d94e62'
+down_revision: Union[str, None] = 'b8d2f6a3c915'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_column('users', 'refresh_token')
+
+
+def downgrade() -> None:
+    op.add_column('users', sa.Column('refresh_token', sa.String(length=255), nullable=True))
@@ -0,0 +1,31 @@
+import os
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from src.database.models import User
+from benchmarks.seed import bench_url, seed
+
+BENCH_USERS = int(os.getenv("BENCH_USERS", "10"))
+BENCH_CONTACTS = int(os.getenv("BENCH_CONTACTS", "1000"))
+
+engine = create_engine(bench_url())
+BenchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(scope="session")
+def seeded():
+    return seed(engine, BENCH_USERS, BENCH_CONTACTS)
+
+
+@pytest.fixture(scope="session")
+def session(seeded):
+    db = BenchSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="session")
+def bench_user(session, seeded):
+    return session.execute(select(User).filter_by(email=seeded[0])).scalar_one()
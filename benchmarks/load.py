@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import defaultdict
+import httpx
+from benchmarks.seed import BENCH_PASSWORD, EMAIL_DOMAIN
+
+SCENARIO = [
+    ("list", "/contacts/", {"limit": 50}),
+    ("search", "/contacts/search", {"search_query": "shev"}),
+    ("dates", "/dates/", {}),
+]
+
+
+async def virtual_user(client: httpx.AsyncClient, email: str, deadline: float, samples: dict, errors: dict):
+    """
+    The virtual_user function logs in once and then runs the list, search and dates steps in a loop until the deadline.
+
+    :param client: httpx.AsyncClient: The client connected to the server under test
+    :param email: str: The email of a seeded user
+    :param deadline: float: perf_counter value at which the user stops
+    :param samples: dict: Latencies in seconds per step, filled by this function
+    :param errors: dict: Number of failed requests per step, filled by this function
+    :return: None
+    """
+    started = time.perf_counter()
+    response = await client.post("/users/auth/login", data={"username": email, "password": BENCH_PASSWORD})
+    samples["login"].append(time.perf_counter() - started)
+    if response.status_code != 200:
+        errors["login"] += 1
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    while time.perf_counter() < deadline:
+        for name, url, params in SCENARIO:
+            started = time.perf_counter()
+            response = await client.get(url, params=params, headers=headers)
+            samples[name].append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors[name] += 1
+
+
+def summarize(samples: dict, errors: dict, elapsed: float) -> dict:
+    """
+    The summarize function computes p50/p95/p99 latencies per step and the overall throughput.
+
+    :param samples: dict: Latencies in seconds per step
+    :param errors: dict: Number of failed requests per step
+    :param elapsed: float: Wall-clock duration of the run in seconds
+    :return: A dictionary with one entry per step and a total entry
+    """
+    report = {}
+    for name, values in samples.items():
+        cuts = statistics.quantiles(values, n=100) if len(values) > 1 else values * 99
+        report[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "p50_ms": round(cuts[49] * 1000, 2),
+            "p95_ms": round(cuts[94] * 1000, 2),
+            "p99_ms": round(cuts[98] * 1000, 2),
+        }
+    total = sum(len(values) for values in samples.values())
+    report["total"] = {"requests": total, "errors": sum(errors.values()),
+                       "seconds": round(elapsed, 2), "rps": round(total / elapsed, 2)}
+    return report
+
+
+async def run(base_url: str, users: int, duration: float) -> dict:
+    samples, errors = defaultdict(list), defaultdict(int)
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(virtual_user(client, f"user{u}@{EMAIL_DOMAIN}", deadline, samples, errors)
+                               for u in range(users)))
+        elapsed = time.perf_counter() - started
+    return summarize(samples, errors, elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the login -> list -> search -> dates load scenario")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users, at most the seeded users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+    result = asyncio.run(run(args.base_url, args.users, args.duration))
+    for step, row in result.items():
+        print(step.ljust(8), "  ".join(f"{key}={value}" for key, value in row.items()))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
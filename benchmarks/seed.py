@@ -0,0 +1,82 @@
+import argparse
+import os
+import random
+from datetime import date, timedelta
+from sqlalchemy import create_engine, delete, insert, select
+from sqlalchemy.engine import Engine
+from src.database.models import Base, Contact, User
+from src.services.auth import auth_service
+
+BENCH_PASSWORD = "bench12"
+EMAIL_DOMAIN = "bench.example.com"
+BATCH_SIZE = 5000
+FIRST_NAMES = ["John", "Jane", "Olena", "Taras", "Maria", "Petro", "Anna", "Ivan", "Sofia", "Andrii"]
+LAST_NAMES = ["Smith", "Shevchenko", "Kovalenko", "Bondarenko", "Johnson", "Melnyk", "Tkachenko", "Brown"]
+
+
+def bench_url() -> str:
+    """
+    The bench_url function returns the database the benchmarks run against, BENCH_DB_URL.
+    There is no fallback: seed deletes the rows of previous runs, so the app database must never be picked up.
+
+    :return: The SQLAlchemy database URL
+    """
+    url = os.getenv("BENCH_DB_URL")
+    if not url:
+        raise RuntimeError("BENCH_DB_URL is not set, the benchmarks need a database of their own")
+    if url == os.getenv("TEST_DB_URL"):
+        raise RuntimeError("BENCH_DB_URL is the app database (TEST_DB_URL), the benchmarks need a database of their own")
+    return url
+
+
+def seed(engine: Engine, users: int, contacts_per_user: int, seed_value: int = 42) -> list[str]:
+    """
+    The seed function fills the database with users x contacts_per_user contacts.
+    Rows from a previous run are removed first, so the data set is the same on every run.
+    All users are confirmed and share the BENCH_PASSWORD password, which is hashed only once.
+
+    :param engine: Engine: The engine of the benchmark database
+    :param users: int: Number of users to create
+    :param contacts_per_user: int: Number of contacts to create for every user
+    :param seed_value: int: Seed of the random generator used for names and birthdays
+    :return: The emails of the created users
+    """
+    rng = random.Random(seed_value)
+    Base.metadata.create_all(bind=engine)
+    password = auth_service.get_password_hash(BENCH_PASSWORD)
+    emails = [f"user{u}@{EMAIL_DOMAIN}" for u in range(users)]
+    with engine.begin() as conn:
+        conn.execute(delete(Contact).where(Contact.email.like(f"%@{EMAIL_DOMAIN}")))
+        conn.execute(delete(User).where(User.email.like(f"%@{EMAIL_DOMAIN}")))
+        conn.execute(insert(User), [
+            {"username": f"user{u}", "email": email, "password": password, "confirmed": True, "avatar": ""}
+            for u, email in enumerate(emails)
+        ])
+        user_ids = dict(conn.execute(select(User.email, User.id).where(User.email.in_(emails))).all())
+        batch = []
+        for u, email in enumerate(emails):
+            for i in range(contacts_per_user):
+                batch.append({
+                    "first_name": rng.choice(FIRST_NAMES),
+                    "last_name": rng.choice(LAST_NAMES),
+                    "email": f"c{u}x{i}@{EMAIL_DOMAIN}",
+                    "phonenumber": f"+380{rng.randrange(10 ** 9):09d}",
+                    "birthdate": date(1970, 1, 1) + timedelta(days=rng.randrange(365 * 40)),
+                    "additional_info": "Seeded for benchmarks",
+                    "user_id": user_ids[email],
+                })
+                if len(batch) >= BATCH_SIZE:
+                    conn.execute(insert(Contact), batch)
+                    batch = []
+        if batch:
+            conn.execute(insert(Contact), batch)
+    return emails
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the benchmark database")
+    parser.add_argument("--users", type=int, default=int(os.getenv("BENCH_USERS", "10")))
+    parser.add_argument("--contacts", type=int, default=int(os.getenv("BENCH_CONTACTS", "1000")))
+    args = parser.parse_args()
+    seed(create_engine(bench_url()), args.users, args.contacts)
+    print(f"Seeded {args.users} users x {args.contacts} contacts into {bench_url()}")
@@ -0,0 +1,37 @@
+import json
+from fastapi.encoders import jsonable_encoder
+from src.repository.contacts import get_contacts, get_contact, search_contacts
+from src.routes.dates import show_dates
+from src.schemas import ContactResponse
+
+
+def test_get_contacts(benchmark, session, bench_user):
+    result = benchmark(get_contacts, 100, 0, session, bench_user)
+    assert len(result) == 100
+
+
+def test_get_contacts_filtered(benchmark, session, bench_user):
+    benchmark(get_contacts, 100, 0, session, bench_user, "Jo", "Smi")
+
+
+def test_get_contact(benchmark, session, bench_user):
+    contact_id = get_contacts(10, 0, session, bench_user)[0].id
+    result = benchmark(get_contact, contact_id, session, bench_user)
+    assert result.id == contact_id
+
+
+def test_search_contacts(benchmark, session, bench_user):
+    benchmark(search_contacts, session, bench_user, "shev")
+
+
+def test_show_dates(benchmark, session, bench_user):
+    benchmark(show_dates, session, bench_user)
+
+
+def test_serialize_contacts(benchmark, session, bench_user):
+    contacts = get_contacts(100, 0, session, bench_user)
+
+    def serialize():
+        return json.dumps(jsonable_encoder([ContactResponse.model_validate(c) for c in contacts]))
+
+    assert benchmark(serialize).startswith("[")
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+from benchmarks.seed import bench_url
+
+ROOT = Path(__file__).resolve().parent.parent
+
+IMPORT_APP = "import main"
+# the lifespan connects to Redis, like the app does at startup
+START_APP = """
+from fastapi.testclient import TestClient
+import main
+with TestClient(main.create_app()):
+    pass
+"""
+
+
+def run_python(code: str, *options: str) -> str:
+    """
+    The run_python function runs code in a new interpreter, so nothing is imported yet, as in a new container.
+
+    :param code: str: The code to run
+    :param options: str: Options of the interpreter, e.g. -X importtime
+    :return: What the code wrote to stderr
+    """
+    result = subprocess.run([sys.executable, *options, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                            check=True, env={**os.environ, "TEST_DB_URL": bench_url()})
+    return result.stderr
+
+
+def slowest_imports(report: str, count: int = 10) -> dict[str, int]:
+    """
+    The slowest_imports function sums the -X importtime report by top-level package.
+
+    :param report: str: The report written by python -X importtime
+    :param count: int: Number of packages to return
+    :return: The slowest packages with their import time in microseconds, slowest first
+    """
+    totals = Counter()
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().split(".")[0]] += int(own)
+    return dict(totals.most_common(count))
+
+
+def test_import_app(benchmark):
+    benchmark.extra_info["slowest_imports_us"] = slowest_imports(run_python(IMPORT_APP, "-X", "importtime"))
+    benchmark.pedantic(run_python, args=(IMPORT_APP,), rounds=5, iterations=1)
+
+
+def test_start_app(benchmark):
+    benchmark.pedantic(run_python, args=(START_APP,), rounds=5, iterations=1)
@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import httpx
+from benchmarks.load import run
+from benchmarks.seed import bench_url
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def single(port: int, workers: int) -> tuple[list[str], dict]:
+    # what the Dockerfile used to run
+    return [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)], {}
+
+
+def multi(port: int, workers: int) -> tuple[list[str], dict]:
+    return ([sys.executable, "-m", "gunicorn", "-c", "python:src.conf.gunicorn", "main:app"],
+            {"WEB_BIND": f"127.0.0.1:{port}", "WEB_CONCURRENCY": str(workers)})
+
+
+MODES = {"single": single, "gunicorn": multi}
+
+
+@contextmanager
+def serve(command: list[str], env: dict, base_url: str, timeout: float = 60):
+    """
+    The serve function starts a server, waits until it answers and stops it gracefully with SIGTERM on exit.
+
+    :param command: list[str]: The command starting the server
+    :param env: dict: Environment variables set for the server
+    :param base_url: str: The URL the server answers on
+    :param timeout: float: Seconds to wait for the server to start
+    :return: None
+    """
+    process = subprocess.Popen(command, cwd=ROOT, env={**os.environ, **env},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{' '.join(command)} exited with {process.returncode}")
+            try:
+                if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{' '.join(command)} did not start in {timeout}s")
+            time.sleep(0.2)
+        yield
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def compare(modes: list[str], workers: int, users: int, duration: float, warmup: float, port: int) -> dict:
+    """
+    The compare function runs the load scenario against every server mode in turn, on the same data.
+    Rate limits and background jobs are switched off in the servers, so only the serving is measured.
+
+    :param modes: list[str]: The modes to compare, see MODES
+    :param workers: int: Number of workers of the gunicorn mode
+    :param users: int: Concurrent virtual users, at most the seeded users
+    :param duration: float: Seconds of load per mode
+    :param warmup: float: Seconds of load per mode before measuring
+    :param port: int: Port the servers listen on
+    :return: The report of benchmarks.load per mode
+    """
+    env = {"TEST_DB_URL": bench_url(), "RATE_LIMIT_ENABLED": "0", "PURGE_ENABLED": "0",
+           "STATS_RECONCILE_ENABLED": "0", "BIRTHDAY_DIGEST_ENABLED": "0"}
+    base_url = f"http://127.0.0.1:{port}"
+    results = {}
+    for mode in modes:
+        command, mode_env = MODES[mode](port, workers)
+        with serve(command, {**env, **mode_env}, base_url):
+            if warmup:
+                asyncio.run(run(base_url, users, warmup))
+            results[mode] = asyncio.run(run(base_url, users, duration))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the throughput of the single-process and gunicorn servers")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="workers of the gunicorn mode")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users, at most the seeded users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per mode")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds per mode before measuring")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--output", help="write the reports as JSON to this file")
+    args = parser.parse_args()
+    result = compare(args.modes, args.workers, args.users, args.duration, args.warmup, args.port)
+    baseline = result.get("single", {}).get("total", {}).get("rps")
+    for mode, report in result.items():
+        total = report["total"]
+        speedup = f"  x{total['rps'] / baseline:.2f}" if baseline else ""
+        print(mode.ljust(8), f"rps={total['rps']}  errors={total['errors']}  list_p95_ms={report['list']['p95_ms']}"
+              + speedup)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
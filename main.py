@@ -1,41 +1,153 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException
+import logging
+import time
+import uuid
+from anyio import to_thread
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Request, Response
 from sqlalchemy import text, and_, select, extract
 from sqlalchemy.orm import Session
-from src.database.db import get_db
+from src.conf.config import settings
+from src.database.db import engine, get_db
+from src.database.cache import init_redis, close_redis, get_redis
+from src.database.shards import shard_router
 from src.routes import contacts, dates, users
-import redis.asyncio as redis
+from src.services.metrics import MULTIPROCESS, REQUEST_LATENCY, latest_metrics, refresh_gauges
+from src.services import duplicates
+from src.services.events import contact_events
+from src.services.idempotency import idempotency
+from src.services.purge import purge_worker
+from src.services.stats import stats_reconciler
+from src.services.birthdays import birthday_digests
+from src.services.profiling import profiler, current_timeline, ProfiledJSONResponse
+from src.services.rate_limit import client_identifier, default_limit
+from src.services.logger import request_id, setup_logging, shutdown_logging
 from fastapi_limiter import FastAPILimiter
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-import os
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 
-app = FastAPI()
-app.include_router(users.router, prefix="/users")
-app.include_router(contacts.router, prefix="/contacts")
-app.include_router(dates.router, prefix="/dates")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan function starts logging, the shared Redis pool, the contact event fan-out and the background
+    jobs (purge of deleted contacts, reconciliation of the contact counters, birthday digests)
+    before the first request, and stops them and closes the connection pools after the last one.
+    The thread pool running the sync routes and database work is sized with THREADPOOL_SIZE.
+
+    :param app: FastAPI: The application
+    :return: None
+    """
+    setup_logging()
+    to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+    r = await init_redis()
+    await FastAPILimiter.init(r, identifier=client_identifier)
+    await contact_events.start(r)
+    await purge_worker.start(r)
+    await stats_reconciler.start(r)
+    await birthday_digests.start(r)
+    yield
+    await birthday_digests.stop()
+    await stats_reconciler.stop()
+    await purge_worker.stop()
+    await contact_events.stop()
+    duplicates.shutdown()
+    await close_redis()
+    shard_router.dispose()
+    engine.dispose()
+    shutdown_logging()
+
+
+router = APIRouter(dependencies=[Depends(default_limit)])
 
 origins = ["*"]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-@app.on_event("startup")
-async def startup():
-    r = await redis.Redis(host=os.getenv("REDIS_HOST"), port=os.getenv("REDIS_PORT"), db=0, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(r)
+async def track_request_latency(request: Request, call_next):
+    """
+    The track_request_latency middleware records the latency of every request in a histogram.
+    Requests are labelled with the route template rather than the raw path, so contact ids do not explode the label set.
 
+    :param request: Request: The incoming request
+    :param call_next: Call the next handler in the chain
+    :return: The response of the route
+    """
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_LATENCY.labels(request.method, route.path if route else "unmatched", response.status_code)\
+        .observe(time.perf_counter() - start)
+    if MULTIPROCESS:
+        refresh_gauges()
+    return response
 
 
-@app.get("/")
+async def profile_request(request: Request, call_next):
+    """
+    The profile_request middleware records a timeline for sampled requests and requests sent with
+    the X-Debug-Profile: 1 header, while profiling is enabled. With X-Debug-Explain: 1 the timeline
+    also carries the EXPLAIN output of every SELECT. The debug headers need the PROFILING_DEBUG_TOKEN
+    in X-Debug-Token. The switches are reloaded from Redis, see Profiler.
+
+    :param request: Request: The incoming request
+    :param call_next: Call the next handler in the chain
+    :return: The response of the route
+    """
+    await profiler.refresh(get_redis())
+    timeline = profiler.start(request)
+    if timeline is None:
+        return await call_next(request)
+    token = current_timeline.set(timeline)
+    try:
+        response = await call_next(request)
+    finally:
+        current_timeline.reset(token)
+    await profiler.finish(timeline, response)
+    return response
+
+
+async def idempotent_writes(request: Request, call_next):
+    """
+    The idempotent_writes middleware replays the stored response when a contact write is retried
+    with the same Idempotency-Key header, see Idempotency.
+
+    :param request: Request: The incoming request
+    :param call_next: Call the next handler in the chain
+    :return: The response of the route, or the stored one
+    """
+    return await idempotency(request, call_next)
+
+
+async def add_request_id(request: Request, call_next):
+    """
+    The add_request_id middleware tags every log line written while serving a request with the request id.
+    The id is taken from the X-Request-ID header when the client sends one, and is echoed in the response.
+
+    :param request: Request: The incoming request
+    :param call_next: Call the next handler in the chain
+    :return: The response of the route
+    """
+    token = request_id.set(request.headers.get("x-request-id") or uuid.uuid4().hex)
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id.get()
+        return response
+    finally:
+        request_id.reset(token)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    The metrics function exposes the Prometheus metrics of this process.
+
+    :return: The metrics in the Prometheus text format
+    """
+    payload, content_type = latest_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
+@router.get("/")
 async def test(db: Session = Depends(get_db)):
     """
     The 'test' function is a simple function that checks the health of the database.
@@ -52,5 +164,35 @@ async def test(db: Session = Depends(get_db)):
             raise HTTPException(status_code=500, detail="Database is not configured correctly")
         return {"message": "Welcome to Contacts API!"}
     except Exception as e:
-        print(e)
+        logger.exception("Health check failed: %s", e)
         raise HTTPException(status_code=500, detail="Error connecting to the database")
+
+
+def create_app() -> FastAPI:
+    """
+    The create_app function builds the application: routers, CORS and the middlewares.
+    Nothing is connected here; Redis, the background jobs and logging are started by the lifespan,
+    so building the app is cheap and every process or test can build its own.
+
+    :return: The application
+    """
+    app = FastAPI(lifespan=lifespan, default_response_class=ProfiledJSONResponse)
+    app.include_router(users.router, prefix="/users")
+    app.include_router(contacts.router, prefix="/contacts")
+    app.include_router(dates.router, prefix="/dates")
+    app.include_router(router)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # the middleware added last runs first, as with @app.middleware
+    for middleware in (track_request_latency, profile_request, idempotent_writes, add_request_id):
+        app.middleware("http")(middleware)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,138 @@
+from typing import Literal
+from pydantic import EmailStr, Field
+from pydantic_settings import BaseSettings
+from dotenv import load_dotenv
+
+# the only place the .env file is read; the variables it sets are visible to the whole process, e.g. to alembic
+load_dotenv()
+
+RATE = r"^\d+/\d+(\.\d+)?$"
+
+
+class Settings(BaseSettings):
+    """
+    The configuration of the app. Every field is read from the environment variable of the same name,
+    case-insensitive, e.g. db_pool_size from DB_POOL_SIZE. The values are validated once, when the app is imported,
+    so a typo fails the startup instead of the first request that needs the value.
+    """
+
+    # server, see src/conf/gunicorn.py; WEB_CONCURRENCY defaults to one worker per CPU
+    web_bind: str = "0.0.0.0:8000"
+    web_concurrency: int | None = Field(None, ge=1)
+    web_timeout: int = Field(60, gt=0)
+    web_graceful_timeout: int = Field(30, gt=0)
+    web_keepalive: int = Field(5, gt=0)
+    web_max_requests: int = Field(0, ge=0)
+    server_loop: Literal["auto", "asyncio", "uvloop"] = "auto"
+    server_http: Literal["auto", "h11", "httptools"] = "auto"
+    # proxies whose X-Forwarded-For is trusted, comma-separated addresses or networks, * for any; gunicorn reads it too
+    forwarded_allow_ips: str = "127.0.0.1"
+    # set with more than one worker, so /metrics adds up the metrics of every worker
+    prometheus_multiproc_dir: str | None = None
+
+    # database
+    sqlalchemy_database_url: str = Field(validation_alias="TEST_DB_URL")
+    db_pool_size: int = Field(5, ge=1)
+    db_max_overflow: int = Field(10, ge=0)
+    db_pool_timeout: float = Field(30, gt=0)
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = False
+    # comma-separated, see src/database/shards.py
+    shard_db_urls: str = ""
+    shard_cache_seconds: float = Field(5, ge=0)
+    sync_lag_seconds: float = Field(5, ge=0)
+    # threads running the sync routes, the SQLAlchemy sessions and bcrypt
+    threadpool_size: int = Field(40, ge=1)
+
+    # redis
+    redis_host: str = "localhost"
+    redis_port: int = 6379
+    redis_max_connections: int = Field(50, ge=1)
+    redis_pool_timeout: float = Field(5, gt=0)
+    redis_socket_timeout: float = Field(5, gt=0)
+    redis_connect_timeout: float = Field(2, gt=0)
+    redis_health_check_interval: int = Field(30, ge=0)
+
+    # auth
+    secret_key: str
+    algorithm: str = "HS256"
+    access_token_minutes: float = Field(15, gt=0)
+    refresh_token_seconds: int = Field(7 * 24 * 60 * 60, gt=0)
+    user_cache_seconds: int = Field(100, gt=0)
+    login_account_threshold: int = Field(5, ge=1)
+    login_ip_threshold: int = Field(20, ge=1)
+    login_failure_window_seconds: int = Field(900, gt=0)
+    login_lockout_seconds: float = Field(30, gt=0)
+    login_lockout_max_seconds: float = Field(3600, gt=0)
+
+    # rate limits, requests/seconds; the default one applies to the routes without a limit of their own
+    rate_limit_enabled: bool = True
+    rate_limit_default: str = Field("60/60", pattern=RATE)
+    rate_limit_contacts: str = Field("120/60", pattern=RATE)
+    rate_limit_search: str = Field("30/60", pattern=RATE)
+    rate_limit_dates: str = Field("60/60", pattern=RATE)
+    rate_limit_login: str = Field("10/60", pattern=RATE)
+
+    # caches and streams
+    idempotency_ttl_seconds: int = Field(24 * 60 * 60, gt=0)
+    idempotency_lock_seconds: int = Field(60, gt=0)
+    sse_queue_size: int = Field(100, ge=1)
+    sse_outbox_size: int = Field(10000, ge=1)
+    sse_heartbeat_seconds: float = Field(15, gt=0)
+    stats_added_days: int = Field(30, ge=1)
+
+    # duplicate detection
+    duplicates_process_threshold: int = Field(2000, ge=0)
+    duplicates_max_workers: int = Field(2, ge=1)
+    duplicates_min_score: float = Field(0.5, ge=0, le=1)
+
+    # background jobs
+    purge_enabled: bool = True
+    purge_retention_days: float = Field(30, ge=0)
+    purge_batch_size: int = Field(500, ge=1)
+    purge_pause_seconds: float = Field(0.5, ge=0)
+    purge_interval_seconds: float = Field(600, gt=0)
+    purge_lock_seconds: int = Field(300, gt=0)
+    purge_hours: str = Field("2-5", pattern=r"^(\d{1,2}-\d{1,2})?$")
+    stats_reconcile_enabled: bool = True
+    stats_reconcile_seconds: float = Field(6 * 60 * 60, gt=0)
+    stats_reconcile_batch: int = Field(100, ge=1)
+    stats_reconcile_pause_seconds: float = Field(0.1, ge=0)
+    birthday_digest_enabled: bool = True
+    birthday_digest_days: int = Field(7, ge=1)
+    birthday_digest_hour: int = Field(8, ge=0, le=23)
+    birthday_digest_per_minute: float = Field(60, gt=0)
+    birthday_digest_check_seconds: float = Field(300, gt=0)
+    birthday_digest_lock_seconds: int = Field(300, gt=0)
+    app_base_url: str = "http://localhost:8000/"
+
+    # logging and profiling
+    log_level: str = Field("INFO", pattern=r"^(DEBUG|INFO|WARNING|ERROR|CRITICAL)$")
+    log_queue_size: int = Field(10000, ge=1)
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = Field(0, ge=0, le=1)
+    profiling_refresh_seconds: float = Field(5, ge=0)
+    # sent in X-Debug-Token to use the X-Debug-Profile and X-Debug-Explain headers, unset disables them
+    profiling_debug_token: str | None = None
+    slow_query_ms: float = Field(500, ge=0)
+
+    phone_default_region: str = "UA"
+
+    # mail
+    mail_username: str
+    mail_password: str
+    mail_from: EmailStr
+    mail_port: int = 465
+    mail_server: str
+
+    # cloudinary, only needed to upload avatars
+    cloudinary_name: str | None = None
+    cloudinary_api_key: str | None = None
+    cloudinary_api_secret: str | None = None
+
+    @property
+    def shard_urls(self) -> list[str]:
+        return [url.strip() for url in self.shard_db_urls.split(",") if url.strip()]
+
+
+settings = Settings()
@@ -0,0 +1,75 @@
+"""
+The production server: gunicorn managing uvicorn workers.
+
+    gunicorn -c python:src.conf.gunicorn main:app
+
+The app is imported once in the master (preload) and the workers are forked from it, so they start fast and share
+the memory of the imported code. Each worker runs the lifespan of the app and opens its own database and Redis pools.
+On SIGTERM the workers stop accepting connections, finish the requests in flight for up to WEB_GRACEFUL_TIMEOUT
+seconds, then run the lifespan shutdown, which stops the background jobs and closes the pools.
+The server is configured with the WEB_* and SERVER_* settings, see src/conf/config.py.
+"""
+import os
+import tempfile
+from pathlib import Path
+from uvicorn.workers import UvicornWorker
+from src.conf.config import settings
+
+
+def cpu_count() -> int:
+    """
+    The cpu_count function returns the number of CPUs this process may run on.
+    A container limited by a CPU quota rather than a CPU set still sees every CPU of the host,
+    set WEB_CONCURRENCY there.
+
+    :return: The number of CPUs
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class Worker(UvicornWorker):
+    """
+    The uvicorn worker, with uvloop and httptools when SERVER_LOOP and SERVER_HTTP are auto and they are installed.
+    """
+    CONFIG_KWARGS = {"loop": settings.server_loop, "http": settings.server_http, "lifespan": "on"}
+
+
+bind = settings.web_bind
+workers = settings.web_concurrency or cpu_count()
+worker_class = "src.conf.gunicorn.Worker"
+preload_app = True
+timeout = settings.web_timeout
+graceful_timeout = settings.web_graceful_timeout
+keepalive = settings.web_keepalive
+max_requests = settings.web_max_requests
+max_requests_jitter = settings.web_max_requests // 10
+# uvicorn takes the client address from X-Forwarded-For of these proxies, like src.services.rate_limit.client_ip
+forwarded_allow_ips = settings.forwarded_allow_ips
+
+# must be set before the app, and so prometheus_client, is imported
+if workers > 1 and not settings.prometheus_multiproc_dir:
+    settings.prometheus_multiproc_dir = tempfile.mkdtemp(prefix="prometheus-")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = settings.prometheus_multiproc_dir
+if settings.prometheus_multiproc_dir:
+    # metrics left over by a previous run would be added to the new ones
+    for path in Path(settings.prometheus_multiproc_dir).glob("*.db"):
+        path.unlink()
+
+
+def post_fork(server, worker):
+    # nothing connects while the app is imported, but a connection inherited from the master must never be shared
+    from src.database.db import engine
+    from src.database.shards import shard_router
+
+    engine.dispose(close=False)
+    for factory in shard_router.sessions.values():
+        factory.kw["bind"].dispose(close=False)
+
+
+def child_exit(server, worker):
+    if settings.prometheus_multiproc_dir:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,65 @@
+import redis.asyncio as redis
+from src.conf.config import settings
+from src.services.metrics import instrument_redis_pool
+
+
+_client: redis.Redis | None = None
+
+
+def create_redis() -> redis.Redis:
+    """
+    The create_redis function builds a Redis client on top of a blocking connection pool.
+    When every connection is busy, callers wait up to REDIS_POOL_TIMEOUT seconds for a free one
+    instead of opening more connections than REDIS_MAX_CONNECTIONS.
+
+    :return: A Redis client
+    """
+    pool = redis.BlockingConnectionPool(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        db=0,
+        max_connections=settings.redis_max_connections,
+        timeout=settings.redis_pool_timeout,
+        socket_timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_connect_timeout,
+        health_check_interval=settings.redis_health_check_interval,
+    )
+    instrument_redis_pool(pool)
+    return redis.Redis(connection_pool=pool)
+
+
+async def init_redis() -> redis.Redis:
+    """
+    The init_redis function creates the shared Redis client. It is called once from the app lifespan.
+
+    :return: The shared Redis client
+    """
+    global _client
+    if _client is None:
+        _client = create_redis()
+    return _client
+
+
+async def close_redis() -> None:
+    """
+    The close_redis function closes the shared client and disconnects every connection of its pool.
+
+    :return: None
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose(close_connection_pool=True)
+        _client = None
+
+
+def get_redis() -> redis.Redis:
+    """
+    The get_redis function returns the shared Redis client used by the rate limiter, the auth cache and other caches.
+    Outside the app lifespan, e.g. in scripts, the client is created on first use.
+
+    :return: The shared Redis client
+    """
+    global _client
+    if _client is None:
+        _client = create_redis()
+    return _client
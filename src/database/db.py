@@ -1,13 +1,34 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
-import os
+from src.conf.config import settings
+from src.services.metrics import instrument_engine
+from src.services.profiling import profiler
 
-load_dotenv()
 
+def engine_options(url: str) -> dict:
+    """
+    The engine_options function returns the connection pool settings for an engine.
+    SQLite, used by the tests, keeps the pool SQLAlchemy picks for it.
 
-SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DB_URL")
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    :param url: str: The database URL
+    :return: The keyword arguments of create_engine
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+instrument_engine(engine)
+profiler.instrument_engine(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -1,10 +1,15 @@
 from datetime import date
-from sqlalchemy import Integer, String, Date, DateTime, func, ForeignKey, Boolean
+from sqlalchemy import Integer, String, Date, DateTime, func, ForeignKey, Boolean, Index, Table, Column, \
+    ForeignKeyConstraint, PrimaryKeyConstraint, Sequence, UniqueConstraint, text
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 Base = declarative_base()
 
+LIVE = text("deleted_at IS NULL")
+DELETED = text("deleted_at IS NOT NULL")
+
 
 class User(Base):
     __tablename__ = "users"
@@ -13,7 +18,6 @@ class User(Base):
     email: Mapped[str] = mapped_column(String(150), nullable=False, unique=True)
     password: Mapped[str] = mapped_column(String(255), nullable=False)
     avatar: Mapped[str] = mapped_column(String(255), nullable=True)
-    refresh_token: Mapped[str] = mapped_column(String(255), nullable=True)
     confirmed: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at: Mapped[date] = mapped_column(DateTime, default=func.now())
     updated_at: Mapped[date] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
@@ -21,14 +25,88 @@ class User(Base):
 
 class Contact(Base):
     __tablename__ = "contacts"
-    id: Mapped[int] = mapped_column(primary_key=True)
+    # In Postgres the table is hash-partitioned on user_id and its primary key is (id, user_id),
+    # see the contacts_partitioned migration. The ids still come from one sequence, so they are unique on their own.
+    # With user_id in the identity the ORM puts it into every UPDATE and DELETE, so they touch a single partition.
+    id: Mapped[int] = mapped_column(Integer, Sequence("contacts_id_seq"), primary_key=True)
     first_name: Mapped[str] = mapped_column(String(50), nullable=False)
     last_name: Mapped[str] = mapped_column(String(50), nullable=False)
-    email: Mapped[str] = mapped_column(String(50), nullable=False, unique=True)
+    email: Mapped[str] = mapped_column(String(50), nullable=False)
     phonenumber: Mapped[str] = mapped_column(String(13), nullable=False)
+    phone_e164: Mapped[str] = mapped_column(String(16), nullable=True)
     birthdate: Mapped[date] = mapped_column(Date, nullable=True)
     additional_info: Mapped[str] = mapped_column(String(300), nullable=True, default="No have data")
     created_at: Mapped[date] = mapped_column(DateTime, default=func.now())
     updated_at: Mapped[date] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=True)
-    user: Mapped["User"] = relationship("User", backref="contacts", lazy="joined")
\ No newline at end of file
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), primary_key=True)
+    # Set when the contact is deleted. The row is purged later, see src.services.purge
+    deleted_at: Mapped[date] = mapped_column(DateTime, nullable=True)
+    user: Mapped["User"] = relationship("User", backref="contacts", lazy="joined")
+    # Read-only: tags are assigned through src.repository.tags, which keeps Tag.contact_count in step
+    tags: Mapped[list["Tag"]] = relationship("Tag", secondary="contact_tags", viewonly=True, lazy="selectin",
+                                             order_by="Tag.name")
+
+    # The indexes used by the API only cover live contacts, so deleted rows waiting for the purge
+    # neither slow them down nor block the email of a deleted contact from being reused.
+    __table_args__ = (
+        Index("uq_contacts_user_id_email", "user_id", "email", unique=True, postgresql_where=LIVE, sqlite_where=LIVE),
+        Index("ix_contacts_user_id_updated_at", "user_id", "updated_at", "id",
+              postgresql_where=LIVE, sqlite_where=LIVE),
+        Index("ix_contacts_user_id_phone_e164", "user_id", "phone_e164", postgresql_where=LIVE, sqlite_where=LIVE),
+        Index("ix_contacts_deleted_at", "deleted_at", postgresql_where=DELETED, sqlite_where=DELETED),
+    )
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_contacts_key(constraint, compiler, **kw):
+    # SQLite only numbers an INTEGER PRIMARY KEY of a single column, it has no sequences.
+    # The key (id, user_id) stays unique, as the target of the foreign key of contact_tags.
+    if constraint.table is Contact.__table__:
+        return "PRIMARY KEY (id), UNIQUE (id, user_id)"
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
+
+class ContactTombstone(Base):
+    __tablename__ = "contact_tombstones"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    contact_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    deleted_at: Mapped[date] = mapped_column(DateTime, default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_contact_tombstones_user_id_deleted_at", "user_id", "deleted_at", "id"),
+    )
+
+
+contact_tags = Table(
+    "contact_tags",
+    Base.metadata,
+    Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True),
+    Column("contact_id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    ForeignKeyConstraint(["contact_id", "user_id"], ["contacts.id", "contacts.user_id"], ondelete="CASCADE",
+                         name="fk_contact_tags_contact"),
+    Index("ix_contact_tags_contact_id", "contact_id"),
+)
+
+
+class Tag(Base):
+    __tablename__ = "tags"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    name: Mapped[str] = mapped_column(String(50), nullable=False)
+    contact_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[date] = mapped_column(DateTime, default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "name", name="uq_tags_user_id_name"),
+    )
+
+
+# Per-user aggregates of the live contacts, kept up to date by the write functions of src.repository.contacts
+# and reconciled periodically, see src.repository.counters
+class ContactCounter(Base):
+    __tablename__ = "contact_counters"
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
@@ -0,0 +1,350 @@
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, delete, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+from src.conf.config import settings
+from src.database.cache import get_redis
+from src.database.db import SessionLocal, engine_options, get_db
+from src.database.models import Base, User, contact_tags
+from src.services.auth import auth_service
+from src.services.metrics import instrument_engine
+from src.services.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY_KEY = "shards:directory"
+LOCK_PREFIX = "shards:lock:"
+# Tables whose ids are not scoped by user_id get new ids on the target shard
+RENUMBERED = {"tags", "contact_tombstones"}
+# The columns of the user row kept on the shards: the ones of UserResponse, which the contact responses embed,
+# and confirmed for the birthday digest. The credentials stay in the main database.
+REPLICATED_USER_COLUMNS = ("id", "email", "username", "avatar", "created_at", "confirmed")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    A consistent-hash ring. Each shard owns many points on the ring, and a user belongs to the shard owning
+    the first point after the hash of its id. Adding a shard only moves the users that land on its points.
+    """
+
+    def __init__(self, names: list[str], points: int = 128):
+        self.ring = sorted((_hash(f"{name}#{point}"), name) for name in names for point in range(points))
+        self.keys = [key for key, _ in self.ring]
+
+    def get(self, user_id: int) -> str:
+        """
+        The get function returns the shard a user belongs to.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The id of the user
+        :return: The name of the shard
+        """
+        index = bisect.bisect(self.keys, _hash(str(user_id))) % len(self.ring)
+        return self.ring[index][1]
+
+
+class ShardRouter:
+    """
+    Routes the contacts of each user to one of the databases listed in SHARD_DB_URLS (comma separated),
+    named shard0, shard1, ... in that order. Users, and everything that is not per-user data, stay in the
+    main database. Without SHARD_DB_URLS there is a single shard, the main database.
+
+    The shard of a user comes from the hash ring unless the directory, a Redis hash, overrides it.
+    The directory holds the users moved with the move command. Lookups are cached in-process for
+    SHARD_CACHE_SECONDS, so most requests do not ask Redis.
+    While a user is being moved, their data is locked: reads go on, writes get 503.
+    """
+
+    def __init__(self, urls: list[str], cache_seconds: float = 5):
+        self.names = [f"shard{index}" for index in range(len(urls))]
+        self.sessions: dict[str, sessionmaker] = {}
+        for name, url in zip(self.names, urls):
+            engine = create_engine(url, **(engine_options(url) | {"pool_pre_ping": True}))
+            instrument_engine(engine)
+            profiler.instrument_engine(engine)
+            self.sessions[name] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.ring = HashRing(self.names) if self.names else None
+        self.cache_seconds = cache_seconds
+        self._cache: dict[int, tuple[float, str, bool]] = {}
+        self._replicated: dict[tuple[str, int], dict] = {}
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self.names)
+
+    async def locate(self, user_id: int) -> tuple[str, bool]:
+        """
+        The locate function returns the shard of a user and whether the user is being moved.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The id of the user
+        :return: The name of the shard and the lock flag
+        """
+        cached = self._cache.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1], cached[2]
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.hget(DIRECTORY_KEY, str(user_id))
+            pipe.exists(LOCK_PREFIX + str(user_id))
+            override, locked = await pipe.execute()
+        name = override.decode() if isinstance(override, bytes) else override
+        if name not in self.sessions:
+            name = self.ring.get(user_id)
+        if len(self._cache) > 100000:
+            self._cache.clear()
+        self._cache[user_id] = (time.monotonic() + self.cache_seconds, name, bool(locked))
+        return name, bool(locked)
+
+    def dispose(self) -> None:
+        """
+        The dispose function closes the connections of every shard. It is called when the app shuts down.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        for factory in self.sessions.values():
+            factory.kw["bind"].dispose()
+
+    def replicate_user(self, name: str, db: Session, user: User) -> None:
+        """
+        The replicate_user function copies the replicated columns of the user row to the shard, where the contacts
+        reference it. Each process writes them again when they differ from what it wrote last,
+        e.g. after the user confirmed their email.
+
+        :param self: Represent the instance of the class
+        :param name: str: The name of the shard
+        :param db: Session: A session of the shard
+        :param user: User: The user
+        :return: None
+        """
+        values = user_replica(user)
+        if self._replicated.get((name, user.id)) == values:
+            return
+        try:
+            write_user_replica(values, db)
+            db.commit()
+        except IntegrityError:
+            # another process inserted the row first
+            db.rollback()
+            write_user_replica(values, db)
+            db.commit()
+        self._replicated[(name, user.id)] = values
+
+
+def user_replica(user: User) -> dict:
+    """
+    The user_replica function returns the columns of a user row that are kept on the shards.
+
+    :param user: User: The user
+    :return: The values of REPLICATED_USER_COLUMNS
+    """
+    return {column: getattr(user, column) for column in REPLICATED_USER_COLUMNS}
+
+
+def write_user_replica(values: dict, db: Session) -> None:
+    """
+    The write_user_replica function inserts or updates the user row on a shard. The password is never copied,
+    and is cleared from rows replicated in full before. It does not commit.
+
+    :param values: dict: The replicated columns, see user_replica
+    :param db: Session: A session of the shard
+    :return: None
+    """
+    stmt = update(User).where(User.id == values["id"]).values(**values, password="")
+    if not db.execute(stmt).rowcount:
+        db.execute(insert(User).values(**values, password=""))
+
+
+shard_router = ShardRouter(settings.shard_urls, cache_seconds=settings.shard_cache_seconds)
+
+
+def contact_databases() -> list[sessionmaker]:
+    """
+    The contact_databases function returns the session factories of the databases holding contacts,
+    for the jobs that go over all of them.
+
+    :return: The shards, or the main database when there are none
+    """
+    return list(shard_router.sessions.values()) if shard_router.sharded else [SessionLocal]
+
+
+async def get_shard_db(request: Request, user: User = Depends(auth_service.get_current_user),
+                       db: Session = Depends(get_db)):
+    """
+    The get_shard_db function is the dependency that opens a session on the shard of the current user.
+    Without sharding it is the session of the main database.
+
+    :param request: Request: The incoming request, writes are refused while the user is being moved
+    :param user: User: Get the current user from the authentication service
+    :param db: Session: The session of the main database
+    :return: A session of the shard of the user
+    """
+    if not shard_router.sharded:
+        yield db
+        return
+    name, locked = await shard_router.locate(user.id)
+    if locked and request.method not in ("GET", "HEAD", "OPTIONS"):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Contacts are being moved, retry shortly", headers={"Retry-After": "5"})
+    shard_db = shard_router.sessions[name]()
+    try:
+        await run_in_threadpool(shard_router.replicate_user, name, shard_db, user)
+        yield shard_db
+    finally:
+        shard_db.close()
+
+
+def _user_tables():
+    return [table for table in Base.metadata.sorted_tables if table.name != "users" and "user_id" in table.c]
+
+
+def copy_user_data(user_id: int, source: Session, target: Session) -> dict[str, int]:
+    """
+    The copy_user_data function copies every row of a user from one shard to another, replacing
+    whatever the target held for the user. Contacts keep their ids; tags and tombstones get new ones.
+    It does not commit.
+
+    :param user_id: int: The id of the user
+    :param source: Session: A session of the shard the data is on
+    :param target: Session: A session of the shard the data goes to
+    :return: The number of rows copied per table
+    """
+    tables = _user_tables()
+    for table in reversed(tables):
+        target.execute(delete(table).where(table.c.user_id == user_id))
+    write_user_replica(user_replica(source.get(User, user_id)), target)
+    copied, tag_ids = {}, {}
+    for table in tables:
+        rows = source.execute(select(table).where(table.c.user_id == user_id)
+                              .order_by(*table.primary_key.columns)).mappings().all()
+        copied[table.name] = len(rows)
+        if table.name == "tags":
+            for row in rows:
+                values = {key: value for key, value in row.items() if key != "id"}
+                tag_ids[row["id"]] = target.execute(insert(table).values(**values).returning(table.c.id)).scalar_one()
+            continue
+        values = [dict(row) for row in rows]
+        if table is contact_tags:
+            for row in values:
+                row["tag_id"] = tag_ids[row["tag_id"]]
+        if table.name in RENUMBERED:
+            for row in values:
+                del row["id"]
+        if values:
+            target.execute(insert(table), values)
+    if target.get_bind().dialect.name == "postgresql":
+        # moved contact ids must not be handed out again by the sequence of the target
+        target.execute(text("SELECT setval(pg_get_serial_sequence('contacts', 'id'), "
+                            "GREATEST((SELECT COALESCE(MAX(id), 1) FROM contacts), "
+                            "nextval(pg_get_serial_sequence('contacts', 'id'))))"))
+    return copied
+
+
+def delete_user_data(user_id: int, db: Session) -> None:
+    """
+    The delete_user_data function deletes every row of a user from a shard, except the user row. It does not commit.
+
+    :param user_id: int: The id of the user
+    :param db: Session: A session of the shard
+    :return: None
+    """
+    for table in reversed(_user_tables()):
+        db.execute(delete(table).where(table.c.user_id == user_id))
+
+
+async def move_user(user_id: int, target: str, router: ShardRouter = shard_router, lock_seconds: int = 600) -> dict:
+    """
+    The move_user function moves the data of a user to another shard while the API keeps running.
+
+    1. The user is locked. After one cache period every process refuses their writes.
+    2. The data is copied to the target in one transaction.
+    3. The directory points the user to the target. Reads keep going to the source, whose data is still there,
+       until the caches of all processes expire.
+    4. The data is deleted from the source and the lock is released.
+
+    :param user_id: int: The id of the user
+    :param target: str: The name of the target shard
+    :param router: ShardRouter: The router of the configured shards
+    :param lock_seconds: int: How long the lock is held at most if the move dies half way
+    :return: The number of rows copied per table
+    """
+    if target not in router.sessions:
+        raise ValueError(f"Unknown shard {target}, configured: {', '.join(router.names)}")
+    r = get_redis()
+    router._cache.pop(user_id, None)
+    source, _ = await router.locate(user_id)
+    if source == target:
+        return {}
+    if not await r.set(LOCK_PREFIX + str(user_id), target, nx=True, ex=lock_seconds):
+        raise RuntimeError(f"User {user_id} is already being moved")
+    try:
+        await asyncio.sleep(router.cache_seconds + 1)
+        with router.sessions[source]() as source_db, router.sessions[target]() as target_db:
+            copied = await run_in_threadpool(copy_user_data, user_id, source_db, target_db)
+            await run_in_threadpool(target_db.commit)
+            if router.ring.get(user_id) == target:
+                await r.hdel(DIRECTORY_KEY, str(user_id))
+            else:
+                await r.hset(DIRECTORY_KEY, str(user_id), target)
+            await asyncio.sleep(router.cache_seconds + 1)
+            await run_in_threadpool(delete_user_data, user_id, source_db)
+            await run_in_threadpool(source_db.commit)
+    finally:
+        await r.delete(LOCK_PREFIX + str(user_id))
+    logger.info("User moved", extra={"user_id": user_id, "source": source, "target": target, "rows": copied})
+    return copied
+
+
+async def pin_users(router: ShardRouter = shard_router) -> int:
+    """
+    The pin_users function writes the current shard of every user into the directory.
+    Run it before adding a shard to SHARD_DB_URLS: the ring changes for some users, and the pins keep them
+    on the shard their data is on until they are moved.
+
+    :param router: ShardRouter: The router of the currently configured shards
+    :return: The number of users pinned
+    """
+    with SessionLocal() as db:
+        user_ids = db.execute(select(User.id)).scalars().all()
+    r = get_redis()
+    pinned = 0
+    for user_id in user_ids:
+        name, _ = await router.locate(user_id)
+        await r.hset(DIRECTORY_KEY, str(user_id), name)
+        pinned += 1
+    return pinned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and move users between shards.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    where = commands.add_parser("where", help="print the shard of a user")
+    where.add_argument("user_id", type=int)
+    move = commands.add_parser("move", help="move the contacts of a user to another shard")
+    move.add_argument("user_id", type=int)
+    move.add_argument("target")
+    commands.add_parser("pin-all", help="pin every user to its current shard before adding a shard")
+    args = parser.parse_args()
+    if not shard_router.sharded:
+        parser.error("SHARD_DB_URLS is not set")
+    if args.command == "where":
+        print(asyncio.run(shard_router.locate(args.user_id))[0])
+    elif args.command == "move":
+        print(asyncio.run(move_user(args.user_id, args.target)))
+    else:
+        print(f"{asyncio.run(pin_users())} users pinned")
+
+
+if __name__ == "__main__":
+    main()
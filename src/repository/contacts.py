@@ -1,11 +1,26 @@
+import base64
+import calendar
+from datetime import date, datetime, timedelta
 from pydantic import EmailStr
-from sqlalchemy import select
+from sqlalchemy import select, delete, extract, func, tuple_, type_coerce, String
 from sqlalchemy.orm import Session
-from src.database.models import Contact, User
+from src.conf.config import settings
+from src.database.models import Contact, ContactTombstone, Tag, User, contact_tags
+from src.repository import counters
+from src.repository import tags as repository_tags
 from src.schemas import ContactSchema, ContactUpdate
+from src.services.events import contact_events
+from src.services.phone import to_e164
+from src.services.duplicates import ContactRow
 
+# Rows newer than this are left for the next sync. now() is the start time of the writing transaction,
+# so a row can become visible after rows with a later updated_at. The lag gives such transactions time to commit.
+SYNC_LAG_SECONDS = settings.sync_lag_seconds
+# tombstones are purged along with the contacts, a sync token older than that has missed deletions
+TOMBSTONE_RETENTION = timedelta(days=settings.purge_retention_days)
 
-def get_contacts(limit: int, offset: int, db: Session, user: User, first_name: str = None, last_name: str = None, email: EmailStr = None):
+
+def get_contacts(limit: int, offset: int, db: Session, user: User, first_name: str = None, last_name: str = None, email: EmailStr = None, tag: str = None):
     """
     The get_contacts function retrieves a list of contacts for a specific user, with optional filtering
     by first name, last name, and email. The result is limited and offset based on the provided parameters.
@@ -17,15 +32,20 @@ def get_contacts(limit: int, offset: int, db: Session, user: User, first_name: s
     :param first_name: str: Optional filter for the contact's first name
     :param last_name: str: Optional filter for the contact's last name
     :param email: EmailStr: Optional filter for the contact's email
+    :param tag: str: Optional filter for a tag the contact carries
     :return: A list of Contact objects
     """
-    stmt = select(Contact).filter_by(user=user).offset(offset).limit(limit)
+    stmt = select(Contact).where(Contact.user_id == user.id, Contact.deleted_at.is_(None)).offset(offset).limit(limit)
     if first_name:
         stmt = stmt.filter(Contact.first_name.like(f'%{first_name}%'))
     if last_name:
         stmt = stmt.filter(Contact.last_name.like(f'%{last_name}%'))
     if email:
         stmt = stmt.filter(Contact.email.like(f'%{email}%'))
+    if tag:
+        stmt = stmt.join(contact_tags, contact_tags.c.contact_id == Contact.id)\
+            .join(Tag, Tag.id == contact_tags.c.tag_id)\
+            .filter(Tag.user_id == user.id, Tag.name == repository_tags.normalize_tag(tag))
     contacts = db.execute(stmt)
     return contacts.scalars().all()
 
@@ -39,7 +59,7 @@ def get_contact(contact_id: int, db: Session, user: User):
     :param user: User: Identify the user whose contact is to be retrieved
     :return: The Contact object if found, otherwise None
     """
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
+    stmt = select(Contact).where(Contact.id == contact_id, Contact.user_id == user.id, Contact.deleted_at.is_(None))
     contact = db.execute(stmt)
     return contact.scalar_one_or_none()
 
@@ -53,10 +73,13 @@ def create_contact(body: ContactSchema, db: Session, user: User):
     :param user: User: Identify the user to whom the new contact will belong
     :return: The newly created Contact object
     """
-    contact = Contact(**body.model_dump(exclude_unset=True), user=user)
+    contact = Contact(**body.model_dump(exclude_unset=True), phone_e164=to_e164(body.phonenumber), user=user)
     db.add(contact)
+    db.flush()
+    counters.count_contact(contact, 1, db)
     db.commit()
     db.refresh(contact)
+    contact_events.publish(user.id, "created", contact.id)
     return contact
 
 
@@ -70,38 +93,195 @@ def update_contact(contact_id: int, body: ContactUpdate, db: Session, user: User
     :param user: User: Identify the user whose contact is to be updated
     :return: The updated Contact object if found, otherwise None
     """
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
+    stmt = select(Contact).where(Contact.id == contact_id, Contact.user_id == user.id, Contact.deleted_at.is_(None))
     result = db.execute(stmt)
     contact: Contact = result.scalar_one_or_none()
     if contact:
+        before = counters.contact_keys(contact)
         contact.first_name = body.first_name
         contact.last_name = body.last_name
         contact.email = body.email
         contact.phonenumber = body.phonenumber
+        contact.phone_e164 = to_e164(body.phonenumber)
         contact.birthdate = body.birthdate
         contact.additional_info = body.additional_info
+        counters.recount_contact(before, contact, db)
         db.commit()
         db.refresh(contact)
+        contact_events.publish(user.id, "updated", contact.id)
     return contact
 
 
 
+def lookup_by_phone(phone_e164: str, db: Session, user: User):
+    """
+    The lookup_by_phone function finds the contacts of a user with the given phone number,
+    using the (user_id, phone_e164) index.
+
+    :param phone_e164: str: The phone number in E.164 format
+    :param db: Session: Provide the database session
+    :param user: User: Identify the user whose contacts are searched
+    :return: A list of Contact objects with the phone number
+    """
+    stmt = select(Contact).where(Contact.user_id == user.id, Contact.phone_e164 == phone_e164,
+                                 Contact.deleted_at.is_(None))
+    return db.execute(stmt).scalars().all()
+
+
+def get_contact_rows(db: Session, user: User) -> list[ContactRow]:
+    """
+    The get_contact_rows function loads the fields used for duplicate detection of all contacts of a user.
+    Only the needed columns are selected, no ORM objects are built.
+
+    :param db: Session: Provide the database session
+    :param user: User: Identify the user whose contacts are loaded
+    :return: A list of ContactRow tuples
+    """
+    stmt = select(Contact.id, Contact.first_name, Contact.last_name, Contact.email, Contact.phone_e164,
+                  Contact.birthdate).where(Contact.user_id == user.id, Contact.deleted_at.is_(None))
+    return [ContactRow(*row) for row in db.execute(stmt)]
+
+
+NO_INFO = Contact.__table__.c.additional_info.default.arg
+
+
+def merge_contacts(keep_id: int, merge_ids: list[int], db: Session, user: User):
+    """
+    The merge_contacts function merges duplicates into one contact. Fields missing on the kept contact are taken
+    from the merged ones and notes and tags are combined. The merged contacts are removed for good rather than
+    marked deleted, so restore_contact cannot bring back a contact whose data lives on in the kept one.
+
+    :param keep_id: int: The ID of the contact to keep
+    :param merge_ids: list[int]: The IDs of the contacts merged into it
+    :param db: Session: Provide the database session
+    :param user: User: Identify the user whose contacts are merged
+    :return: The kept Contact object, or None if any of the contacts was not found
+    """
+    # a contact listed twice would be counted and tombstoned twice
+    merge_ids = list(dict.fromkeys(merge_ids))
+    ids = [keep_id, *merge_ids]
+    stmt = select(Contact).where(Contact.user_id == user.id, Contact.id.in_(ids), Contact.deleted_at.is_(None))
+    found = {contact.id: contact for contact in db.execute(stmt).unique().scalars()}
+    if len(found) != len(set(ids)):
+        return None
+    keep = found[keep_id]
+    before = counters.contact_keys(keep)
+    merged = [found[contact_id] for contact_id in merge_ids]
+    repository_tags.add_tags(keep_id, repository_tags.get_tag_ids(merge_ids, db), db, user)
+    repository_tags.untag_contacts(merge_ids, db)
+    for contact in merged:
+        keep.birthdate = keep.birthdate or contact.birthdate
+        if not keep.phone_e164 and contact.phone_e164:
+            # phone_e164 is derived from phonenumber, they are taken together
+            keep.phonenumber, keep.phone_e164 = contact.phonenumber, contact.phone_e164
+        notes = [line for note in (keep.additional_info, contact.additional_info) if note and note != NO_INFO
+                 for line in note.splitlines()]
+        keep.additional_info = "\n".join(dict.fromkeys(notes))[:300] or keep.additional_info
+        counters.count_contact(contact, -1, db)
+        db.delete(contact)
+        db.add(ContactTombstone(contact_id=contact.id, user_id=user.id))
+    counters.recount_contact(before, keep, db)
+    db.commit()
+    db.refresh(keep)
+    contact_events.publish(user.id, "updated", keep.id)
+    for contact in merged:
+        contact_events.publish(user.id, "deleted", contact.id)
+    return keep
+
+
 def delete_contact(contact_id: int, db: Session, user: User):
     """
     The delete_contact function deletes an existing contact for a given user.
+    The contact is only marked as deleted, which costs the same whatever the size of the table. It keeps its tags
+    and can be restored with restore_contact until the purge removes it, see src.services.purge.
 
     :param contact_id: int: The ID of the contact to be deleted
     :param db: Session: Provide the database session
     :param user: User: Identify the user whose contact is to be deleted
     :return: The deleted Contact object if found, otherwise None
     """
-    stmt = select(Contact).filter_by(id=contact_id, user = user)
+    # The tombstone is written in the same transaction, so sync clients learn about the deletion
+    stmt = select(Contact).where(Contact.id == contact_id, Contact.user_id == user.id, Contact.deleted_at.is_(None))
     contact = db.execute(stmt).scalar_one_or_none()
     if contact:
-        db.delete(contact)
+        repository_tags.recount_tags([contact.id], -1, db)
+        counters.count_contact(contact, -1, db)
+        contact.deleted_at = func.now()
+        db.add(ContactTombstone(contact_id=contact.id, user_id=user.id))
         db.commit()
+        contact_events.publish(user.id, "deleted", contact.id)
     return contact
 
+
+def restore_contact(contact_id: int, db: Session, user: User):
+    """
+    The restore_contact function undoes delete_contact, as long as the contact has not been purged.
+    The contact counts as changed, so sync clients that saw it deleted get it back.
+    It raises IntegrityError if a live contact has taken the email in the meantime.
+
+    :param contact_id: int: The ID of the deleted contact
+    :param db: Session: Provide the database session
+    :param user: User: Identify the user whose contact is restored
+    :return: The restored Contact object if found, otherwise None
+    """
+    stmt = select(Contact).where(Contact.id == contact_id, Contact.user_id == user.id, Contact.deleted_at.is_not(None))
+    contact = db.execute(stmt).scalar_one_or_none()
+    if contact:
+        contact.deleted_at = None
+        contact.updated_at = func.now()
+        db.execute(delete(ContactTombstone).where(ContactTombstone.user_id == user.id,
+                                                  ContactTombstone.contact_id == contact_id))
+        db.flush()
+        repository_tags.recount_tags([contact.id], 1, db)
+        counters.count_contact(contact, 1, db)
+        db.commit()
+        db.refresh(contact)
+        contact_events.publish(user.id, "created", contact.id)
+    return contact
+
+
+def purge_deleted(before: datetime, limit: int, db: Session) -> int:
+    """
+    The purge_deleted function removes up to limit contacts deleted before the given time, oldest first,
+    and commits. Called repeatedly, it purges in small transactions that hold few locks and leave
+    vacuum a little work at a time.
+
+    :param before: datetime: Contacts deleted before this time are purged
+    :param limit: int: The maximum number of contacts removed
+    :param db: Session: Provide the database session
+    :return: The number of contacts removed
+    """
+    stmt = select(Contact.id, Contact.user_id).where(Contact.deleted_at < before)\
+        .order_by(Contact.deleted_at).limit(limit)
+    keys = [tuple(row) for row in db.execute(stmt)]
+    if not keys:
+        return 0
+    # the tag counts were decremented when the contacts were deleted
+    db.execute(delete(contact_tags).where(tuple_(contact_tags.c.contact_id, contact_tags.c.user_id).in_(keys)))
+    db.execute(delete(Contact).where(tuple_(Contact.id, Contact.user_id).in_(keys)))
+    db.commit()
+    return len(keys)
+
+
+def purge_tombstones(before: datetime, limit: int, db: Session) -> int:
+    """
+    The purge_tombstones function removes up to limit tombstones written before the given time, and commits.
+    Tombstones are written in id order, so the oldest are found by walking the primary key.
+
+    :param before: datetime: Tombstones written before this time are purged
+    :param limit: int: The maximum number of tombstones removed
+    :param db: Session: Provide the database session
+    :return: The number of tombstones removed
+    """
+    stmt = select(ContactTombstone.id).where(ContactTombstone.deleted_at < before)\
+        .order_by(ContactTombstone.id).limit(limit)
+    ids = db.execute(stmt).scalars().all()
+    if not ids:
+        return 0
+    db.execute(delete(ContactTombstone).where(ContactTombstone.id.in_(ids)))
+    db.commit()
+    return len(ids)
+
 # def search_contacts(db: Session, search_query: str):
 
 #     stmt = select(Contact).where(
@@ -122,7 +302,7 @@ def search_contacts(db: Session, user: User, search_query: str):
     :param search_query: str: The search query to filter contacts
     :return: A list of Contact objects matching the search query
     """
-    stmt = select(Contact).filter_by(user=user)
+    stmt = select(Contact).where(Contact.user_id == user.id, Contact.deleted_at.is_(None))
     if search_query:
         stmt = stmt.filter(
             (Contact.first_name.ilike(f'%{search_query}%')) |
@@ -132,3 +312,154 @@ def search_contacts(db: Session, user: User, search_query: str):
     
     result = db.execute(stmt)
     return result.scalars().all()
+
+
+def encode_sync_token(contacts_cursor: tuple[datetime, int], tombstones_cursor: tuple[datetime, int]) -> str:
+    """
+    The encode_sync_token function packs the positions reached in the contacts and the tombstones into an opaque token.
+
+    :param contacts_cursor: tuple[datetime, int]: updated_at and id of the last contact sent
+    :param tombstones_cursor: tuple[datetime, int]: deleted_at and id of the last tombstone sent
+    :return: The sync token
+    """
+    raw = "|".join(f"{moment.isoformat()}|{row_id}" for moment, row_id in (contacts_cursor, tombstones_cursor))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_sync_token(token: str) -> tuple[tuple[datetime, int], tuple[datetime, int]]:
+    """
+    The decode_sync_token function unpacks a token created by encode_sync_token.
+    It raises ValueError if the token is malformed.
+
+    :param token: str: The sync token
+    :return: The contacts cursor and the tombstones cursor
+    """
+    try:
+        contacts_at, contacts_id, tombstones_at, tombstones_id = base64.urlsafe_b64decode(token.encode()).decode().split("|")
+        return ((datetime.fromisoformat(contacts_at), int(contacts_id)),
+                (datetime.fromisoformat(tombstones_at), int(tombstones_id)))
+    except (ValueError, UnicodeDecodeError) as err:
+        raise ValueError("Invalid sync token") from err
+
+
+def _position(cursor: tuple[datetime, int], db: Session):
+    moment, row_id = cursor
+    # SQLite compares timestamps as text, and func.now() stores them without the .000000 that a bound datetime gets
+    if db.get_bind().dialect.name == "sqlite" and not moment.microsecond:
+        return tuple_(type_coerce(moment.isoformat(" "), String), row_id)
+    return tuple_(moment, row_id)
+
+
+def get_changes(since: str | None, limit: int, db: Session, user: User):
+    """
+    The get_changes function returns the contacts created or updated and the ids of the contacts deleted
+    after the position stored in the sync token. Both feeds are read in (timestamp, id) order through the
+    (user_id, updated_at, id) and (user_id, deleted_at, id) indexes, so the cost depends on the number of changes,
+    not on the size of the address book. Without a token every contact is returned and no tombstones.
+    Tombstones are kept for PURGE_RETENTION_DAYS, so a token that has not been used for longer may have missed
+    deletions, and the client has to sync again from scratch.
+
+    :param since: str | None: The token returned by the previous call
+    :param limit: int: The maximum number of contacts and of deleted ids returned
+    :param db: Session: Provide the database session
+    :param user: User: Identify the user whose changes are returned
+    :return: A dictionary with contacts, deleted, next (the token for the next call) and has_more,
+        or None if the token is older than the tombstones kept
+    """
+    # the columns hold naive timestamps, Postgres returns now() with the session time zone
+    now = db.scalar(select(func.now())).replace(tzinfo=None)
+    cutoff = now - timedelta(seconds=SYNC_LAG_SECONDS)
+    if since:
+        contacts_cursor, tombstones_cursor = decode_sync_token(since)
+        if tombstones_cursor[0].replace(tzinfo=None) < now - TOMBSTONE_RETENTION:
+            return None
+    else:
+        contacts_cursor, tombstones_cursor = (datetime.min, 0), (cutoff, 0)
+
+    stmt = select(Contact).where(
+        Contact.user_id == user.id,
+        Contact.deleted_at.is_(None),
+        tuple_(Contact.updated_at, Contact.id) > _position(contacts_cursor, db),
+        Contact.updated_at <= cutoff,
+    ).order_by(Contact.updated_at, Contact.id).limit(limit + 1)
+    changed = db.execute(stmt).scalars().all()
+
+    stmt = select(ContactTombstone).where(
+        ContactTombstone.user_id == user.id,
+        tuple_(ContactTombstone.deleted_at, ContactTombstone.id) > _position(tombstones_cursor, db),
+        ContactTombstone.deleted_at <= cutoff,
+    ).order_by(ContactTombstone.deleted_at, ContactTombstone.id).limit(limit + 1)
+    deleted = db.execute(stmt).scalars().all()
+
+    drained = len(deleted) <= limit
+    has_more = len(changed) > limit or not drained
+    changed, deleted = changed[:limit], deleted[:limit]
+    if changed:
+        contacts_cursor = (changed[-1].updated_at, changed[-1].id)
+    if deleted:
+        tombstones_cursor = (deleted[-1].deleted_at, deleted[-1].id)
+    if drained:
+        # every tombstone up to the cutoff has been sent, so the token stays fresh while nothing is deleted
+        tombstones_cursor = max((tombstones_cursor[0].replace(tzinfo=None), tombstones_cursor[1]), (cutoff, 0))
+    return {
+        "contacts": changed,
+        "deleted": [tombstone.contact_id for tombstone in deleted],
+        "next": encode_sync_token(contacts_cursor, tombstones_cursor),
+        "has_more": has_more,
+    }
+
+
+def birthday_window(start: date, days: int):
+    """
+    The birthday_window function returns the condition matching contacts whose birthday falls between start
+    and start + days, both included, whatever the year they were born. It is a plain list of (month, day) pairs,
+    so windows over the end of a month or of the year need no special case.
+    In years without February 29, those born on it are matched on February 28.
+
+    :param start: date: The first day of the window
+    :param days: int: The number of days after start
+    :return: A SQL condition on Contact.birthdate
+    """
+    pairs = set()
+    for offset in range(days + 1):
+        day = start + timedelta(days=offset)
+        pairs.add((day.month, day.day))
+        if day.month == 2 and day.day == 28 and not calendar.isleap(day.year):
+            pairs.add((2, 29))
+    return tuple_(extract("month", Contact.birthdate), extract("day", Contact.birthdate)).in_(sorted(pairs))
+
+
+def next_birthday(birthdate: date, today: date) -> date:
+    """
+    The next_birthday function returns the date of the next birthday, today included.
+
+    :param birthdate: date: The date of birth
+    :param today: date: The day to count from
+    :return: The date of the next birthday
+    """
+    for year in (today.year, today.year + 1):
+        day = birthdate.day if birthdate.month != 2 or birthdate.day != 29 or calendar.isleap(year) else 28
+        birthday = date(year, birthdate.month, day)
+        if birthday >= today:
+            return birthday
+
+
+def get_upcoming_birthdays(start: date, days: int, db: Session, batch_size: int = 1000):
+    """
+    The get_upcoming_birthdays function streams the contacts of all confirmed users whose birthday is within
+    the window of birthday_window, ordered by user. It is a single query, read from the server batch_size rows
+    at a time, instead of one query per user.
+
+    :param start: date: The first day of the window
+    :param days: int: The number of days after start
+    :param db: Session: Provide the database session
+    :param batch_size: int: The number of rows fetched at a time
+    :return: An iterator of rows with user_id, email, username, first_name, last_name and birthdate
+    """
+    stmt = select(User.id.label("user_id"), User.email, User.username, Contact.first_name, Contact.last_name,
+                  Contact.birthdate)\
+        .join(User, User.id == Contact.user_id)\
+        .where(Contact.deleted_at.is_(None), User.confirmed.is_(True), birthday_window(start, days))\
+        .order_by(Contact.user_id)\
+        .execution_options(yield_per=batch_size)
+    yield from db.execute(stmt)
@@ -0,0 +1,154 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, delete, func, extract, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from src.conf.config import settings
+from src.database.models import Contact, ContactCounter, User
+
+TOTAL = "total"
+BIRTH_MONTH = "birth_month:"
+ADDED = "added:"
+# Days of added:<date> counters kept, the longest "recently added" period served
+ADDED_DAYS = settings.stats_added_days
+
+
+def contact_keys(contact: Contact) -> list[str]:
+    """
+    The contact_keys function returns the names of the counters a contact is counted in.
+
+    :param contact: Contact: A live contact
+    :return: A list of counter names
+    """
+    keys = [TOTAL]
+    if contact.birthdate:
+        keys.append(f"{BIRTH_MONTH}{contact.birthdate.month:02d}")
+    if contact.created_at and contact.created_at.date() >= date.today() - timedelta(days=ADDED_DAYS):
+        keys.append(f"{ADDED}{contact.created_at.date().isoformat()}")
+    return keys
+
+
+def adjust_counters(user_id: int, deltas: Counter, db: Session) -> None:
+    """
+    The adjust_counters function adds the deltas to the counters of a user in a single upsert. It does not commit.
+    Called in the transaction of the write, the counters change together with the contacts.
+
+    :param user_id: int: The id of the user
+    :param deltas: Counter: The change of each counter
+    :param db: Session: Provide the database session
+    :return: None
+    """
+    # sorted, so concurrent writes lock the counter rows in the same order
+    rows = [{"user_id": user_id, "name": name, "value": delta} for name, delta in sorted(deltas.items()) if delta]
+    if not rows:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(ContactCounter).values(rows)
+    stmt = stmt.on_conflict_do_update(index_elements=[ContactCounter.user_id, ContactCounter.name],
+                                      set_={"value": ContactCounter.value + stmt.excluded.value})
+    db.execute(stmt)
+
+
+def count_contact(contact: Contact, delta: int, db: Session) -> None:
+    """
+    The count_contact function adds delta to every counter a contact is counted in: 1 when it is created or
+    restored, -1 when it is deleted. It does not commit.
+
+    :param contact: Contact: The contact
+    :param delta: int: 1 or -1
+    :param db: Session: Provide the database session
+    :return: None
+    """
+    adjust_counters(contact.user_id, Counter({key: delta for key in contact_keys(contact)}), db)
+
+
+def recount_contact(before: list[str], contact: Contact, db: Session) -> None:
+    """
+    The recount_contact function moves an updated contact from the counters it was counted in to the ones
+    it belongs to now, e.g. when its birthdate changes. It does not commit.
+
+    :param before: list[str]: The result of contact_keys before the update
+    :param contact: Contact: The updated contact
+    :param db: Session: Provide the database session
+    :return: None
+    """
+    deltas = Counter(contact_keys(contact))
+    deltas.subtract(before)
+    adjust_counters(contact.user_id, deltas, db)
+
+
+def get_stats(db: Session, user: User) -> dict:
+    """
+    The get_stats function reads the statistics of a user's contacts from the counters, without touching the contacts.
+
+    :param db: Session: Provide the database session
+    :param user: User: Identify the user whose statistics are returned
+    :return: A dictionary shaped like ContactStats
+    """
+    values = dict(db.execute(select(ContactCounter.name, ContactCounter.value)
+                             .where(ContactCounter.user_id == user.id)).all())
+    today = date.today()
+
+    def added(days: int) -> int:
+        return sum(values.get(f"{ADDED}{(today - timedelta(days=day)).isoformat()}", 0) for day in range(days))
+
+    birth_months = [values.get(f"{BIRTH_MONTH}{month:02d}", 0) for month in range(1, 13)]
+    total = values.get(TOTAL, 0)
+    return {
+        "total": total,
+        "birth_months": birth_months,
+        "without_birthdate": total - sum(birth_months),
+        "added_last_7_days": added(7),
+        "added_last_30_days": added(30),
+    }
+
+
+def compute_counters(user_id: int, db: Session) -> Counter:
+    """
+    The compute_counters function counts the live contacts of a user from scratch with two grouped COUNT(*) queries.
+
+    :param user_id: int: The id of the user
+    :param db: Session: Provide the database session
+    :return: The value of every counter
+    """
+    live = (Contact.user_id == user_id, Contact.deleted_at.is_(None))
+    counters = Counter()
+    month = extract("month", Contact.birthdate)
+    for birth_month, count in db.execute(select(month, func.count()).where(*live).group_by(month)):
+        counters[TOTAL] += count
+        if birth_month is not None:
+            counters[f"{BIRTH_MONTH}{int(birth_month):02d}"] = count
+    since = datetime.combine(date.today() - timedelta(days=ADDED_DAYS), datetime.min.time())
+    day = func.date(Contact.created_at)
+    for added_on, count in db.execute(select(day, func.count()).where(*live, Contact.created_at >= since).group_by(day)):
+        added_on = added_on if isinstance(added_on, str) else added_on.isoformat()
+        counters[f"{ADDED}{added_on}"] = count
+    return counters
+
+
+def reconcile_counters(user_id: int, db: Session) -> int:
+    """
+    The reconcile_counters function replaces the counters of a user with the values of compute_counters, and commits.
+    It also drops the added:<date> counters older than STATS_ADDED_DAYS.
+    The counter rows are locked first, so writes of the user wait for the transaction instead of being lost.
+
+    :param user_id: int: The id of the user
+    :param db: Session: Provide the database session
+    :return: The number of counters that were off
+    """
+    stored = dict(db.execute(select(ContactCounter.name, ContactCounter.value)
+                             .where(ContactCounter.user_id == user_id)
+                             .order_by(ContactCounter.name).with_for_update()).all())
+    actual = compute_counters(user_id, db)
+    oldest = f"{ADDED}{(date.today() - timedelta(days=ADDED_DAYS)).isoformat()}"
+    stale = {name for name in stored if name.startswith(ADDED) and name < oldest}
+    if stale:
+        db.execute(delete(ContactCounter).where(ContactCounter.user_id == user_id, ContactCounter.name.in_(stale)))
+    changed = {name: actual[name] for name in stored.keys() - stale if stored[name] != actual[name]}
+    for name, value in sorted(changed.items()):
+        db.execute(update(ContactCounter).where(ContactCounter.user_id == user_id, ContactCounter.name == name)
+                   .values(value=value))
+    missing = Counter({name: value for name, value in actual.items() if name not in stored})
+    adjust_counters(user_id, missing, db)
+    db.commit()
+    return len(changed) + len(missing)
@@ -0,0 +1,129 @@
+import time
+import uuid
+from redis.asyncio import Redis
+
+FAMILY_PREFIX = "refresh:family:"
+USER_PREFIX = "refresh:user:"
+
+ROTATE_SCRIPT = """
+local stored = redis.call('HGET', KEYS[1], 'jti')
+if not stored then
+    return 0
+end
+if stored ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[4])
+    return -1
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2], 'rotated_at', ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+ROTATED = 1
+UNKNOWN = 0
+REUSED = -1
+
+
+def _str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def create_family(email: str, jti: str, ttl: int, r: Redis, device: str | None = None) -> str:
+    """
+    The create_family function starts a new token family, i.e. a login session on one device.
+    Every refresh token issued by rotating this session belongs to the same family.
+
+    :param email: str: The email of the user who logged in
+    :param jti: str: The id of the first refresh token of the family
+    :param ttl: int: Lifetime of the refresh token in seconds
+    :param r: Redis: The Redis client
+    :param device: str | None: A description of the client, e.g. its User-Agent
+    :return: The id of the new family
+    """
+    family = uuid.uuid4().hex
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(FAMILY_PREFIX + family, mapping={"email": email, "jti": jti, "device": (device or "")[:200],
+                                                   "created_at": int(time.time())})
+        pipe.expire(FAMILY_PREFIX + family, ttl)
+        pipe.sadd(USER_PREFIX + email, family)
+        pipe.expire(USER_PREFIX + email, ttl)
+        await pipe.execute()
+    return family
+
+
+async def rotate(email: str, family: str, jti: str, new_jti: str, ttl: int, r: Redis) -> int:
+    """
+    The rotate function replaces the current refresh token of a family with a new one in a single atomic step.
+    Presenting a token of the family that is not the current one means the token was stolen or replayed,
+    so the whole family is revoked.
+
+    :param email: str: The email of the user, taken from the verified token
+    :param family: str: The family id, taken from the verified token
+    :param jti: str: The id of the presented refresh token
+    :param new_jti: str: The id of the refresh token that replaces it
+    :param ttl: int: Lifetime of the new refresh token in seconds
+    :param r: Redis: The Redis client
+    :return: ROTATED, UNKNOWN if the family expired or was revoked, or REUSED
+    """
+    script = r.register_script(ROTATE_SCRIPT)
+    return int(await script(keys=[FAMILY_PREFIX + family, USER_PREFIX + email],
+                            args=[jti, new_jti, ttl, family, int(time.time())]))
+
+
+async def revoke_family(email: str, family: str, r: Redis) -> None:
+    """
+    The revoke_family function ends one session, e.g. on logout.
+
+    :param email: str: The email of the user
+    :param family: str: The family id
+    :param r: Redis: The Redis client
+    :return: None
+    """
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.delete(FAMILY_PREFIX + family)
+        pipe.srem(USER_PREFIX + email, family)
+        await pipe.execute()
+
+
+async def revoke_all(email: str, r: Redis) -> None:
+    """
+    The revoke_all function ends every session of a user, e.g. after a password reset.
+
+    :param email: str: The email of the user
+    :param r: Redis: The Redis client
+    :return: None
+    """
+    families = await r.smembers(USER_PREFIX + email)
+    async with r.pipeline(transaction=True) as pipe:
+        for family in families:
+            pipe.delete(FAMILY_PREFIX + _str(family))
+        pipe.delete(USER_PREFIX + email)
+        await pipe.execute()
+
+
+async def list_sessions(email: str, r: Redis) -> list[dict]:
+    """
+    The list_sessions function returns the active sessions of a user. Expired families are cleaned up on the way.
+
+    :param email: str: The email of the user
+    :param r: Redis: The Redis client
+    :return: A list of dictionaries with the family id, device and timestamps
+    """
+    families = [_str(family) for family in await r.smembers(USER_PREFIX + email)]
+    async with r.pipeline(transaction=False) as pipe:
+        for family in families:
+            pipe.hgetall(FAMILY_PREFIX + family)
+        rows = await pipe.execute()
+    sessions, expired = [], []
+    for family, row in zip(families, rows):
+        if not row:
+            expired.append(family)
+            continue
+        row = {_str(k): _str(v) for k, v in row.items()}
+        sessions.append({"family": family, "device": row.get("device"), "created_at": int(row["created_at"]),
+                         "rotated_at": int(row["rotated_at"]) if row.get("rotated_at") else None})
+    if expired:
+        await r.srem(USER_PREFIX + email, *expired)
+    return sessions
@@ -0,0 +1,137 @@
+from sqlalchemy import select, insert, delete, update, func
+from sqlalchemy.orm import Session
+from src.database.models import Contact, Tag, User, contact_tags
+from src.services.events import contact_events
+
+
+def normalize_tag(name: str) -> str:
+    """
+    The normalize_tag function trims and lowercases a tag name, so Friends and friends are one tag.
+
+    :param name: str: The tag name as entered
+    :return: The normalized name
+    """
+    return " ".join(name.split()).lower()
+
+
+def get_tags(db: Session, user: User):
+    """
+    The get_tags function returns the tags of a user with the number of contacts carrying each of them.
+    The counts are kept on the tags themselves, so no contacts are counted here.
+
+    :param db: Session: Provide the database session
+    :param user: User: Identify the user whose tags are returned
+    :return: A list of Tag objects ordered by name
+    """
+    stmt = select(Tag).where(Tag.user_id == user.id).order_by(Tag.name)
+    return db.execute(stmt).scalars().all()
+
+
+def _adjust_counts(counts: dict[int, int], db: Session) -> None:
+    for tag_id, delta in counts.items():
+        if delta:
+            db.execute(update(Tag).where(Tag.id == tag_id).values(contact_count=Tag.contact_count + delta))
+
+
+def get_tag_ids(contact_ids: list[int], db: Session) -> set[int]:
+    """
+    The get_tag_ids function returns the ids of the tags carried by any of the given contacts.
+
+    :param contact_ids: list[int]: The IDs of the contacts
+    :param db: Session: Provide the database session
+    :return: A set of tag IDs
+    """
+    stmt = select(contact_tags.c.tag_id).where(contact_tags.c.contact_id.in_(contact_ids)).distinct()
+    return set(db.execute(stmt).scalars())
+
+
+def recount_tags(contact_ids: list[int], delta: int, db: Session) -> None:
+    """
+    The recount_tags function adds delta to the counts of the tags carried by the given contacts, once per contact.
+    Deleted contacts keep their tags but are not counted, so it is called with -1 on delete and 1 on restore.
+    It does not commit.
+
+    :param contact_ids: list[int]: The IDs of the contacts
+    :param delta: int: 1 or -1
+    :param db: Session: Provide the database session
+    :return: None
+    """
+    stmt = select(contact_tags.c.tag_id, func.count()).where(contact_tags.c.contact_id.in_(contact_ids))\
+        .group_by(contact_tags.c.tag_id)
+    _adjust_counts({tag_id: delta * count for tag_id, count in db.execute(stmt)}, db)
+
+
+def add_tags(contact_id: int, tag_ids: set[int], db: Session, user: User) -> None:
+    """
+    The add_tags function tags a contact and increments the counts of the tags. It does not commit.
+    Tags the contact already carries are skipped.
+
+    :param contact_id: int: The ID of the contact
+    :param tag_ids: set[int]: The IDs of the tags to add
+    :param db: Session: Provide the database session
+    :param user: User: The owner of the contact
+    :return: None
+    """
+    tag_ids = tag_ids - get_tag_ids([contact_id], db)
+    if not tag_ids:
+        return
+    db.execute(insert(contact_tags), [{"tag_id": tag_id, "contact_id": contact_id, "user_id": user.id}
+                                      for tag_id in tag_ids])
+    _adjust_counts({tag_id: 1 for tag_id in tag_ids}, db)
+
+
+def untag_contacts(contact_ids: list[int], db: Session) -> None:
+    """
+    The untag_contacts function removes every tag from the given contacts and decrements the counts of the tags.
+    It is called before contacts are deleted, and does not commit.
+
+    :param contact_ids: list[int]: The IDs of the contacts
+    :param db: Session: Provide the database session
+    :return: None
+    """
+    stmt = select(contact_tags.c.tag_id, func.count()).where(contact_tags.c.contact_id.in_(contact_ids))\
+        .group_by(contact_tags.c.tag_id)
+    counts = {tag_id: -count for tag_id, count in db.execute(stmt)}
+    if counts:
+        db.execute(delete(contact_tags).where(contact_tags.c.contact_id.in_(contact_ids)))
+        _adjust_counts(counts, db)
+
+
+def set_contact_tags(contact_id: int, names: list[str], db: Session, user: User):
+    """
+    The set_contact_tags function replaces the tags of a contact. Tags that do not exist yet are created.
+
+    :param contact_id: int: The ID of the contact
+    :param names: list[str]: The names of the tags the contact should carry
+    :param db: Session: Provide the database session
+    :param user: User: Identify the user whose contact is tagged
+    :return: The Contact object if found, otherwise None
+    """
+    contact = db.execute(select(Contact).where(Contact.id == contact_id, Contact.user_id == user.id,
+                                               Contact.deleted_at.is_(None))).unique().scalar_one_or_none()
+    if contact is None:
+        return None
+    names = {normalize_tag(name) for name in names} - {""}
+    existing = {tag.name: tag.id for tag in
+                db.execute(select(Tag).where(Tag.user_id == user.id, Tag.name.in_(names))).scalars()}
+    for name in names - existing.keys():
+        tag = Tag(user_id=user.id, name=name, contact_count=0)
+        db.add(tag)
+        db.flush()
+        existing[name] = tag.id
+    wanted = set(existing.values())
+    current = get_tag_ids([contact_id], db)
+    removed = current - wanted
+    if removed:
+        db.execute(delete(contact_tags).where(contact_tags.c.contact_id == contact_id,
+                                              contact_tags.c.tag_id.in_(removed)))
+        _adjust_counts({tag_id: -1 for tag_id in removed}, db)
+    add_tags(contact_id, wanted - current, db, user)
+    if removed or wanted - current:
+        # tags are part of the contact for sync clients, see get_changes
+        contact.updated_at = func.now()
+    db.commit()
+    db.expire(contact)
+    db.refresh(contact)
+    contact_events.publish(user.id, "updated", contact.id)
+    return contact
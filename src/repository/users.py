@@ -1,10 +1,10 @@
 from fastapi import Depends
 from sqlalchemy import select
-from libgravatar import Gravatar
 from sqlalchemy.orm import Session
 from src.database.db import get_db
 from src.database.models import User
 from src.schemas import UserSchema
+from src.services.avatar import avatar_provider
 
 
 async def get_user_by_email(email: str, db: Session = Depends(get_db)):
@@ -25,6 +25,7 @@ async def get_user_by_email(email: str, db: Session = Depends(get_db)):
 async def create_user(body: UserSchema, db: Session = Depends(get_db)):
     """
     The create_user function creates a new user in the database.
+    The avatar is computed locally, any remote check is left to the refresh_avatar background job.
         Args:
             body (UserModel): The UserModel object to be created.
             db (Session): The SQLAlchemy session object used for querying the database.
@@ -33,12 +34,7 @@ async def create_user(body: UserSchema, db: Session = Depends(get_db)):
     :param db: Session: Access the database
     :return: A user object
     """
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as err:
-        print(err)
+    avatar = avatar_provider.default_url(body.email)
 
     # new_user = User(**body.model_dump(), avatar=avatar)
     # db.add(new_user)
@@ -55,19 +51,6 @@ async def create_user(body: UserSchema, db: Session = Depends(get_db)):
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session):
-    """
-    The update_token function updates the refresh token for a user.
-
-    :param user: User: Identify the user in the database
-    :param token: str | None: Update the user's refresh token
-    :param db: Session: Pass the database session to the function
-    :return: None
-    """
-    user.refresh_token = token
-    db.commit()
-
-
 async def confirmed_email(email: str, db: Session) -> None:
     """
     The confirmed_email function takes in an email and a database session,
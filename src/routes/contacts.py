@@ -1,20 +1,30 @@
 from datetime import date, timedelta
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
+from fastapi import APIRouter, HTTPException, Depends, status, Path, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import EmailStr
 
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from src.repository import contacts
+from src.repository import counters as repository_counters
+from src.repository import tags as repository_tags
 from src.database.models import Contact, User
-from src.database.db import get_db
-from src.schemas import ContactResponse, ContactSchema, ContactUpdate
+from src.database.shards import get_shard_db
+from src.schemas import ContactChanges, ContactMerge, ContactResponse, ContactSchema, ContactStats, ContactTags, \
+    ContactUpdate, DuplicatePair, TagResponse
 from src.services.auth import auth_service
+from src.services.events import contact_events
+from src.services.phone import to_e164
+from src.services import duplicates
+from src.services.rate_limit import contacts_limit, search_limit
 
-router = APIRouter(tags=['contacts'])
+router = APIRouter(tags=['contacts'], dependencies=[Depends(contacts_limit)])
 
-@router.get("/search")
-async def search_contacts_route(db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user), search_query: str = Query(..., min_length=1)):
+@router.get("/search", dependencies=[Depends(search_limit)])
+async def search_contacts_route(db: Session = Depends(get_shard_db), user: User = Depends(auth_service.get_current_user), search_query: str = Query(..., min_length=1)):
     """
     The search_contacts_route function searches for contacts based on a query string.
 
@@ -27,12 +37,132 @@ async def search_contacts_route(db: Session = Depends(get_db), user: User = Depe
     return {"contacts": contacts_}
 
 
+@router.get("/changes", response_model=ContactChanges)
+def get_changes(since: Optional[str] = Query(default=None, max_length=200),
+                limit: int = Query(500, ge=1, le=1000),
+                db: Session = Depends(get_shard_db),
+                user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_changes function returns the contacts changed and the ids of the contacts deleted since a sync token.
+    Clients call it without a token once, then pass the returned next token on every call,
+    repeating while has_more is true. A token unused for longer than PURGE_RETENTION_DAYS gets 410,
+    and the client starts over without a token.
+
+    :param since: str: The token returned by the previous call
+    :param limit: int: The maximum number of contacts and of deleted ids in one response
+    :param db: Session: Provide the database session
+    :param user: User: Get the current user from the authentication service
+    :return: A dictionary with contacts, deleted, next and has_more
+    """
+    try:
+        changes = contacts.get_changes(since, limit, db, user)
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+    if changes is None:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Sync token expired, full resync required")
+    return changes
+
+
+@router.get("/stream")
+async def stream_changes(request: Request, user: User = Depends(auth_service.get_current_user)):
+    """
+    The stream_changes function streams the changes of the user's contacts as server-sent events.
+    Each event is a JSON object with the event (created, updated or deleted) and the id of the contact.
+    A resync event means events were lost, and the client should catch up with GET /contacts/changes.
+
+    :param request: Request: The request of the stream
+    :param user: User: Get the current user from the authentication service
+    :return: A text/event-stream response
+    """
+    return StreamingResponse(contact_events.stream(user.id, request), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/lookup", response_model=List[ContactResponse])
+def lookup_contacts(phone: str = Query(..., min_length=3, max_length=32), db: Session = Depends(get_shard_db),
+                    user: User = Depends(auth_service.get_current_user)):
+    """
+    The lookup_contacts function answers "who is calling?": it returns the contacts with the given phone number.
+    The number may be written in any common format, it is normalized to E.164 before the lookup.
+
+    :param phone: str: The phone number to look up
+    :param db: Session: Provide the database session
+    :param user: User: Get the current user from the authentication service
+    :return: A list of contacts with the phone number
+    """
+    phone_e164 = to_e164(phone)
+    if phone_e164 is None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid phone number")
+    return contacts.lookup_by_phone(phone_e164, db, user)
+
+
+@router.get("/duplicates", response_model=List[DuplicatePair])
+async def find_duplicates(db: Session = Depends(get_shard_db), user: User = Depends(auth_service.get_current_user)):
+    """
+    The find_duplicates function returns pairs of contacts that probably describe the same person.
+    Contacts are only compared when they share a normalized email, phone number or name, and large address books
+    are matched in a worker process, see src.services.duplicates.
+
+    :param db: Session: Provide the database session
+    :param user: User: Get the current user from the authentication service
+    :return: A list of pairs with their score and the fields that matched, best matches first
+    """
+    rows = await run_in_threadpool(contacts.get_contact_rows, db, user)
+    return await duplicates.find_duplicates_async(rows)
+
+
+@router.post("/merge", response_model=ContactResponse)
+def merge_contacts(body: ContactMerge, db: Session = Depends(get_shard_db),
+                   user: User = Depends(auth_service.get_current_user)):
+    """
+    The merge_contacts function merges duplicate contacts into the one to keep and deletes the others.
+
+    :param body: ContactMerge: The ID of the contact to keep and the IDs of the contacts merged into it
+    :param db: Session: Provide the database session
+    :param user: User: Get the current user from the authentication service
+    :return: The merged contact
+    """
+    if body.keep_id in body.merge_ids:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="keep_id must not be in merge_ids")
+    contact = contacts.merge_contacts(body.keep_id, body.merge_ids, db, user)
+    if contact is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    return contact
+
+
+@router.get("/tags", response_model=List[TagResponse])
+def get_tags(db: Session = Depends(get_shard_db), user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_tags function returns the tags of the user with the number of contacts carrying each of them.
+
+    :param db: Session: Provide the database session
+    :param user: User: Get the current user from the authentication service
+    :return: A list of tags with their contact counts
+    """
+    return repository_tags.get_tags(db, user)
+
+
+@router.get("/stats", response_model=ContactStats)
+def get_stats(db: Session = Depends(get_shard_db), user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_stats function returns the number of contacts of the user, by birth month and recently added.
+    It reads a handful of counters, however many contacts the user has.
+
+    :param db: Session: Provide the database session
+    :param user: User: Get the current user from the authentication service
+    :return: The statistics of the user's contacts
+    """
+    return repository_counters.get_stats(db, user)
+
+
 @router.get("/", response_model=List[ContactResponse])
 def get_contacts(limit: int = Query(10, ge=10, le=100), offset: int = Query(0, ge=0),
                  first_name: str = Query(default=None, max_length=10),
                  last_name: str = Query(default=None, max_length=15),
                  email: EmailStr = Query(default=None, max_length=32),
-                 db: Session = Depends(get_db),
+                 tag: str = Query(default=None, max_length=50),
+                 db: Session = Depends(get_shard_db),
                  user: User = Depends(auth_service.get_current_user)):
     """
     The get_contacts function retrieves a list of contacts based on the provided query parameters.
@@ -42,18 +172,19 @@ def get_contacts(limit: int = Query(10, ge=10, le=100), offset: int = Query(0, g
     :param first_name: str: Filter contacts by first name
     :param last_name: str: Filter contacts by last name
     :param email: EmailStr: Filter contacts by email
+    :param tag: str: Filter contacts by a tag they carry
     :param db: Session: Provide the database session
     :param user: User: Get the current user from the authentication service
     :return: A list of contacts that match the provided filters
     """
-    contacts_ = contacts.get_contacts(limit, offset, db, user, first_name, last_name, email)
+    contacts_ = contacts.get_contacts(limit, offset, db, user, first_name, last_name, email, tag)
     if contacts_ is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
     return contacts_
 
 
 @router.get("/{contact_id}", response_model=ContactResponse)
-def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_shard_db),
                 user: User = Depends(auth_service.get_current_user)):
     """
     The get_contact function retrieves a contact by its ID.
@@ -70,38 +201,91 @@ def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
 
 
 @router.post("/", response_model=ContactResponse, status_code=status.HTTP_201_CREATED)
-def create_contact(body: ContactSchema, db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
+def create_contact(body: ContactSchema, db: Session = Depends(get_shard_db), user: User = Depends(auth_service.get_current_user)):
     """
     The create_contact function creates a new contact.
+    Retries sent with the same Idempotency-Key header get the first response back, see Idempotency.
 
     :param body: ContactSchema: The schema of the contact to create
     :param db: Session: Provide the database session
     :param user: User: Get the current user from the authentication service
-    :return: The created contact
+    :return: The created contact, or 409 if a contact with the email already exists
     """
-    contact = contacts.create_contact(body, db, user)
+    try:
+        contact = contacts.create_contact(body, db, user)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Contact with this email already exists")
     return contact
 
 
 @router.put("/{contact_id}", response_model=ContactResponse)
-def update_contact(body: ContactUpdate, contact_id: int = Path(ge=1), db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
+def update_contact(body: ContactUpdate, contact_id: int = Path(ge=1), db: Session = Depends(get_shard_db), user: User = Depends(auth_service.get_current_user)):
     """
     The update_contact function updates an existing contact.
+    Retries sent with the same Idempotency-Key header get the first response back, see Idempotency.
 
     :param body: ContactUpdate: The updated data for the contact
     :param contact_id: int: The ID of the contact to update
     :param db: Session: Provide the database session
     :param user: User: Get the current user from the authentication service
-    :return: The updated contact
+    :return: The updated contact, or 409 if another contact has the email
+    """
+    try:
+        contact = contacts.update_contact(contact_id, body, db, user)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Contact with this email already exists")
+    if contact is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    return contact
+
+
+@router.put("/{contact_id}/tags", response_model=ContactResponse)
+def set_contact_tags(body: ContactTags, contact_id: int = Path(ge=1), db: Session = Depends(get_shard_db),
+                     user: User = Depends(auth_service.get_current_user)):
+    """
+    The set_contact_tags function replaces the tags of a contact. Tags that do not exist yet are created.
+
+    :param body: ContactTags: The names of the tags the contact should carry
+    :param contact_id: int: The ID of the contact to tag
+    :param db: Session: Provide the database session
+    :param user: User: Get the current user from the authentication service
+    :return: The tagged contact
+    """
+    try:
+        contact = repository_tags.set_contact_tags(contact_id, body.tags, db, user)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Tags were changed concurrently, retry")
+    if contact is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    return contact
+
+
+@router.post("/{contact_id}/restore", response_model=ContactResponse)
+def restore_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_shard_db),
+                    user: User = Depends(auth_service.get_current_user)):
+    """
+    The restore_contact function undoes the deletion of a contact, until the contact is purged.
+
+    :param contact_id: int: The ID of the deleted contact
+    :param db: Session: Provide the database session
+    :param user: User: Get the current user from the authentication service
+    :return: The restored contact, or 409 if another contact has the email now
     """
-    contact = contacts.update_contact(contact_id, body, db, user)
+    try:
+        contact = contacts.restore_contact(contact_id, db, user)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Contact with this email already exists")
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
     return contact
 
 
 @router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
+def delete_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_shard_db), user: User = Depends(auth_service.get_current_user)):
     """
     The delete_contact function deletes a contact by its ID.
 
@@ -1,18 +1,20 @@
-from datetime import date, timedelta
+from datetime import date
 from typing import List
 from fastapi import APIRouter, Depends
-from sqlalchemy import select, extract, and_, or_
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from src.database.db import get_db
+from src.database.shards import get_shard_db
 from src.database.models import Contact, User
+from src.repository.contacts import birthday_window
 from src.schemas import ContactResponse
 from src.services.auth import auth_service
+from src.services.rate_limit import dates_limit
 
-router = APIRouter(tags=['dates'])
+router = APIRouter(tags=['dates'], dependencies=[Depends(dates_limit)])
 
 
 @router.get("/", response_model=List[ContactResponse])
-def show_dates(db: Session = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
+def show_dates(db: Session = Depends(get_shard_db), user: User = Depends(auth_service.get_current_user)):
     """
     The show_dates function retrieves contacts whose birthdays fall within the next 7 days.
 
@@ -20,22 +22,7 @@ def show_dates(db: Session = Depends(get_db), user: User = Depends(auth_service.
     :param user: User: Get the current user from the authentication service
     :return: A list of contacts whose birthdays are within the next 7 days
     """
-    today = date.today()
-    end_date = today + timedelta(days=7)
-
-    stmt = select(Contact).filter_by(user=user).filter(
-        and_(
-            or_(
-                and_(
-                    extract('month', Contact.birthdate) == today.month,
-                    extract('day', Contact.birthdate) >= today.day
-                ),
-                and_(
-                    extract('month', Contact.birthdate) == end_date.month,
-                    extract('day', Contact.birthdate) <= end_date.day
-                )
-            )
-        )
-    )
+    stmt = select(Contact).where(Contact.user_id == user.id, Contact.deleted_at.is_(None),
+                                 birthday_window(date.today(), 7))
     contacts = db.execute(stmt)
     return contacts.scalars().all()
@@ -1,25 +1,44 @@
 from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File, Security, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 import pickle
-import cloudinary
-import cloudinary.uploader
+import uuid
+from functools import lru_cache
+from src.conf.config import settings
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repositories_users
+from src.repository import refresh_tokens as repositories_refresh_tokens
 from src.schemas import UserSchema, TokenSchema, UserResponse, RequestEmail
 from src.services.auth import auth_service
-from dotenv import load_dotenv
-import os
+from src.services.rate_limit import client_ip, default_limit, login_limit
+from src.services.login_guard import login_guard
 from fastapi_limiter.depends import RateLimiter
 from src.services.email import send_email, send_recovery_email
+from src.services.avatar import refresh_avatar
 
+router = APIRouter(prefix='/auth', tags=['auth'], dependencies=[Depends(default_limit)])
+get_refresh_token = HTTPBearer()
 
 
-load_dotenv()
+@lru_cache
+def get_cloudinary():
+    """
+    The get_cloudinary function imports and configures the Cloudinary SDK on the first avatar upload.
+    The SDK is not needed anywhere else, and the configuration does not change while the app runs.
 
-router = APIRouter(prefix='/auth', tags=['auth'])
-get_refresh_token = HTTPBearer()
+    :return: The configured cloudinary module
+    """
+    import cloudinary
+    import cloudinary.uploader
+
+    cloudinary.config(
+        cloud_name=settings.cloudinary_name,
+        api_key=settings.cloudinary_api_key,
+        api_secret=settings.cloudinary_api_secret,
+        secure=True)
+    return cloudinary
 
 
 
@@ -49,88 +68,127 @@ async def update_avatar_user(file: UploadFile = File(),
     :param db: Session: Connect to the database
     :return: The user object with the updated avatar
     """
-    cloudinary.config(
-        cloud_name=os.getenv("CLOUDINARY_NAME"),
-        api_key=os.getenv("CLOUDINARY_API_KEY"),
-        api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-        secure=True)
-
-    r = cloudinary.uploader.upload(file.file, public_id=f'ContactsApp/{current_user.username}', overwrite=True)
+    cloudinary = get_cloudinary()
+    r = await run_in_threadpool(cloudinary.uploader.upload, file.file,
+                                public_id=f'ContactsApp/{current_user.username}', overwrite=True)
     src_url = cloudinary.CloudinaryImage(f'ContactsApp/{current_user.username}')\
                         .build_url(width=250, height=250, crop='fill', version=r.get('version'))
     user = await repositories_users.update_avatar(current_user.email, src_url, db)
-    await auth_service.r.set(user.email, pickle.dumps(user))
-    await auth_service.r.expire(user.email, 300)
+    await auth_service.r.set(user.email, pickle.dumps(user), ex=settings.user_cache_seconds)
     return user
 
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserSchema, db: Session = Depends(get_db)):
+async def signup(body: UserSchema, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """
     The signup function creates a new user account. It checks if the email is already in use and raises an exception if it is.
     Otherwise, it hashes the password, creates a new user, and returns the new user object.
+    The remote avatar check is scheduled as a background task so it never adds to the signup latency.
 
     :param body: UserSchema: The data for the new user
+    :param background_tasks: BackgroundTasks: Background tasks for resolving the avatar
     :param db: Session: Provide the database session
     :return: The newly created User object
     """
     exist_user = await repositories_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash_async(body.password)
     new_user = await repositories_users.create_user(body, db)
+    background_tasks.add_task(refresh_avatar, new_user.email)
     return new_user
 
 
 
-@router.post("/login",  response_model=TokenSchema)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+@router.post("/login",  response_model=TokenSchema, dependencies=[Depends(login_limit)])
+async def login(request: Request, body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """
     The login function authenticates a user and generates JWT tokens.
     It checks if the email and password are correct, and if they are, generates and returns access and refresh tokens.
+    Every login starts a new refresh token family in Redis, so each device has its own session.
+    Locked accounts and IPs are rejected before the user is loaded, see LoginGuard.
 
+    :param request: Request: The request object, its User-Agent describes the session
     :param body: OAuth2PasswordRequestForm: The login credentials
     :param db: Session: Provide the database session
     :return: A dictionary with access_token, refresh_token, and token_type
     """
+    ip = client_ip(request)
+    await login_guard.check(body.username, ip)
     user = await repositories_users.get_user_by_email(body.username, db)
     if user is None:
+        await login_guard.failed(body.username, ip)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password_async(body.password, user.password):
+        await login_guard.failed(body.username, ip)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    await login_guard.succeeded(user.email)
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repositories_users.update_token(user, refresh_token, db)
+    jti = uuid.uuid4().hex
+    family = await repositories_refresh_tokens.create_family(user.email, jti, auth_service.REFRESH_TOKEN_TTL,
+                                                             auth_service.r, request.headers.get("user-agent"))
+    access_token = await auth_service.create_access_token(data={"sub": user.email, "fam": family})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email, "fam": family, "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token',  response_model=TokenSchema)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Depends(get_refresh_token),
-                        db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Depends(get_refresh_token)):
     """
     The refresh_token function generates new access and refresh tokens using a valid refresh token.
-    It checks the validity of the refresh token and updates it in the database.
+    The presented token must be the current token of its family in Redis. It is rotated in one atomic step,
+    and presenting an already rotated token revokes the whole family. The database is not touched.
 
     :param credentials: HTTPAuthorizationCredentials: The refresh token credentials
-    :param db: Session: Provide the database session
     :return: A dictionary with new access_token, refresh_token, and token_type
     """
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repositories_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repositories_users.update_token(user, None, db)
+    claims = await auth_service.decode_refresh_token_claims(credentials.credentials)
+    email, family, jti = claims["sub"], claims.get("fam"), claims.get("jti")
+    if not family or not jti:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repositories_users.update_token(user, refresh_token, db)
+    new_jti = uuid.uuid4().hex
+    result = await repositories_refresh_tokens.rotate(email, family, jti, new_jti, auth_service.REFRESH_TOKEN_TTL,
+                                                      auth_service.r)
+    if result == repositories_refresh_tokens.REUSED:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token reuse detected")
+    if result != repositories_refresh_tokens.ROTATED:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    access_token = await auth_service.create_access_token(data={"sub": email, "fam": family})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": email, "fam": family, "jti": new_jti})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
+@router.post('/logout')
+async def logout(token: str = Depends(auth_service.oauth2_scheme),
+                 current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The logout function revokes the presented access token immediately and ends its session,
+    so the refresh token of the session stops working too. Sessions on the user's other devices stay active.
+
+    :param token: str: The access token of the session
+    :param current_user: User: Get the current user
+    :return: A dictionary with a logout message
+    """
+    claims = await auth_service.revoke_access_token(token)
+    if claims.get("fam"):
+        await repositories_refresh_tokens.revoke_family(current_user.email, claims["fam"], auth_service.r)
+    return {"message": "Logged out"}
+
+
+@router.get('/sessions')
+async def sessions(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The sessions function lists the active sessions of the current user, one per logged in device.
+
+    :param current_user: User: Get the current user
+    :return: A list of sessions
+    """
+    return await repositories_refresh_tokens.list_sessions(current_user.email, auth_service.r)
+
+
 @router.get('/confirmed_email/{token}', dependencies=[Depends(RateLimiter(times=1, seconds=10))])
 async def confirmed_email(token: str, db: Session = Depends(get_db)):
     """
@@ -196,7 +254,8 @@ async def recovery_email(body: RequestEmail, background_tasks: BackgroundTasks,
 async def recovered_password(new_password: str, token: str, db: Session = Depends(get_db)):
     """
     The recovered_password function resets the user's password using a token sent to their email.
-    It hashes the new password and updates it in the database.
+    It hashes the new password and updates it in the database, then ends all sessions of the user
+    and revokes every access token issued before the reset.
 
     :param new_password: str: The new password
     :param token: str: The token sent to the user's email
@@ -207,7 +266,9 @@ async def recovered_password(new_password: str, token: str, db: Session = Depend
     user = await repositories_users.get_user_by_email(email, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Recovering error")
-    user.password = auth_service.get_password_hash(new_password)
+    user.password = await auth_service.get_password_hash_async(new_password)
     db.commit()
     db.refresh(user)
+    await repositories_refresh_tokens.revoke_all(email, auth_service.r)
+    await auth_service.revoke_user_tokens(email)
     return {"message": "Password was successfully reseted"}
\ No newline at end of file
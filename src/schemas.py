@@ -1,6 +1,6 @@
 from datetime import date, datetime
-from typing import Optional
-from pydantic import BaseModel, EmailStr, Field
+from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field, field_validator
 
 
 class UserSchema(BaseModel):
@@ -40,15 +40,67 @@ class ContactResponse(BaseModel):
     last_name: str
     email: str
     phonenumber: str
+    phone_e164: Optional[str] = None
     birthdate: Optional[date] = None
     additional_info: Optional[str] = None
     created_at: datetime | None
     updated_at: datetime | None
     user: UserResponse | None
+    tags: List[str] = []
+
+    @field_validator("tags", mode="before")
+    @classmethod
+    def tag_names(cls, value):
+        return [getattr(tag, "name", tag) for tag in value]
+
+    class Config:
+        from_attributes = True
+
+class ContactChanges(BaseModel):
+    contacts: List[ContactResponse]
+    deleted: List[int]
+    next: str
+    has_more: bool
+
+
+class DuplicatePair(BaseModel):
+    ids: List[int]
+    score: float
+    reasons: List[str]
+
+
+class ContactMerge(BaseModel):
+    keep_id: int = Field(ge=1)
+    merge_ids: List[int] = Field(min_length=1, max_length=50)
+
+    @field_validator("merge_ids")
+    @classmethod
+    def unique_ids(cls, value):
+        if len(set(value)) != len(value):
+            raise ValueError("merge_ids must not contain duplicates")
+        return value
+
+
+class TagResponse(BaseModel):
+    name: str
+    contact_count: int
 
     class Config:
         from_attributes = True
 
+
+class ContactTags(BaseModel):
+    tags: List[str] = Field(max_length=20)
+
+    @field_validator("tags")
+    @classmethod
+    def tag_length(cls, value):
+        for name in value:
+            if not 0 < len(name.strip()) <= 50:
+                raise ValueError("Tags must be 1 to 50 characters")
+        return value
+
+
 class TokenSchema(BaseModel):
     access_token: str
     refresh_token: str
@@ -56,4 +108,11 @@ class TokenSchema(BaseModel):
 
 
 class RequestEmail(BaseModel):
-    email: EmailStr
\ No newline at end of file
+    email: EmailStr
+
+class ContactStats(BaseModel):
+    total: int
+    birth_months: List[int] = Field(description="Contacts born in each month, January first")
+    without_birthdate: int
+    added_last_7_days: int
+    added_last_30_days: int
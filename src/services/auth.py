@@ -1,25 +1,42 @@
 from datetime import datetime, timedelta
+from functools import cached_property
 from typing import Optional
 from fastapi import Depends, HTTPException, status
-from passlib.context import CryptContext
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
+from src.conf.config import settings
 from src.database.db import get_db
+from src.database.cache import get_redis
 from src.repository import users as repository_users
-import redis.asyncio as redis
+from src.services.metrics import BCRYPT_DURATION, BCRYPT_QUEUE_TIME, USER_CACHE_REQUESTS
+from src.services.profiling import span
+from src.services.revocation import revocations
+import logging
 import pickle
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
+import time
+import uuid
 
+logger = logging.getLogger(__name__)
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    SECRET_KEY = os.getenv("SECRET_KEY")
-    ALGORITHM = os.getenv("ALGORITHM")
+    SECRET_KEY = settings.secret_key
+    ALGORITHM = settings.algorithm
+    REFRESH_TOKEN_TTL = settings.refresh_token_seconds
+
+    @cached_property
+    def pwd_context(self):
+        """
+        The pwd_context property builds the bcrypt context on first use.
+        passlib is imported here, so processes that never hash a password, e.g. the background jobs, skip it.
+
+        :param self: Represent the instance of the class
+        :return: The passlib CryptContext
+        """
+        from passlib.context import CryptContext
+        return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
     def verify_password(self, plain_password, hashed_password):
         """
@@ -45,16 +62,63 @@ class Auth:
         """
         return self.pwd_context.hash(password)
 
-    r = redis.Redis(host=os.getenv("REDIS_HOST"), port=os.getenv("REDIS_PORT"), db=0)
+    async def _run_bcrypt(self, operation: str, func, *args):
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            BCRYPT_QUEUE_TIME.labels(operation).observe(started - submitted)
+            try:
+                return func(*args)
+            finally:
+                BCRYPT_DURATION.labels(operation).observe(time.perf_counter() - started)
+
+        return await run_in_threadpool(job)
+
+    async def verify_password_async(self, plain_password, hashed_password):
+        """
+        The verify_password_async function runs verify_password in the thread pool,
+        so the ~200ms of bcrypt work does not block the event loop.
+        The time spent waiting for a free thread and the hashing time are both recorded as metrics.
+
+        :param self: Represent the instance of the class
+        :param plain_password: Compare the password entered by the user to see if it matches
+        :param hashed_password: The hashed password stored in the database
+        :return: True if the password is correct and false otherwise
+        """
+        return await self._run_bcrypt("verify", self.verify_password, plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str):
+        """
+        The get_password_hash_async function runs get_password_hash in the thread pool,
+        recording queue and hashing time like verify_password_async.
+
+        :param self: Represent the instance of the class
+        :param password: str: Specify the password that we want to hash
+        :return: A hash of the password
+        """
+        return await self._run_bcrypt("hash", self.get_password_hash, password)
+
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/auth/login")
 
+    @property
+    def r(self):
+        """
+        The r property returns the shared Redis client, see src.database.cache.
+
+        :param self: Represent the instance of the class
+        :return: The shared Redis client
+        """
+        return get_redis()
+
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
         The create_access_token function creates a new access token.
+        Every token gets a unique jti, so that it can be revoked on its own.
             Args:
                 - data (dict): A dictionary containing the claims to be encoded in the JWT.
-                - expires_delta (Optional[float]): An optional parameter specifying how long, in seconds, the access token should last before expiring. If not specified, it defaults to 15 minutes.
+                - expires_delta (Optional[float]): An optional parameter specifying how long, in seconds, the access token should last before expiring. If not specified, it defaults to ACCESS_TOKEN_MINUTES, 15 minutes.
 
         :param self: Represent the instance of a class
         :param data: dict: Pass the data to be encoded in the token
@@ -65,8 +129,9 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(minutes=15)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
+            expire = datetime.utcnow() + timedelta(minutes=settings.access_token_minutes)
+        # iat keeps sub-second precision, so a token issued right after a revocation is not caught by it
+        to_encode.update({"iat": time.time(), "exp": expire, "scope": "access_token", "jti": uuid.uuid4().hex})
         encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_access_token
 
@@ -87,35 +152,48 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(seconds=self.REFRESH_TOKEN_TTL)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
-    async def decode_refresh_token(self, refresh_token: str):
+    async def decode_refresh_token_claims(self, refresh_token: str):
         """
-        The decode_refresh_token function is used to decode the refresh token.
+        The decode_refresh_token_claims function verifies a refresh token and returns all of its claims,
+        including the token family (fam) and token id (jti) used for rotation.
         It will raise an exception if the token is invalid or has expired.
-        If it's valid, it returns the email address of the user.
 
         :param self: Represent the instance of a class
         :param refresh_token: str: Decode the refresh token
-        :return: The email of the user
+        :return: The claims of the token
         """
         try:
             payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
+    async def decode_refresh_token(self, refresh_token: str):
+        """
+        The decode_refresh_token function is used to decode the refresh token.
+        It will raise an exception if the token is invalid or has expired.
+        If it's valid, it returns the email address of the user.
+
+        :param self: Represent the instance of a class
+        :param refresh_token: str: Decode the refresh token
+        :return: The email of the user
+        """
+        payload = await self.decode_refresh_token_claims(refresh_token)
+        return payload['sub']
+
     async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used in the
             protected endpoints. It takes a token as an argument and returns the user
             if it's valid, otherwise raises an HTTPException with status code 401.
+            Revoked tokens are rejected, the revocation entries are fetched in the same MGET as the cached user.
 
         :param self: Access the class attributes
         :param token: str: Pass the token from the request header
@@ -130,7 +208,8 @@ class Auth:
 
         try:
             # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            with span("auth.decode"):
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload['scope'] == 'access_token':
                 email = payload["sub"]
                 if email is None:
@@ -140,21 +219,85 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
 
+        jti, iat = payload.get("jti"), payload.get("iat", 0)
+        if revocations.is_revoked_locally(email, jti, iat):
+            raise credentials_exception
+
         user_hash = str(email)
-        user = await self.r.get(user_hash)
+        with span("redis.get"):
+            user, revoked_before, denied = await self.r.mget(user_hash, *revocations.keys(email, jti))
+        if revocations.is_revoked(email, jti, iat, payload["exp"], revoked_before, denied):
+            raise credentials_exception
 
         if user is None:
-            print("User from database")
+            logger.info("User from database", extra={"sample_rate": 0.01})
+            USER_CACHE_REQUESTS.labels("miss").inc()
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            await self.r.set(user_hash, pickle.dumps(user))
-            await self.r.expire(user_hash, 100)
+            await self.r.set(user_hash, pickle.dumps(user), ex=settings.user_cache_seconds)
         else:
-            print("User from cache")
+            logger.info("User from cache", extra={"sample_rate": 0.01})
+            USER_CACHE_REQUESTS.labels("hit").inc()
             user = pickle.loads(user)
         return user
 
+    async def decode_access_token(self, token: str):
+        """
+        The decode_access_token function verifies an access token and returns its claims.
+
+        :param self: Represent the instance of the class
+        :param token: str: The access token
+        :return: The claims of the token
+        """
+        try:
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            if payload['scope'] == 'access_token':
+                return payload
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
+        except JWTError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
+
+    async def is_revoked(self, payload: dict) -> bool:
+        """
+        The is_revoked function runs the revocation checks of get_current_user on decoded claims,
+        for callers that answer before the route does.
+
+        :param self: Represent the instance of the class
+        :param payload: dict: The claims returned by decode_access_token
+        :return: True if the token was revoked by logout or a password reset
+        """
+        email, jti, iat = payload["sub"], payload.get("jti"), payload.get("iat", 0)
+        if revocations.is_revoked_locally(email, jti, iat):
+            return True
+        revoked_before, denied = await self.r.mget(*revocations.keys(email, jti))
+        return revocations.is_revoked(email, jti, iat, payload["exp"], revoked_before, denied)
+
+    async def revoke_access_token(self, token: str):
+        """
+        The revoke_access_token function denylists an access token until it expires.
+
+        :param self: Represent the instance of the class
+        :param token: str: The access token
+        :return: The claims of the revoked token
+        """
+        payload = await self.decode_access_token(token)
+        if payload.get("jti"):
+            await revocations.revoke_token(payload["jti"], payload["exp"], self.r)
+        return payload
+
+    async def revoke_user_tokens(self, email: str):
+        """
+        The revoke_user_tokens function revokes every access token issued to a user so far
+        and drops the cached user, e.g. after a password reset.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: None
+        """
+        await revocations.revoke_user(email, self.REFRESH_TOKEN_TTL, self.r)
+        await self.r.delete(str(email))
+
     async def create_email_token(self, data: dict):
         """
         The create_email_token function takes in a dictionary of data and returns a token.
@@ -185,7 +328,7 @@ class Auth:
             email = payload["sub"]
             return email
         except JWTError as e:
-            print(e)
+            logger.info("Invalid email token: %s", e)
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail="Invalid token for email verification")
 
@@ -0,0 +1,109 @@
+import asyncio
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+from sqlalchemy import select
+from src.database.db import SessionLocal
+from src.database.models import User
+
+
+@lru_cache(maxsize=4096)
+def gravatar_hash(email: str) -> str:
+    """
+    The gravatar_hash function returns the md5 hash Gravatar uses to identify an email address.
+    Results are memoized, so repeated signups and lookups for the same address skip the hashing.
+
+    :param email: str: The email address to hash
+    :return: The hex digest identifying the address on Gravatar
+    """
+    from libgravatar import Gravatar
+    return Gravatar(email).email_hash
+
+
+class AvatarProvider(ABC):
+    """
+    Base class for avatar providers.
+
+    default_url must be cheap and computed locally, because it runs inside the signup request.
+    resolve may talk to the network and is only ever called from a background job.
+    """
+
+    @abstractmethod
+    def default_url(self, email: str) -> str:
+        ...
+
+    @abstractmethod
+    async def resolve(self, email: str) -> str | None:
+        ...
+
+
+class GravatarProvider(AvatarProvider):
+    base_url = "https://www.gravatar.com/avatar/"
+    fallback = "identicon"
+    timeout = 3
+
+    def default_url(self, email: str) -> str:
+        """
+        The default_url function builds the Gravatar URL for an email without any network access.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email address of the user
+        :return: The Gravatar image URL
+        """
+        return f"{self.base_url}{gravatar_hash(email)}"
+
+    def _has_gravatar(self, email: str) -> bool | None:
+        request = Request(f"{self.default_url(email)}?d=404", method="HEAD")
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return response.status == 200
+        except HTTPError as err:
+            if err.code == 404:
+                return False
+            return None
+        except (URLError, OSError):
+            return None
+
+    async def resolve(self, email: str) -> str | None:
+        """
+        The resolve function asks Gravatar whether the email has an image registered.
+        If it has, the plain Gravatar URL is returned, otherwise a generated identicon URL is returned.
+        The blocking HTTP call runs in a worker thread so the event loop is never held up.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email address of the user
+        :return: The avatar URL to store, or None if Gravatar could not be reached
+        """
+        exists = await asyncio.to_thread(self._has_gravatar, email)
+        if exists is None:
+            return None
+        if exists:
+            return self.default_url(email)
+        return f"{self.default_url(email)}?d={self.fallback}"
+
+
+avatar_provider: AvatarProvider = GravatarProvider()
+
+
+async def refresh_avatar(email: str) -> None:
+    """
+    The refresh_avatar function is a background job run after signup.
+    It resolves the avatar remotely and stores it if it differs from the locally computed default.
+    It opens its own session, because the request session is already closed when the job runs.
+    An avatar the user has uploaded in the meantime is never overwritten.
+
+    :param email: str: The email address of the new user
+    :return: None
+    """
+    url = await avatar_provider.resolve(email)
+    if url is None:
+        return
+    db = SessionLocal()
+    try:
+        user = db.execute(select(User).filter_by(email=email)).scalar_one_or_none()
+        if user is not None and user.avatar == avatar_provider.default_url(email) and user.avatar != url:
+            user.avatar = url
+            db.commit()
+    finally:
+        db.close()
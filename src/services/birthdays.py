@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime
+from fastapi.concurrency import run_in_threadpool
+from redis.asyncio import Redis
+from sqlalchemy.orm import sessionmaker
+from src.conf.config import settings
+from src.database.cache import init_redis, close_redis
+from src.database.shards import contact_databases
+from src.repository.contacts import get_upcoming_birthdays, next_birthday
+from src.services.email import send_birthday_digest
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "birthdays:digest:lock"
+DONE_PREFIX = "birthdays:digest:done:"
+SENT_PREFIX = "birthdays:digest:sent:"
+KEEP_SECONDS = 2 * 24 * 60 * 60
+
+
+class BirthdayDigests:
+    """
+    Sends every confirmed user, once a day after BIRTHDAY_DIGEST_HOUR (server time), one email listing their
+    contacts with a birthday in the next BIRTHDAY_DIGEST_DAYS days.
+
+    The birthdays of all users come from one streamed query per database, see get_upcoming_birthdays.
+    The emails are sent one at a time, at most BIRTHDAY_DIGEST_PER_MINUTE, to stay within the SMTP budget.
+    A Redis lock lets a single process send, and each user is recorded once their email has gone out, so a run
+    interrupted half way resumes with the users not sent to yet. A digest that fails to send is not recorded;
+    the day is then not marked done, and the next check tries it again.
+    """
+
+    def __init__(self):
+        self.days = settings.birthday_digest_days
+        self.hour = settings.birthday_digest_hour
+        self.per_minute = settings.birthday_digest_per_minute
+        self.check = settings.birthday_digest_check_seconds
+        self.lock_seconds = settings.birthday_digest_lock_seconds
+        self.host = settings.app_base_url
+        self.enabled = settings.birthday_digest_enabled
+        self._task: asyncio.Task | None = None
+
+    def collect(self, factory: sessionmaker, day: date) -> list[dict]:
+        """
+        The collect function groups the upcoming birthdays of a database into one digest per user.
+        The rows arrive ordered by user, so only the digests are kept in memory, not the rows.
+
+        :param self: Represent the instance of the class
+        :param factory: sessionmaker: The session factory of the database
+        :param day: date: The day of the digests
+        :return: A list of digests with user_id, email, username and birthdays, soonest first
+        """
+        digests = []
+        with factory() as db:
+            for row in get_upcoming_birthdays(day, self.days, db):
+                if not digests or digests[-1]["user_id"] != row.user_id:
+                    digests.append({"user_id": row.user_id, "email": row.email, "username": row.username,
+                                    "birthdays": []})
+                birthday = next_birthday(row.birthdate, day)
+                digests[-1]["birthdays"].append({"date": birthday, "name": f"{row.first_name} {row.last_name}",
+                                                 "age": birthday.year - row.birthdate.year})
+        for digest in digests:
+            digest["birthdays"].sort(key=lambda birthday: (birthday["date"], birthday["name"]))
+            for birthday in digest["birthdays"]:
+                birthday["date"] = birthday["date"].strftime("%a %d %b")
+        return digests
+
+    async def run(self, day: date, r: Redis) -> int:
+        """
+        The run function sends the digests of the day to every user that has not got theirs yet.
+
+        :param self: Represent the instance of the class
+        :param day: date: The day of the digests
+        :param r: Redis: The shared Redis client
+        :return: The number of digests sent
+        """
+        sent_key = SENT_PREFIX + day.isoformat()
+        sent = failed = 0
+        for factory in contact_databases():
+            for digest in await run_in_threadpool(self.collect, factory, day):
+                if await r.sismember(sent_key, digest["user_id"]):
+                    continue
+                await r.expire(LOCK_KEY, self.lock_seconds)
+                try:
+                    await send_birthday_digest(digest["email"], digest["username"], digest["birthdays"], self.host)
+                except Exception as err:
+                    logger.warning("Birthday digest failed: %s", err, extra={"user_id": digest["user_id"]})
+                    failed += 1
+                else:
+                    await r.sadd(sent_key, digest["user_id"])
+                    await r.expire(sent_key, KEEP_SECONDS)
+                    sent += 1
+                await asyncio.sleep(60 / self.per_minute)
+        if not failed:
+            await r.set(DONE_PREFIX + day.isoformat(), sent, ex=KEEP_SECONDS)
+        logger.info("Birthday digests sent", extra={"day": day.isoformat(), "digests": sent, "failed": failed})
+        return sent
+
+    async def _loop(self, r: Redis) -> None:
+        while True:
+            try:
+                now = datetime.now()
+                day = now.date()
+                if now.hour >= self.hour and not await r.exists(DONE_PREFIX + day.isoformat()) \
+                        and await r.set(LOCK_KEY, os.getpid(), nx=True, ex=self.lock_seconds):
+                    try:
+                        await self.run(day, r)
+                    finally:
+                        await r.delete(LOCK_KEY)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.warning("Birthday digests failed: %s", err)
+            await asyncio.sleep(self.check)
+
+    async def start(self, r: Redis) -> None:
+        """
+        The start function starts the daily digests. It is called from the app lifespan.
+
+        :param self: Represent the instance of the class
+        :param r: Redis: The shared Redis client
+        :return: None
+        """
+        if self.enabled:
+            self._task = asyncio.create_task(self._loop(r))
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the daily digests.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+birthday_digests = BirthdayDigests()
+
+
+if __name__ == "__main__":
+    async def main():
+        r = await init_redis()
+        try:
+            print(f"{await birthday_digests.run(date.today(), r)} digests sent")
+        finally:
+            await close_redis()
+
+    asyncio.run(main())
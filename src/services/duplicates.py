@@ -0,0 +1,160 @@
+import asyncio
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from itertools import combinations
+from typing import NamedTuple
+from src.conf.config import settings
+
+PROCESS_THRESHOLD = settings.duplicates_process_threshold
+MAX_WORKERS = settings.duplicates_max_workers
+MIN_SCORE = settings.duplicates_min_score
+# Blocks bigger than this, e.g. everyone called "Ivan", are skipped rather than compared pairwise
+MAX_BLOCK_SIZE = 50
+
+_executor: ProcessPoolExecutor | None = None
+
+
+class ContactRow(NamedTuple):
+    """
+    The fields of a contact used for matching. Plain tuples are cheap to send to a worker process.
+    """
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    phone_e164: str | None
+    birthdate: object
+
+
+def normalize_text(value: str | None) -> str:
+    """
+    The normalize_text function lowercases a value, strips accents and keeps only letters and digits.
+
+    :param value: str | None: The value to normalize
+    :return: The normalized value
+    """
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKD", value.lower())
+    return "".join(ch for ch in value if ch.isalnum())
+
+
+def normalize_email(email: str | None) -> str:
+    """
+    The normalize_email function lowercases an email address and drops the +tag of the local part.
+
+    :param email: str | None: The email address
+    :return: The normalized address
+    """
+    if not email or "@" not in email:
+        return ""
+    local, _, domain = email.lower().strip().rpartition("@")
+    return local.split("+", 1)[0] + "@" + domain
+
+
+def blocking_keys(row: ContactRow) -> list[str]:
+    """
+    The blocking_keys function returns the keys a contact is grouped under. Only contacts that share a key
+    are compared, which avoids comparing every pair of the address book.
+
+    :param row: ContactRow: The contact
+    :return: A list of keys
+    """
+    keys = []
+    email = normalize_email(row.email)
+    if email:
+        keys.append("email:" + email)
+    if row.phone_e164:
+        keys.append("phone:" + row.phone_e164)
+    first, last = normalize_text(row.first_name), normalize_text(row.last_name)
+    if last:
+        keys.append("name:" + "".join(sorted((first, last))))
+        keys.append("last:" + last + ":" + first[:1])
+    return keys
+
+
+def score(a: ContactRow, b: ContactRow) -> tuple[float, list[str]]:
+    """
+    The score function estimates how likely two contacts describe the same person.
+
+    :param a: ContactRow: The first contact
+    :param b: ContactRow: The second contact
+    :return: A score between 0 and 1, and the reasons behind it
+    """
+    total, reasons = 0.0, []
+    if normalize_email(a.email) and normalize_email(a.email) == normalize_email(b.email):
+        total += 0.5
+        reasons.append("email")
+    if a.phone_e164 and a.phone_e164 == b.phone_e164:
+        total += 0.4
+        reasons.append("phone")
+    name_a = " ".join(sorted((normalize_text(a.first_name), normalize_text(a.last_name))))
+    name_b = " ".join(sorted((normalize_text(b.first_name), normalize_text(b.last_name))))
+    similarity = SequenceMatcher(None, name_a, name_b).ratio()
+    if similarity >= 0.8:
+        total += 0.3 * similarity
+        reasons.append("name")
+    if a.birthdate and a.birthdate == b.birthdate:
+        total += 0.1
+        reasons.append("birthdate")
+    return min(total, 1.0), reasons
+
+
+def find_duplicates(rows: list[ContactRow], min_score: float = MIN_SCORE) -> list[dict]:
+    """
+    The find_duplicates function groups contacts by their blocking keys and scores the pairs within each group.
+
+    :param rows: list[ContactRow]: The contacts of one user
+    :param min_score: float: Pairs scoring below this are left out
+    :return: A list of dictionaries with the ids of the pair, the score and the reasons, best matches first
+    """
+    blocks = defaultdict(list)
+    for row in rows:
+        for key in blocking_keys(row):
+            blocks[key].append(row)
+    seen, pairs = set(), []
+    for block in blocks.values():
+        if len(block) > MAX_BLOCK_SIZE:
+            continue
+        for a, b in combinations(block, 2):
+            ids = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+            if ids in seen:
+                continue
+            seen.add(ids)
+            value, reasons = score(a, b)
+            if value >= min_score:
+                pairs.append({"ids": list(ids), "score": round(value, 3), "reasons": reasons})
+    pairs.sort(key=lambda pair: (-pair["score"], pair["ids"]))
+    return pairs
+
+
+async def find_duplicates_async(rows: list[ContactRow]) -> list[dict]:
+    """
+    The find_duplicates_async function runs find_duplicates without blocking the event loop.
+    Address books of PROCESS_THRESHOLD contacts or more are matched in a worker process,
+    so the scoring does not hold the GIL of the web process.
+
+    :param rows: list[ContactRow]: The contacts of one user
+    :return: The result of find_duplicates
+    """
+    global _executor
+    loop = asyncio.get_running_loop()
+    if len(rows) < PROCESS_THRESHOLD:
+        return await loop.run_in_executor(None, find_duplicates, rows)
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+    return await loop.run_in_executor(_executor, find_duplicates, rows)
+
+
+def shutdown() -> None:
+    """
+    The shutdown function stops the worker processes, if any were started.
+
+    :return: None
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,28 +1,61 @@
+from functools import lru_cache
 from pathlib import Path
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
+from src.conf.config import settings
 from src.services.auth import auth_service
-from dotenv import load_dotenv
-import os
+import logging
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 
+@lru_cache
+def get_mailer():
+    """
+    The get_mailer function builds the mail client on first use.
+    fastapi_mail is imported here rather than at the top of the module: it is the slowest import of the app,
+    and most processes never send an email.
+
+    :return: The FastMail client
+    """
+    from fastapi_mail import FastMail, ConnectionConfig
+    return FastMail(ConnectionConfig(
+        MAIL_USERNAME=settings.mail_username,
+        MAIL_PASSWORD=settings.mail_password,
+        MAIL_FROM=settings.mail_from,
+        MAIL_PORT=settings.mail_port,
+        MAIL_SERVER=settings.mail_server,
+        MAIL_FROM_NAME="Desired Name",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+    ))
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
-    MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM=os.getenv("MAIL_FROM"),
-    MAIL_PORT=os.getenv("MAIL_PORT"),
-    MAIL_SERVER=os.getenv("MAIL_SERVER"),
-    MAIL_FROM_NAME="Desired Name",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+
+async def send_message(email: EmailStr, subject: str, template_body: dict, template_name: str):
+    """
+    The send_message function renders an html template and sends it to one recipient.
+    A failure to reach the mail server is logged, not raised, the emails are sent from background tasks.
+
+    :param email: EmailStr: Specify the email address of the recipient
+    :param subject: str: The subject of the email
+    :param template_body: dict: The variables of the template
+    :param template_name: str: The template in src/services/templates
+    :return: None
+    """
+    from fastapi_mail import MessageSchema, MessageType
+    from fastapi_mail.errors import ConnectionErrors
+    try:
+        message = MessageSchema(
+            subject=subject,
+            recipients=[email],
+            template_body=template_body,
+            subtype=MessageType.html
+        )
+        await get_mailer().send_message(message, template_name=template_name)
+    except ConnectionErrors as err:
+        logger.error("Could not send email: %s", err)
 
 
 async def send_email(email: EmailStr, username: str, host: str):
@@ -38,18 +71,9 @@ async def send_email(email: EmailStr, username: str, host: str):
     :param host: str: Pass in the hostname of the server to be used in the email template
     :return: A coroutine object
     """
-    try:
-        token_verification = await auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    token_verification = await auth_service.create_email_token({"sub": email})
+    await send_message(email, "Confirm your email ", {"host": host, "username": username, "token": token_verification},
+                       "email_template.html")
 
 
 async def send_recovery_email(email: EmailStr, username: str, host: str):
@@ -65,15 +89,20 @@ async def send_recovery_email(email: EmailStr, username: str, host: str):
     :param host: str: Pass the host url to the template
     :return: A coroutine object, which is a special type of object that can be used with asyncio
     """
-    try:
-        token_verification = await auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_recovery_template.html")
-    except ConnectionErrors as err:
-        print(err)
\ No newline at end of file
+    token_verification = await auth_service.create_email_token({"sub": email})
+    await send_message(email, "Confirm your email ", {"host": host, "username": username, "token": token_verification},
+                       "email_recovery_template.html")
+
+
+async def send_birthday_digest(email: EmailStr, username: str, birthdays: list[dict], host: str):
+    """
+    The send_birthday_digest function sends a user the list of their contacts with a birthday in the coming days.
+
+    :param email: EmailStr: Specify the email address of the user
+    :param username: str: Personalize the email message
+    :param birthdays: list[dict]: The date, name and age of each birthday, soonest first
+    :param host: str: Pass the host url to the template
+    :return: A coroutine object
+    """
+    await send_message(email, "Upcoming birthdays", {"host": host, "username": username, "birthdays": birthdays},
+                       "birthday_digest_template.html")
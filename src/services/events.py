@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from redis.asyncio import Redis
+from src.conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "contacts:"
+
+
+class ContactEvents:
+    """
+    Fan-out of contact changes to the SSE streams of every process.
+
+    publish is called from the repository, which runs in worker threads. It hands the event to the event loop
+    and returns at once; a background task sends it to the Redis channel contacts:<user_id>.
+    One pattern subscription per process receives the events of every user and puts them on the bounded queue
+    of each open stream of that user. A stream that does not keep up loses its queued events and gets a single
+    resync event instead, telling the client to catch up with GET /contacts/changes.
+    """
+
+    def __init__(self):
+        self.queue_size = settings.sse_queue_size
+        self.outbox_size = settings.sse_outbox_size
+        self.heartbeat = settings.sse_heartbeat_seconds
+        self.subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._outbox: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self, r: Redis) -> None:
+        """
+        The start function starts the publishing task and the subscription. It is called from the app lifespan.
+
+        :param self: Represent the instance of the class
+        :param r: Redis: The shared Redis client
+        :return: None
+        """
+        self._loop = asyncio.get_running_loop()
+        self._outbox = asyncio.Queue(maxsize=self.outbox_size)
+        self._tasks = [asyncio.create_task(self._publish_loop(r)), asyncio.create_task(self._subscribe_loop(r))]
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the background tasks and ends the open streams.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self._loop = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queues in self.subscribers.values():
+            for queue in queues:
+                self._offer(queue, None)
+
+    def publish(self, user_id: int, event: str, contact_id: int) -> None:
+        """
+        The publish function announces a change of a contact. It is safe to call from any thread,
+        never blocks, and does nothing when the publisher is not started, e.g. in scripts.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the contact
+        :param event: str: created, updated or deleted
+        :param contact_id: int: The id of the contact
+        :return: None
+        """
+        loop = self._loop
+        if loop is None:
+            return
+        message = json.dumps({"event": event, "id": contact_id})
+        try:
+            loop.call_soon_threadsafe(self._enqueue, user_id, message)
+        except RuntimeError:
+            pass
+
+    def _enqueue(self, user_id: int, message: str) -> None:
+        try:
+            self._outbox.put_nowait((user_id, message))
+        except asyncio.QueueFull:
+            logger.warning("Contact event dropped, the outbox is full")
+
+    async def _publish_loop(self, r: Redis) -> None:
+        while True:
+            user_id, message = await self._outbox.get()
+            try:
+                await r.publish(f"{CHANNEL_PREFIX}{user_id}", message)
+            except Exception as err:
+                logger.warning("Could not publish contact event: %s", err)
+
+    async def _subscribe_loop(self, r: Redis) -> None:
+        while True:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(CHANNEL_PREFIX + "*")
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    channel = message["channel"]
+                    channel = channel.decode() if isinstance(channel, bytes) else channel
+                    data = message["data"]
+                    self.dispatch(int(channel[len(CHANNEL_PREFIX):]),
+                                  data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.warning("Contact event subscription failed, reconnecting: %s", err)
+                self.dispatch_all(json.dumps({"event": "resync"}))
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, message: str | None) -> None:
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(json.dumps({"event": "resync"}) if message is not None else None)
+
+    def dispatch(self, user_id: int, message: str) -> None:
+        """
+        The dispatch function puts an event on the queue of every open stream of a user.
+        A full queue is emptied and gets a resync event, so a slow client never holds up the others.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the contact
+        :param message: str: The event, encoded as JSON
+        :return: None
+        """
+        for queue in self.subscribers.get(user_id, ()):
+            self._offer(queue, message)
+
+    def dispatch_all(self, message: str) -> None:
+        for user_id in list(self.subscribers):
+            self.dispatch(user_id, message)
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """
+        The subscribe function registers a stream of a user.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The user whose changes are streamed
+        :return: The queue the events of the stream are put on
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    async def stream(self, user_id: int, request):
+        """
+        The stream function yields the server-sent events of one connection: the contact events of the user,
+        and a comment line every heartbeat seconds so proxies keep the idle connection open
+        and a closed connection is noticed.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The user whose changes are streamed
+        :param request: Request: The request of the stream, used to detect disconnects
+        :return: An async generator of SSE frames
+        """
+        queue = self.subscribe(user_id)
+        try:
+            yield f"retry: {int(self.heartbeat * 1000)}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    return
+                yield f"data: {message}\n\n"
+        finally:
+            self.unsubscribe(user_id, queue)
+
+
+contact_events = ContactEvents()
@@ -0,0 +1,142 @@
+import base64
+import hashlib
+import json
+import logging
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
+from src.conf.config import settings
+from src.database.cache import get_redis
+from src.services.auth import auth_service
+from src.services.rate_limit import RateLimit, contacts_limit
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "idempotency:"
+HEADER = "idempotency-key"
+REPLAY_HEADER = "Idempotent-Replayed"
+STORED_HEADERS = ("content-type", "location")
+# Outcomes that can change on retry, e.g. after the client refreshed its token or waited out a rate limit
+NOT_STORED = {401, 403, 408, 409, 429}
+
+
+class Idempotency:
+    """
+    Replay of write requests retried with the same Idempotency-Key header.
+
+    The first request with a key claims it with SET NX, runs, and stores its response for IDEMPOTENCY_TTL_SECONDS.
+    A retry with the same key gets the stored response back without touching the database. A retry that arrives
+    while the first request is still running gets 409, and a key reused with a different body gets 422.
+    Keys are scoped by the user the access token was issued to, so a retry with a refreshed token is still replayed
+    and users cannot see each other's responses. Requests without a valid access token, or with a revoked one,
+    are passed through, and a replay is charged to the rate limit of the route like the original request.
+    Server errors and outcomes that can change on retry are not stored, so the request can be retried.
+    """
+    methods = ("POST", "PUT", "PATCH")
+
+    def __init__(self, prefixes: tuple[str, ...] = ("/contacts",), limit: RateLimit = contacts_limit):
+        self.prefixes = prefixes
+        self.limit = limit
+        self.ttl = settings.idempotency_ttl_seconds
+        self.lock_ttl = settings.idempotency_lock_seconds
+
+    def applies(self, request: Request) -> bool:
+        return (request.method in self.methods and HEADER in request.headers
+                and request.url.path.startswith(self.prefixes))
+
+    @staticmethod
+    def _digest(*parts: bytes) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(hashlib.sha256(part).digest())
+        return digest.hexdigest()
+
+    @staticmethod
+    async def _owner(request: Request) -> str | None:
+        """
+        The _owner function returns the user the access token of the request was issued to.
+
+        :param request: Request: The incoming request
+        :return: The sub claim of the token, or None without a valid access token or when it was revoked
+        """
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        try:
+            payload = await auth_service.decode_access_token(token)
+        except HTTPException:
+            return None
+        if not payload.get("sub"):
+            return None
+        try:
+            if await auth_service.is_revoked(payload):
+                return None
+        except Exception as err:
+            logger.warning("Idempotency revocation check failed: %s", err)
+            return None
+        return payload["sub"]
+
+    async def __call__(self, request: Request, call_next) -> Response:
+        """
+        The __call__ function runs a request under its idempotency key, or replays the stored response.
+        Requests without the header are passed through.
+
+        :param self: Represent the instance of the class
+        :param request: Request: The incoming request
+        :param call_next: Call the next handler in the chain
+        :return: The response of the route, or the stored one
+        """
+        if not self.applies(request):
+            return await call_next(request)
+        key = request.headers[HEADER]
+        if not 0 < len(key) <= 255:
+            return JSONResponse({"detail": "Idempotency-Key must be 1 to 255 characters"},
+                                status_code=status.HTTP_400_BAD_REQUEST)
+        owner = await self._owner(request)
+        if owner is None:
+            # the route rejects the request, there is nothing to replay
+            return await call_next(request)
+        body = await request.body()
+        fingerprint = self._digest(request.method.encode(), request.url.path.encode(), body)
+        redis_key = PREFIX + self._digest(owner.encode(), key.encode())
+        r = get_redis()
+        try:
+            claimed = await r.set(redis_key, json.dumps({"fingerprint": fingerprint}), nx=True, ex=self.lock_ttl)
+            stored = None if claimed else await r.get(redis_key)
+        except Exception as err:
+            logger.warning("Idempotency check failed: %s", err)
+            return await call_next(request)
+
+        if stored is not None:
+            stored = json.loads(stored)
+            if stored["fingerprint"] != fingerprint:
+                return JSONResponse({"detail": "Idempotency-Key was used with a different request"},
+                                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if "status" not in stored:
+                return JSONResponse({"detail": "A request with this Idempotency-Key is in progress"},
+                                    status_code=status.HTTP_409_CONFLICT, headers={"Retry-After": "1"})
+            replay = Response(base64.b64decode(stored["body"]), status_code=stored["status"],
+                              headers={**stored["headers"], REPLAY_HEADER: "true"})
+            try:
+                await self.limit(request, replay)
+            except HTTPException as err:
+                return JSONResponse({"detail": err.detail}, status_code=err.status_code, headers=err.headers)
+            return replay
+
+        try:
+            response = await call_next(request)
+        except Exception:
+            await r.delete(redis_key)
+            raise
+        if response.status_code >= 500 or response.status_code in NOT_STORED:
+            await r.delete(redis_key)
+            return response
+        content = b"".join([chunk async for chunk in response.body_iterator])
+        headers = {name: value for name, value in response.headers.items() if name in STORED_HEADERS}
+        await r.set(redis_key, json.dumps({"fingerprint": fingerprint, "status": response.status_code,
+                                           "headers": headers, "body": base64.b64encode(content).decode()}),
+                    ex=self.ttl)
+        return Response(content, status_code=response.status_code, headers=dict(response.headers),
+                        background=response.background)
+
+
+idempotency = Idempotency()
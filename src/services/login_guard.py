@@ -0,0 +1,119 @@
+import logging
+import math
+import time
+from fastapi import HTTPException, status
+from src.conf.config import settings
+from src.database.cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+FAIL_PREFIX = "login:fail:"
+LOCK_PREFIX = "login:lock:"
+
+# KEYS: failure counter and lock of the account, then of the IP
+# ARGV: window, account threshold, IP threshold, base lockout, max lockout (seconds), now (milliseconds)
+RECORD_FAILURE_SCRIPT = """
+local window = tonumber(ARGV[1])
+local base = tonumber(ARGV[4])
+local max = tonumber(ARGV[5])
+local now = tonumber(ARGV[6])
+local lockout = 0
+for i, threshold in ipairs({tonumber(ARGV[2]), tonumber(ARGV[3])}) do
+    local counter = KEYS[2 * i - 1]
+    local count = redis.call('INCR', counter)
+    if count == 1 then
+        redis.call('EXPIRE', counter, window)
+    end
+    if count >= threshold then
+        local seconds = math.min(max, base * 2 ^ (count - threshold))
+        redis.call('SET', KEYS[2 * i], tostring(now + seconds * 1000), 'PX', math.ceil(seconds * 1000))
+        lockout = math.max(lockout, seconds)
+    end
+end
+return tostring(lockout)
+"""
+
+
+class LoginGuard:
+    """
+    Failed-login counters per account and per IP with progressive lockout.
+
+    Every failed attempt increments both counters. Once a counter reaches its threshold, the account or IP is
+    locked, and every further failure doubles the lockout up to LOGIN_LOCKOUT_MAX_SECONDS. The locks are checked
+    with one MGET before the user is loaded and before bcrypt runs, so rejected attempts cost no DB or CPU work.
+    A successful login clears the counter of the account. The IP counter only expires, so one valid account
+    cannot be used to reset it between guesses against other accounts.
+    """
+
+    def __init__(self):
+        self.account_threshold = settings.login_account_threshold
+        self.ip_threshold = settings.login_ip_threshold
+        self.window = settings.login_failure_window_seconds
+        self.lockout = settings.login_lockout_seconds
+        self.max_lockout = settings.login_lockout_max_seconds
+
+    @staticmethod
+    def _keys(prefix: str, email: str, ip: str) -> list[str]:
+        return [f"{prefix}account:{email.lower()}", f"{prefix}ip:{ip}"]
+
+    async def check(self, email: str, ip: str) -> None:
+        """
+        The check function rejects the attempt with 429 if the account or the IP is locked.
+        A Redis outage lets the attempt through.
+
+        :param self: Represent the instance of the class
+        :param email: str: The username sent to the login form
+        :param ip: str: The address of the client
+        :return: None
+        """
+        try:
+            locks = await get_redis().mget(self._keys(LOCK_PREFIX, email, ip))
+        except Exception as err:
+            logger.warning("Login lockout check failed: %s", err)
+            return
+        until = max((float(lock) for lock in locks if lock is not None), default=None)
+        if until is None:
+            return
+        retry_after = max(1, math.ceil(until / 1000 - time.time()))
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            detail="Too many failed login attempts", headers={"Retry-After": str(retry_after)})
+
+    async def failed(self, email: str, ip: str) -> float:
+        """
+        The failed function records a failed attempt against the account and the IP.
+
+        :param self: Represent the instance of the class
+        :param email: str: The username sent to the login form
+        :param ip: str: The address of the client
+        :return: The lockout in seconds that the attempt triggered, 0 if none
+        """
+        fail_account, fail_ip = self._keys(FAIL_PREFIX, email, ip)
+        lock_account, lock_ip = self._keys(LOCK_PREFIX, email, ip)
+        try:
+            script = get_redis().register_script(RECORD_FAILURE_SCRIPT)
+            lockout = await script(keys=[fail_account, lock_account, fail_ip, lock_ip],
+                                   args=[self.window, self.account_threshold, self.ip_threshold,
+                                         self.lockout, self.max_lockout, int(time.time() * 1000)])
+        except Exception as err:
+            logger.warning("Could not record failed login: %s", err)
+            return 0
+        lockout = float(lockout)
+        if lockout:
+            logger.warning("Login locked", extra={"email": email, "ip": ip, "lockout_seconds": lockout})
+        return lockout
+
+    async def succeeded(self, email: str) -> None:
+        """
+        The succeeded function clears the failure counter and lock of the account.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user who logged in
+        :return: None
+        """
+        try:
+            await get_redis().delete(FAIL_PREFIX + "account:" + email.lower(), LOCK_PREFIX + "account:" + email.lower())
+        except Exception as err:
+            logger.warning("Could not reset failed logins: %s", err)
+
+
+login_guard = LoginGuard()
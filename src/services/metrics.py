@@ -0,0 +1,164 @@
+import time
+from functools import wraps
+from typing import Callable
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from src.conf.config import settings
+
+# With several worker processes, see src/conf/gunicorn.py, every process writes its metrics to files in
+# PROMETHEUS_MULTIPROC_DIR and /metrics adds them up. Gauges computed on scrape are not supported in that mode,
+# so they are set after every request instead, see refresh_gauges.
+MULTIPROCESS = bool(settings.prometheus_multiproc_dir)
+_gauge_functions: list[tuple[Gauge, Callable[[], float]]] = []
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time, the _count series is the number of queries",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections held by the SQLAlchemy pool",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+USER_CACHE_REQUESTS = Counter(
+    "user_cache_requests_total",
+    "Lookups of the authenticated user in the Redis cache",
+    ["result"],
+)
+REDIS_POOL_CONNECTIONS = Gauge(
+    "redis_pool_connections",
+    "Connections of the shared Redis pool",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+BCRYPT_QUEUE_TIME = Histogram(
+    "bcrypt_queue_seconds",
+    "Time a bcrypt job waited for a worker thread",
+    ["operation"],
+)
+BCRYPT_DURATION = Histogram(
+    "bcrypt_duration_seconds",
+    "Time spent hashing or verifying a password",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0),
+)
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+def sql_operation(statement: str) -> str:
+    """
+    The sql_operation function maps a SQL statement to a low-cardinality metric label.
+
+    :param statement: str: The SQL statement sent to the database
+    :return: The leading keyword of the statement, or OTHER
+    """
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in SQL_OPERATIONS else "OTHER"
+
+
+def track_gauge(gauge: Gauge, function: Callable[[], float]) -> None:
+    """
+    The track_gauge function makes a gauge report the value of a function.
+
+    :param gauge: Gauge: The gauge, with its labels
+    :param function: Callable[[], float]: Computes the value
+    :return: None
+    """
+    if MULTIPROCESS:
+        _gauge_functions.append((gauge, function))
+    else:
+        gauge.set_function(function)
+
+
+def refresh_gauges() -> None:
+    """
+    The refresh_gauges function sets the gauges tracked in multiprocess mode to their current value.
+
+    :return: None
+    """
+    for gauge, function in _gauge_functions:
+        gauge.set(function())
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    The instrument_engine function attaches query timing and pool metrics to a SQLAlchemy engine.
+
+    :param engine: Engine: The engine to instrument
+    :return: None
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        DB_QUERY_DURATION.labels(sql_operation(statement)).observe(time.perf_counter() - start)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+
+    pool = engine.pool
+    connect = pool.connect
+
+    @wraps(connect)
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+
+    for state in ("checkedout", "checkedin", "overflow", "size"):
+        # not every pool class has these, and SingletonThreadPool.size is a plain number
+        if callable(getattr(pool, state, None)):
+            track_gauge(DB_POOL_CONNECTIONS.labels(state), getattr(pool, state))
+
+
+def instrument_redis_pool(pool) -> None:
+    """
+    The instrument_redis_pool function exposes the usage of a redis-py connection pool as gauges.
+
+    :param pool: The redis.asyncio connection pool
+    :return: None
+    """
+    track_gauge(REDIS_POOL_CONNECTIONS.labels("in_use"), lambda: len(pool._in_use_connections))
+    track_gauge(REDIS_POOL_CONNECTIONS.labels("available"), lambda: len(pool._available_connections))
+    REDIS_POOL_CONNECTIONS.labels("max").set(pool.max_connections)
+
+
+def latest_metrics() -> tuple[bytes, str]:
+    """
+    The latest_metrics function renders every registered metric in the Prometheus text format.
+
+    :return: The payload and its content type
+    """
+    if not MULTIPROCESS:
+        return generate_latest(), CONTENT_TYPE_LATEST
+    refresh_gauges()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,24 @@
+from functools import lru_cache
+import phonenumbers
+from src.conf.config import settings
+
+DEFAULT_REGION = settings.phone_default_region
+
+
+@lru_cache(maxsize=4096)
+def to_e164(number: str, region: str = DEFAULT_REGION) -> str | None:
+    """
+    The to_e164 function normalizes a phone number to the E.164 format, e.g. +380501234567.
+    Numbers written without a country code are read as numbers of the default region.
+
+    :param number: str: The phone number as entered
+    :param region: str: The region assumed for numbers without a country code
+    :return: The number in E.164 format, or None if it is not a valid phone number
+    """
+    try:
+        parsed = phonenumbers.parse(number, region)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(parsed):
+        return None
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
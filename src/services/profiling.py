@@ -0,0 +1,237 @@
+import hmac
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from src.conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Timeline:
+    """
+    A per-request list of timed spans, plus the SQL statements executed while serving the request.
+    """
+
+    def __init__(self, method: str, path: str, explain: bool = False):
+        self.method = method
+        self.path = path
+        self.explain = explain
+        self.started = time.perf_counter()
+        self.spans = []
+        self.statements = []
+
+    def add(self, name: str, started: float, finished: float, **extra):
+        """
+        The add function records a finished span relative to the start of the request.
+
+        :param self: Represent the instance of the class
+        :param name: str: The name of the span, e.g. auth.decode or sql
+        :param started: float: perf_counter value when the span started
+        :param finished: float: perf_counter value when the span finished
+        :param extra: Additional fields stored with the span
+        :return: None
+        """
+        self.spans.append({
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round((finished - started) * 1000, 3),
+            **extra,
+        })
+
+    def as_dict(self) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "spans": self.spans,
+        }
+
+
+current_timeline: ContextVar[Timeline | None] = ContextVar("current_timeline", default=None)
+
+
+@contextmanager
+def span(name: str, **extra):
+    """
+    The span function times a block of code and records it on the timeline of the current request.
+    It does nothing when the current request is not being profiled.
+
+    :param name: str: The name of the span
+    :param extra: Additional fields stored with the span
+    :return: A context manager
+    """
+    timeline = current_timeline.get()
+    if timeline is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timeline.add(name, started, time.perf_counter(), **extra)
+
+
+def _shorten(parameters, limit: int = 200) -> str:
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class Profiler:
+    """
+    Runtime switches for request profiling and the slow-query log.
+
+    Defaults come from the environment. They can be changed on a running server without a restart
+    by writing the fields to the profiling:config hash in Redis, e.g.
+    HSET profiling:config enabled 1 sample_rate 0.01 slow_query_ms 100
+
+    The debug headers are only honoured on requests that also send PROFILING_DEBUG_TOKEN in X-Debug-Token.
+    Without a token configured they are ignored, so clients cannot make the server run EXPLAIN for them.
+    """
+    config_key = "profiling:config"
+    debug_header = "x-debug-profile"
+    explain_header = "x-debug-explain"
+    token_header = "x-debug-token"
+
+    def __init__(self):
+        self.enabled = settings.profiling_enabled
+        self.sample_rate = settings.profiling_sample_rate
+        self.slow_query_ms = settings.slow_query_ms
+        self.refresh_interval = settings.profiling_refresh_seconds
+        self.debug_token = settings.profiling_debug_token
+        self._refreshed_at = float("-inf")
+        self.engine = None
+
+    async def refresh(self, r) -> None:
+        """
+        The refresh function reloads the switches from Redis, at most once per refresh_interval.
+        Errors are ignored so that a Redis outage never fails a request.
+
+        :param self: Represent the instance of the class
+        :param r: The Redis client
+        :return: None
+        """
+        now = time.monotonic()
+        if now - self._refreshed_at < self.refresh_interval:
+            return
+        self._refreshed_at = now
+        try:
+            config = await r.hgetall(self.config_key)
+        except Exception as err:
+            logger.debug("Could not load profiling config: %s", err)
+            return
+        config = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+                  for k, v in config.items()}
+        if "enabled" in config:
+            self.enabled = config["enabled"] == "1"
+        if "sample_rate" in config:
+            self.sample_rate = float(config["sample_rate"])
+        if "slow_query_ms" in config:
+            self.slow_query_ms = float(config["slow_query_ms"])
+
+    def debug_allowed(self, request) -> bool:
+        """
+        The debug_allowed function tells whether the request may use the debug headers.
+
+        :param self: Represent the instance of the class
+        :param request: Request: The incoming request
+        :return: True if the request carries the configured debug token
+        """
+        token = request.headers.get(self.token_header)
+        return bool(self.debug_token and token) and hmac.compare_digest(token.encode(), self.debug_token.encode())
+
+    def start(self, request) -> Timeline | None:
+        """
+        The start function decides whether a request is profiled and creates its timeline.
+        A request is profiled when profiling is enabled and it either is sampled or carries the debug header
+        along with the debug token.
+
+        :param self: Represent the instance of the class
+        :param request: Request: The incoming request
+        :return: A Timeline, or None if the request is not profiled
+        """
+        if not self.enabled:
+            return None
+        debug = self.debug_allowed(request)
+        if not (debug and request.headers.get(self.debug_header) == "1") and random.random() >= self.sample_rate:
+            return None
+        return Timeline(request.method, request.url.path,
+                        explain=debug and request.headers.get(self.explain_header) == "1")
+
+    def _explain(self, timeline: Timeline) -> None:
+        current_timeline.set(None)
+        prefix = "EXPLAIN QUERY PLAN " if self.engine.dialect.name == "sqlite" else "EXPLAIN "
+        with self.engine.connect() as conn:
+            for item in timeline.statements:
+                if not item["statement"].lstrip().upper().startswith("SELECT"):
+                    continue
+                rows = conn.exec_driver_sql(prefix + item["statement"], item["parameters"]).fetchall()
+                item["span"]["plan"] = [" ".join(str(col) for col in row) for row in rows]
+
+    async def finish(self, timeline: Timeline, response) -> None:
+        """
+        The finish function runs EXPLAIN for the recorded SELECT statements if it was requested,
+        logs the timeline and adds a Server-Timing header to the response.
+
+        :param self: Represent the instance of the class
+        :param timeline: Timeline: The timeline of the finished request
+        :param response: Response: The response to annotate
+        :return: None
+        """
+        if timeline.explain and self.engine is not None:
+            await run_in_threadpool(self._explain, timeline)
+        report = timeline.as_dict()
+        logger.info("request profile", extra={"profile": report})
+        response.headers["Server-Timing"] = f'total;dur={report["total_ms"]}'
+
+    def instrument_engine(self, engine: Engine) -> None:
+        """
+        The instrument_engine function attaches the slow-query log and the per-request SQL spans to an engine.
+
+        :param self: Represent the instance of the class
+        :param engine: Engine: The engine to instrument
+        :return: None
+        """
+        self.engine = engine
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info["profile_start"].pop()
+            finished = time.perf_counter()
+            duration_ms = (finished - started) * 1000
+            if self.slow_query_ms and duration_ms >= self.slow_query_ms:
+                logger.warning("slow query", extra={"duration_ms": round(duration_ms, 3), "statement": statement,
+                                                    "parameters": _shorten(parameters)})
+            timeline = current_timeline.get()
+            if timeline is not None:
+                timeline.add("sql", started, finished, statement=statement)
+                if timeline.explain and not executemany:
+                    timeline.statements.append({"statement": statement, "parameters": parameters,
+                                                "span": timeline.spans[-1]})
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(context):
+            if context.connection is not None and context.connection.info.get("profile_start"):
+                context.connection.info["profile_start"].pop()
+
+
+profiler = Profiler()
+
+
+class ProfiledJSONResponse(JSONResponse):
+    """
+    JSONResponse that records the time spent rendering the body as the serialize span.
+    """
+
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return super().render(content)
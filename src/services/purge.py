@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from redis.asyncio import Redis
+from sqlalchemy import select, func
+from sqlalchemy.orm import sessionmaker
+from src.conf.config import settings
+from src.database.shards import contact_databases
+from src.repository.contacts import purge_deleted, purge_tombstones
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "purge:lock"
+
+
+def parse_hours(value: str) -> tuple[int, int] | None:
+    """
+    The parse_hours function parses a window of hours such as 2-5 (from 02:00 to 05:00) or 22-4 (over midnight).
+
+    :param value: str: The window, empty for no window
+    :return: The first hour and the hour after the last, or None for no window
+    """
+    if not value.strip():
+        return None
+    start, end = (int(part) for part in value.split("-"))
+    if not (0 <= start < 24 and 0 <= end <= 24):
+        raise ValueError(f"Invalid hours {value!r}, expected e.g. 2-5")
+    return start, end
+
+
+class PurgeWorker:
+    """
+    Removes deleted contacts once they are older than PURGE_RETENTION_DAYS, the window in which they can
+    be restored. Deleting only marks contacts, so the rows are removed here in transactions of PURGE_BATCH_SIZE
+    contacts with a pause between them, and only within PURGE_HOURS (server time), e.g. 2-5 at night.
+    The tombstones older than the same window are removed with them, GET /contacts/changes then asks clients
+    with older sync tokens for a full resync.
+    Each process runs the worker, a Redis lock makes sure only one of them purges at a time. The lock is refreshed
+    after every batch and released when the run ends.
+    """
+
+    def __init__(self):
+        self.retention = timedelta(days=settings.purge_retention_days)
+        self.batch_size = settings.purge_batch_size
+        self.pause = settings.purge_pause_seconds
+        self.interval = settings.purge_interval_seconds
+        self.lock_seconds = settings.purge_lock_seconds
+        self.hours = parse_hours(settings.purge_hours)
+        self.enabled = settings.purge_enabled
+        self._task: asyncio.Task | None = None
+
+    def in_window(self, now: datetime) -> bool:
+        """
+        The in_window function tells whether the purge may run at the given time.
+
+        :param self: Represent the instance of the class
+        :param now: datetime: The time to check
+        :return: True if the time is within PURGE_HOURS
+        """
+        if self.hours is None:
+            return True
+        start, end = self.hours
+        if start <= end:
+            return start <= now.hour < end
+        return now.hour >= start or now.hour < end
+
+    def purge_chunk(self, factory: sessionmaker) -> int:
+        """
+        The purge_chunk function removes one batch of expired contacts and one of expired tombstones from a database.
+
+        :param self: Represent the instance of the class
+        :param factory: sessionmaker: The session factory of the database
+        :return: The number of rows removed
+        """
+        with factory() as db:
+            before = db.scalar(select(func.now())) - self.retention
+            return purge_deleted(before, self.batch_size, db) + purge_tombstones(before, self.batch_size, db)
+
+    async def run(self, window: bool = True, r: Redis | None = None) -> int:
+        """
+        The run function purges every database in batches until nothing is left to purge
+        or, if window is set, until the window closes.
+
+        :param self: Represent the instance of the class
+        :param window: bool: Stop when PURGE_HOURS is over
+        :param r: Redis: The client holding the lock, which is refreshed after every batch; None when run from cron
+        :return: The number of rows removed
+        """
+        total = 0
+        for factory in contact_databases():
+            while not window or self.in_window(datetime.now()):
+                removed = await run_in_threadpool(self.purge_chunk, factory)
+                total += removed
+                if r is not None:
+                    await r.expire(LOCK_KEY, self.lock_seconds)
+                if removed < self.batch_size:
+                    break
+                await asyncio.sleep(self.pause)
+        if total:
+            logger.info("Deleted contacts purged", extra={"rows": total})
+        return total
+
+    async def _loop(self, r: Redis) -> None:
+        while True:
+            try:
+                if self.in_window(datetime.now()) and await r.set(LOCK_KEY, os.getpid(), nx=True, ex=self.lock_seconds):
+                    try:
+                        await self.run(r=r)
+                    finally:
+                        await r.delete(LOCK_KEY)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.warning("Purge failed: %s", err)
+            await asyncio.sleep(self.interval)
+
+    async def start(self, r: Redis) -> None:
+        """
+        The start function starts the background purge. It is called from the app lifespan.
+
+        :param self: Represent the instance of the class
+        :param r: Redis: The shared Redis client
+        :return: None
+        """
+        if self.enabled:
+            self._task = asyncio.create_task(self._loop(r))
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the background purge.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+purge_worker = PurgeWorker()
+
+
+if __name__ == "__main__":
+    # for cron: purge everything that has expired now, regardless of PURGE_HOURS
+    print(f"{asyncio.run(purge_worker.run(window=False))} rows purged")
@@ -0,0 +1,197 @@
+import ipaddress
+import logging
+import math
+import time
+from fastapi import HTTPException, Request, Response, status
+from jose import JWTError, jwt
+from src.conf.config import settings
+from src.database.cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "ratelimit:"
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = math.ceil((cost - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate))
+return {allowed, tostring(tokens), retry_after}
+"""
+
+
+def parse_networks(value: str) -> list | None:
+    """
+    The parse_networks function parses a comma-separated list of addresses and networks, e.g. 127.0.0.1,10.0.0.0/8.
+
+    :param value: str: The list, * for any address
+    :return: The networks, or None for any address
+    """
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    if "*" in items:
+        return None
+    return [ipaddress.ip_network(item, strict=False) for item in items]
+
+
+TRUSTED_PROXIES = parse_networks(settings.forwarded_allow_ips)
+
+
+def _trusted(address: str) -> bool:
+    if TRUSTED_PROXIES is None:
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_ip(request: Request) -> str:
+    """
+    The client_ip function returns the address of the client that sent the request.
+    X-Forwarded-For is only read when the request comes from a proxy listed in FORWARDED_ALLOW_IPS. It is read from
+    the right, skipping the trusted proxies, so a client cannot choose its address by sending the header itself.
+
+    :param request: Request: The incoming request
+    :return: The address of the client
+    """
+    address = request.client.host if request.client else "unknown"
+    if not _trusted(address):
+        return address
+    hops = [hop.strip() for header in request.headers.getlist("x-forwarded-for") for hop in header.split(",")]
+    for hop in reversed([hop for hop in hops if hop]):
+        address = hop
+        if not _trusted(hop):
+            break
+    return address
+
+
+async def client_identifier(request: Request) -> str:
+    """
+    The client_identifier function is the identifier of the fastapi-limiter limits: the client address and the path.
+    It replaces the default one, which takes X-Forwarded-For from any client.
+
+    :param request: Request: The incoming request
+    :return: The key of the limit
+    """
+    return client_ip(request) + ":" + request.scope["path"]
+
+
+def parse_rate(value: str) -> tuple[int, float]:
+    """
+    The parse_rate function parses a budget written as requests/seconds, e.g. 100/60.
+
+    :param value: str: The budget
+    :return: The number of requests and the period in seconds
+    """
+    times, seconds = value.split("/")
+    return int(times), float(seconds)
+
+
+class RateLimit:
+    """
+    A token-bucket rate limiter stored in Redis.
+
+    Each client has a bucket of `times` tokens that refills evenly over `seconds`, so short bursts are allowed
+    while the long-run rate stays bounded. The bucket is updated by a Lua script, one round-trip per check.
+    Authenticated requests are limited per user, anonymous ones per IP, see client_ip.
+    The budget can be overridden per route with RATE_LIMIT_<NAME>, e.g. RATE_LIMIT_CONTACTS=300/60,
+    and all limits are switched off with RATE_LIMIT_ENABLED=0.
+    """
+    secret_key = settings.secret_key
+    algorithm = settings.algorithm
+
+    def __init__(self, name: str, rate: str):
+        self.name = name
+        self.times, self.seconds = parse_rate(rate)
+        self.enabled = settings.rate_limit_enabled
+
+    def identify(self, request: Request) -> str:
+        """
+        The identify function returns the identity the bucket belongs to.
+        Only the signature of the bearer token is checked, the revocation checks are left to get_current_user.
+
+        :param self: Represent the instance of the class
+        :param request: Request: The incoming request
+        :return: user:<email> for a valid access token, ip:<address> otherwise
+        """
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token:
+            try:
+                payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+                if payload.get("scope") == "access_token" and payload.get("sub"):
+                    return "user:" + payload["sub"]
+            except JWTError:
+                pass
+        return "ip:" + client_ip(request)
+
+    async def hit(self, identity: str, cost: int = 1) -> tuple[bool, float, int]:
+        """
+        The hit function takes tokens from the bucket of an identity.
+
+        :param self: Represent the instance of the class
+        :param identity: str: The identity returned by identify
+        :param cost: int: The number of tokens the request costs
+        :return: Whether the request is allowed, the tokens left and the milliseconds until enough tokens are back
+        """
+        r = get_redis()
+        script = r.register_script(TOKEN_BUCKET_SCRIPT)
+        allowed, tokens, retry_after = await script(
+            keys=[f"{PREFIX}{self.name}:{identity}"],
+            args=[self.times, self.times / (self.seconds * 1000), int(time.time() * 1000), cost])
+        return allowed == 1, float(tokens), int(retry_after)
+
+    async def __call__(self, request: Request, response: Response):
+        """
+        The __call__ function lets the limiter be used as a dependency. It sets the RateLimit-* headers
+        on the response and raises 429 with a Retry-After header when the bucket is empty.
+        A Redis outage lets the request through rather than failing it.
+
+        :param self: Represent the instance of the class
+        :param request: Request: The incoming request
+        :param response: Response: The response whose headers are set
+        :return: None
+        """
+        if not self.enabled:
+            return
+        try:
+            allowed, tokens, retry_after = await self.hit(self.identify(request))
+        except Exception as err:
+            logger.warning("Rate limit check failed: %s", err)
+            return
+        reset = math.ceil((self.times - tokens) * self.seconds / self.times)
+        headers = {
+            "RateLimit-Limit": str(self.times),
+            "RateLimit-Remaining": str(int(tokens)),
+            "RateLimit-Reset": str(reset),
+        }
+        if not allowed:
+            headers["Retry-After"] = str(math.ceil(retry_after / 1000))
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests",
+                                headers=headers)
+        response.headers.update(headers)
+
+
+default_limit = RateLimit("default", settings.rate_limit_default)
+contacts_limit = RateLimit("contacts", settings.rate_limit_contacts)
+search_limit = RateLimit("search", settings.rate_limit_search)
+dates_limit = RateLimit("dates", settings.rate_limit_dates)
+login_limit = RateLimit("login", settings.rate_limit_login)
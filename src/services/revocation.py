@@ -0,0 +1,111 @@
+import time
+from redis.asyncio import Redis
+
+USER_PREFIX = "revoked:user:"
+JTI_PREFIX = "revoked:jti:"
+
+
+def _float(value) -> float | None:
+    return float(value) if value is not None else None
+
+
+class Revocations:
+    """
+    Revocation of access tokens before their exp.
+
+    Two kinds of entries live in Redis: a per-user "tokens issued at or before" timestamp, set on password reset,
+    and a denylist of single token ids (jti), set on logout. get_current_user fetches both in the same MGET
+    as the cached user, so checking them costs no extra round-trip. Everything seen is mirrored in-process,
+    which rejects known revoked tokens without asking Redis at all.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.revoked_before: dict[str, float] = {}
+        self.denied: dict[str, float] = {}
+
+    def keys(self, email: str, jti: str | None) -> list[str]:
+        """
+        The keys function returns the Redis keys to fetch along with the cached user.
+
+        :param self: Represent the instance of the class
+        :param email: str: The subject of the token
+        :param jti: str | None: The id of the token, older tokens have none
+        :return: The revoked-before key and the denylist key
+        """
+        return [USER_PREFIX + email, JTI_PREFIX + (jti or "")]
+
+    def _remember(self, email: str, revoked_before: float | None, jti: str | None, exp: float | None):
+        if len(self.denied) + len(self.revoked_before) >= self.max_entries:
+            now = time.time()
+            self.denied = {key: value for key, value in self.denied.items() if value > now}
+            if len(self.denied) + len(self.revoked_before) >= self.max_entries:
+                self.denied.clear()
+                self.revoked_before.clear()
+        if revoked_before is not None:
+            self.revoked_before[email] = max(revoked_before, self.revoked_before.get(email, 0))
+        if jti and exp is not None:
+            self.denied[jti] = exp
+
+    def is_revoked_locally(self, email: str, jti: str | None, iat: float) -> bool:
+        """
+        The is_revoked_locally function checks the in-process mirror only.
+
+        :param self: Represent the instance of the class
+        :param email: str: The subject of the token
+        :param jti: str | None: The id of the token
+        :param iat: float: The issued-at claim of the token
+        :return: True if the token is known to be revoked
+        """
+        if iat <= self.revoked_before.get(email, -1):
+            return True
+        return jti is not None and self.denied.get(jti, 0) > time.time()
+
+    def is_revoked(self, email: str, jti: str | None, iat: float, exp: float, revoked_before, denied) -> bool:
+        """
+        The is_revoked function checks the values fetched from Redis and mirrors them in-process.
+
+        :param self: Represent the instance of the class
+        :param email: str: The subject of the token
+        :param jti: str | None: The id of the token
+        :param iat: float: The issued-at claim of the token
+        :param exp: float: The expiry claim of the token
+        :param revoked_before: The value of the revoked-before key, or None
+        :param denied: The value of the denylist key, or None
+        :return: True if the token is revoked
+        """
+        revoked_before = _float(revoked_before)
+        self._remember(email, revoked_before, jti if denied is not None else None, exp)
+        return self.is_revoked_locally(email, jti, iat)
+
+    async def revoke_token(self, jti: str, exp: float, r: Redis) -> None:
+        """
+        The revoke_token function denylists one access token until it expires.
+
+        :param self: Represent the instance of the class
+        :param jti: str: The id of the token
+        :param exp: float: The expiry claim of the token
+        :param r: Redis: The Redis client
+        :return: None
+        """
+        ttl = int(exp - time.time()) + 1
+        if ttl > 0:
+            await r.set(JTI_PREFIX + jti, 1, ex=ttl)
+            self._remember("", None, jti, exp)
+
+    async def revoke_user(self, email: str, ttl: int, r: Redis) -> None:
+        """
+        The revoke_user function revokes every token of a user issued up to now.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :param ttl: int: How long to keep the marker, at least the lifetime of the longest-lived token
+        :param r: Redis: The Redis client
+        :return: None
+        """
+        now = time.time()
+        await r.set(USER_PREFIX + email, repr(now), ex=ttl)
+        self._remember(email, now, None, None)
+
+
+revocations = Revocations()
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+from fastapi.concurrency import run_in_threadpool
+from redis.asyncio import Redis
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from src.conf.config import settings
+from src.database.models import User
+from src.database.shards import contact_databases
+from src.repository.counters import reconcile_counters
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "stats:reconcile:lock"
+
+
+class StatsReconciler:
+    """
+    Recounts the contact counters of every user from the contacts every STATS_RECONCILE_SECONDS.
+    The write functions keep the counters current; this catches whatever they missed, e.g. rows changed
+    by hand, and drops the added:<date> counters that fell out of the period served.
+    Users are recounted one transaction each, STATS_RECONCILE_BATCH users between pauses.
+    Each process runs the job, a Redis lock makes sure only one of them does at a time.
+    """
+
+    def __init__(self):
+        self.interval = settings.stats_reconcile_seconds
+        self.batch_size = settings.stats_reconcile_batch
+        self.pause = settings.stats_reconcile_pause_seconds
+        self.enabled = settings.stats_reconcile_enabled
+        self._task: asyncio.Task | None = None
+
+    def reconcile_batch(self, factory: sessionmaker, after: int) -> tuple[int, int]:
+        """
+        The reconcile_batch function recounts the next batch of users of a database.
+
+        :param self: Represent the instance of the class
+        :param factory: sessionmaker: The session factory of the database
+        :param after: int: Users with an id up to this one are done
+        :return: The id of the last user recounted, 0 when there are no more, and the number of counters fixed
+        """
+        with factory() as db:
+            user_ids = db.execute(select(User.id).where(User.id > after).order_by(User.id).limit(self.batch_size))\
+                .scalars().all()
+            fixed = sum(reconcile_counters(user_id, db) for user_id in user_ids)
+        return (user_ids[-1] if user_ids else 0), fixed
+
+    async def run(self) -> int:
+        """
+        The run function recounts the counters of every user of every database.
+
+        :param self: Represent the instance of the class
+        :return: The number of counters that were off
+        """
+        total = 0
+        for factory in contact_databases():
+            after = 0
+            while True:
+                after, fixed = await run_in_threadpool(self.reconcile_batch, factory, after)
+                total += fixed
+                if not after:
+                    break
+                await asyncio.sleep(self.pause)
+        if total:
+            logger.warning("Contact counters reconciled", extra={"counters": total})
+        return total
+
+    async def _loop(self, r: Redis) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if await r.set(LOCK_KEY, os.getpid(), nx=True, ex=int(self.interval)):
+                    await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.warning("Contact counter reconciliation failed: %s", err)
+
+    async def start(self, r: Redis) -> None:
+        """
+        The start function starts the periodic reconciliation. It is called from the app lifespan.
+
+        :param self: Represent the instance of the class
+        :param r: Redis: The shared Redis client
+        :return: None
+        """
+        if self.enabled:
+            self._task = asyncio.create_task(self._loop(r))
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the periodic reconciliation.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+stats_reconciler = StatsReconciler()
+
+
+if __name__ == "__main__":
+    print(f"{asyncio.run(stats_reconciler.run())} counters fixed")
@@ -1,14 +1,49 @@
+import asyncio
+import os
+import tempfile
+from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+
+load_dotenv()
+
+# the auth tests log in, and fail to, more often than the production limits allow
+os.environ.setdefault("RATE_LIMIT_LOGIN", "1000/60")
+os.environ.setdefault("RATE_LIMIT_DEFAULT", "1000/60")
+os.environ.setdefault("LOGIN_ACCOUNT_THRESHOLD", "1000")
+os.environ.setdefault("LOGIN_IP_THRESHOLD", "1000")
+# the background jobs would race the tests, or send them email
+os.environ.setdefault("PURGE_ENABLED", "false")
+os.environ.setdefault("BIRTHDAY_DIGEST_ENABLED", "false")
+# Without TEST_DB_URL the tests run on a SQLite file of their own, and without REDIS_HOST on fakeredis,
+# so `pytest -n auto` needs no database or Redis server. Each pytest-xdist worker gets its own database;
+# workers inherit the environment of the controller, so the URL it was given is kept aside.
+os.environ.setdefault("TEST_DB_URL_GIVEN", os.getenv("TEST_DB_URL", ""))
+WORKER = os.getenv("PYTEST_XDIST_WORKER")
+if not os.environ["TEST_DB_URL_GIVEN"]:
+    os.environ["TEST_DB_URL"] = "sqlite:///" + os.path.join(tempfile.gettempdir(), f"contacts-test-{WORKER or 'main'}.db")
+elif WORKER:
+    # e.g. contacts_test becomes contacts_test_gw0, which must exist on Postgres
+    url = make_url(os.environ["TEST_DB_URL_GIVEN"])
+    root, ext = os.path.splitext(url.database)
+    os.environ["TEST_DB_URL"] = url.set(database=f"{root}_{WORKER}{ext}").render_as_string(hide_password=False)
+FAKE_REDIS = not os.getenv("REDIS_HOST")
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from main import app
-from src.database.models import Base
+from src.database.models import Base, User
 from src.database.db import get_db
-from dotenv import load_dotenv
-import os
+from src.database import cache
+from src.services.auth import auth_service
 
-load_dotenv()
+if FAKE_REDIS:
+    import fakeredis
+
+    # one server per worker, shared by every client the app creates, like a real Redis
+    fake_server = fakeredis.FakeServer()
+    cache.create_redis = lambda: fakeredis.aioredis.FakeRedis(server=fake_server)
 
 SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DB_URL")
 
@@ -16,6 +51,12 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def pytest_configure(config):
+    # the tests of a module share its database and run in order, so `pytest -n` keeps each module on one worker
+    if config.pluginmanager.hasplugin("xdist") and config.getoption("dist") == "load":
+        config.option.dist = "loadfile"
+
+
 @pytest.fixture(scope="module")
 def session():
     Base.metadata.drop_all(bind=engine)
@@ -39,7 +80,8 @@ def client(session):
 
     app.dependency_overrides[get_db] = override_get_db
 
-    yield TestClient(app)
+    with TestClient(app) as client:
+        yield client
 
 
 @pytest.fixture(scope="module")
@@ -49,4 +91,22 @@ def user():
         "email": "com@com.com",
         "password": "string",
         # "phonenumber": "1234567890000"
-    }
\ No newline at end of file
+    }
+
+
+@pytest.fixture(scope="module")
+def auth_headers(session):
+    """
+    The auth_headers fixture returns a function that adds a confirmed user, <username>@example.com,
+    and returns the Authorization header of an access token issued to them.
+    """
+
+    def create(username: str) -> dict:
+        email = f"{username}@example.com"
+        session.add(User(username=username, email=email, password="x", avatar="https://example.com/a.png",
+                         confirmed=True))
+        session.commit()
+        token = asyncio.run(auth_service.create_access_token({"sub": email}))
+        return {"Authorization": f"Bearer {token}"}
+
+    return create
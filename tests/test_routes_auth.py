@@ -1,16 +1,21 @@
+import asyncio
 from unittest.mock import MagicMock
 from src.database.models import User
+from src.services.auth import auth_service
 
 
 def test_create_user(client, user, monkeypatch):
     mock_send_email = MagicMock()
     monkeypatch.setattr("src.routes.users.send_email", mock_send_email)
+    mock_refresh_avatar = MagicMock()
+    monkeypatch.setattr("src.routes.users.refresh_avatar", mock_refresh_avatar)
     response = client.post("/users/auth/signup", json=user)
     assert response.status_code == 201, response.text
     data = response.json()
     assert data["email"] == user.get("email")
     assert "id" in data
-
+    assert data["avatar"].startswith("https://www.gravatar.com/avatar/")
+    mock_refresh_avatar.assert_called_once_with(user.get("email"))
 
 
 def test_repeat_create_user(client, user):
@@ -63,4 +68,60 @@ def test_login_wrong_email(client, user):
     )
     assert response.status_code == 401, response.text
     data = response.json()
-    assert data["detail"] == "Invalid email"
\ No newline at end of file
+    assert data["detail"] == "Invalid email"
+
+def test_refresh_token_rotation(client, user):
+    response = client.post(
+        "/users/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    first = response.json()["refresh_token"]
+    response = client.get("/users/auth/refresh_token", headers={"Authorization": f"Bearer {first}"})
+    assert response.status_code == 200, response.text
+    second = response.json()["refresh_token"]
+    assert second != first
+    response = client.get("/users/auth/refresh_token", headers={"Authorization": f"Bearer {first}"})
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Refresh token reuse detected"
+    response = client.get("/users/auth/refresh_token", headers={"Authorization": f"Bearer {second}"})
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Invalid refresh token"
+
+
+def test_logout(client, user):
+    response = client.post(
+        "/users/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    access_token = response.json()["access_token"]
+    refresh_token = response.json()["refresh_token"]
+    response = client.get("/users/auth/me/", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 200, response.text
+    response = client.post("/users/auth/logout", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 200, response.text
+    response = client.get("/users/auth/me/", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 401, response.text
+    response = client.get("/users/auth/refresh_token", headers={"Authorization": f"Bearer {refresh_token}"})
+    assert response.status_code == 401, response.text
+
+
+def test_password_reset_revokes_tokens(client, user):
+    response = client.post(
+        "/users/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    access_token = response.json()["access_token"]
+    email_token = asyncio.run(auth_service.create_email_token({"sub": user.get('email')}))
+    response = client.get(f"/users/auth/recovered_password/{email_token}", params={"new_password": "newpass"})
+    assert response.status_code == 200, response.text
+    response = client.get("/users/auth/me/", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 401, response.text
+    response = client.post(
+        "/users/auth/login",
+        data={"username": user.get('email'), "password": "newpass"},
+    )
+    assert response.status_code == 200, response.text
+    access_token = response.json()["access_token"]
+    response = client.get("/users/auth/me/", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 200, response.text
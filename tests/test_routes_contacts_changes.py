@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+import pytest
+from src.repository.contacts import TOMBSTONE_RETENTION, decode_sync_token, encode_sync_token
+
+
+@pytest.fixture(scope="module")
+def headers(auth_headers):
+    return auth_headers("syncer")
+
+
+@pytest.fixture(autouse=True)
+def no_lag(monkeypatch):
+    monkeypatch.setattr("src.repository.contacts.SYNC_LAG_SECONDS", 0)
+
+
+def test_changes_initial_sync(client, headers):
+    for i in range(3):
+        response = client.post("/contacts/", headers=headers, json={
+            "first_name": "Sync", "last_name": f"Person{i}", "email": f"sync{i}@example.com",
+            "phonenumber": "380501234567"})
+        assert response.status_code == 201, response.text
+    response = client.get("/contacts/changes", headers=headers, params={"limit": 2})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [c["email"] for c in data["contacts"]] == ["sync0@example.com", "sync1@example.com"]
+    assert data["deleted"] == []
+    assert data["has_more"] is True
+    response = client.get("/contacts/changes", headers=headers, params={"since": data["next"], "limit": 2})
+    data = response.json()
+    assert [c["email"] for c in data["contacts"]] == ["sync2@example.com"]
+    assert data["has_more"] is False
+
+
+def test_changes_reports_deletions(client, headers):
+    data = client.get("/contacts/changes", headers=headers).json()
+    contact_id = data["contacts"][0]["id"]
+    response = client.delete(f"/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 204, response.text
+    response = client.get("/contacts/changes", headers=headers, params={"since": data["next"]})
+    data = response.json()
+    assert data["contacts"] == []
+    assert data["deleted"] == [contact_id]
+    response = client.get("/contacts/changes", headers=headers, params={"since": data["next"]})
+    assert response.json()["deleted"] == []
+
+
+def test_changes_invalid_token(client, headers):
+    response = client.get("/contacts/changes", headers=headers, params={"since": "garbage"})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid sync token"
+
+
+def test_changes_expired_token(client, headers):
+    expired = datetime.utcnow() - TOMBSTONE_RETENTION - timedelta(days=1)
+    token = encode_sync_token((expired, 0), (expired, 0))
+    response = client.get("/contacts/changes", headers=headers, params={"since": token})
+    assert response.status_code == 410, response.text
+    assert response.json()["detail"] == "Sync token expired, full resync required"
+
+
+def test_changes_token_stays_fresh_without_deletions(client, headers):
+    old = datetime.utcnow() - TOMBSTONE_RETENTION + timedelta(days=1)
+    response = client.get("/contacts/changes", headers=headers,
+                          params={"since": encode_sync_token((datetime.min, 0), (old, 0))})
+    assert response.status_code == 200, response.text
+    _, (tombstones_at, _) = decode_sync_token(response.json()["next"])
+    assert tombstones_at > old + timedelta(days=1)
@@ -0,0 +1,95 @@
+import asyncio
+import uuid
+import pytest
+from src.database.models import Contact
+from src.services.auth import auth_service
+from src.services.idempotency import idempotency
+from src.services.rate_limit import RateLimit
+
+
+@pytest.fixture(scope="module")
+def headers(auth_headers):
+    return auth_headers("retrier")
+
+
+def contact(email):
+    return {"first_name": "Retry", "last_name": "Person", "email": email, "phonenumber": "380501234567"}
+
+
+def test_retry_is_replayed(client, session, headers):
+    key = {"Idempotency-Key": uuid.uuid4().hex, **headers}
+    first = client.post("/contacts/", headers=key, json=contact("retry1@example.com"))
+    assert first.status_code == 201, first.text
+    assert "idempotent-replayed" not in first.headers
+    second = client.post("/contacts/", headers=key, json=contact("retry1@example.com"))
+    assert second.status_code == 201, second.text
+    assert second.headers["idempotent-replayed"] == "true"
+    assert second.json() == first.json()
+    assert session.query(Contact).filter(Contact.email == "retry1@example.com").count() == 1
+
+
+def test_key_reused_with_other_body(client, headers):
+    key = {"Idempotency-Key": uuid.uuid4().hex, **headers}
+    response = client.post("/contacts/", headers=key, json=contact("retry2@example.com"))
+    assert response.status_code == 201, response.text
+    response = client.post("/contacts/", headers=key, json=contact("retry3@example.com"))
+    assert response.status_code == 422, response.text
+
+
+def test_duplicate_email_is_conflict(client, headers):
+    response = client.post("/contacts/", headers=headers, json=contact("retry4@example.com"))
+    assert response.status_code == 201, response.text
+    response = client.post("/contacts/", headers=headers, json=contact("retry4@example.com"))
+    assert response.status_code == 409, response.text
+    assert response.json()["detail"] == "Contact with this email already exists"
+
+
+def test_retry_with_new_token_is_replayed(client, session, headers):
+    key = uuid.uuid4().hex
+    first = client.post("/contacts/", headers={"Idempotency-Key": key, **headers}, json=contact("retry5@example.com"))
+    assert first.status_code == 201, first.text
+    token = asyncio.run(auth_service.create_access_token({"sub": "retrier@example.com"}))
+    assert f"Bearer {token}" != headers["Authorization"]
+    second = client.post("/contacts/", headers={"Idempotency-Key": key, "Authorization": f"Bearer {token}"},
+                         json=contact("retry5@example.com"))
+    assert second.status_code == 201, second.text
+    assert second.headers["idempotent-replayed"] == "true"
+    assert second.json() == first.json()
+    assert session.query(Contact).filter(Contact.email == "retry5@example.com").count() == 1
+
+
+def test_key_is_scoped_by_user(client, session, headers, auth_headers):
+    other = auth_headers("retrier2")
+    key = uuid.uuid4().hex
+    response = client.post("/contacts/", headers={"Idempotency-Key": key, **headers}, json=contact("retry6@example.com"))
+    assert response.status_code == 201, response.text
+    response = client.post("/contacts/", headers={"Idempotency-Key": key, **other}, json=contact("retry6@example.com"))
+    assert response.status_code == 201, response.text
+    assert "idempotent-replayed" not in response.headers
+    assert session.query(Contact).filter(Contact.email == "retry6@example.com").count() == 2
+
+
+def test_replay_after_logout_is_rejected(client, session, headers):
+    token = asyncio.run(auth_service.create_access_token({"sub": "retrier@example.com"}))
+    key = {"Idempotency-Key": uuid.uuid4().hex, "Authorization": f"Bearer {token}"}
+    response = client.post("/contacts/", headers=key, json=contact("retry7@example.com"))
+    assert response.status_code == 201, response.text
+    response = client.post("/users/auth/logout", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    response = client.post("/contacts/", headers=key, json=contact("retry7@example.com"))
+    assert response.status_code == 401, response.text
+    assert "idempotent-replayed" not in response.headers
+    assert session.query(Contact).filter(Contact.email == "retry7@example.com").count() == 1
+
+
+def test_replay_is_rate_limited(client, headers, monkeypatch):
+    key = {"Idempotency-Key": uuid.uuid4().hex, **headers}
+    response = client.post("/contacts/", headers=key, json=contact("retry8@example.com"))
+    assert response.status_code == 201, response.text
+    monkeypatch.setattr(idempotency, "limit", RateLimit(f"replay-{uuid.uuid4().hex}", "1/60"))
+    response = client.post("/contacts/", headers=key, json=contact("retry8@example.com"))
+    assert response.status_code == 201, response.text
+    assert response.headers["ratelimit-remaining"] == "0"
+    response = client.post("/contacts/", headers=key, json=contact("retry8@example.com"))
+    assert response.status_code == 429, response.text
+    assert "retry-after" in response.headers
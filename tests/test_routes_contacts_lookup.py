@@ -0,0 +1,27 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def headers(auth_headers):
+    return auth_headers("caller")
+
+
+def test_create_contact_normalizes_phone(client, headers):
+    response = client.post("/contacts/", headers=headers, json={
+        "first_name": "Caller", "last_name": "Person", "email": "who@example.com", "phonenumber": "380501234567"})
+    assert response.status_code == 201, response.text
+    assert response.json()["phone_e164"] == "+380501234567"
+
+
+@pytest.mark.parametrize("phone", ["+380501234567", "0501234567", "(050) 123-45-67"])
+def test_lookup_by_phone(client, headers, phone):
+    response = client.get("/contacts/lookup", headers=headers, params={"phone": phone})
+    assert response.status_code == 200, response.text
+    assert [c["email"] for c in response.json()] == ["who@example.com"]
+
+
+def test_lookup_invalid_phone(client, headers):
+    response = client.get("/contacts/lookup", headers=headers, params={"phone": "12345"})
+    assert response.status_code == 422, response.text
+    assert response.json()["detail"] == "Invalid phone number"
+
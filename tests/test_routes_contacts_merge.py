@@ -0,0 +1,73 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def headers(auth_headers):
+    return auth_headers("merger")
+
+
+def create(client, headers, email, **fields):
+    response = client.post("/contacts/", headers=headers, json={
+        "first_name": "Merged", "last_name": "Person", "email": email, "phonenumber": "+380501234567", **fields})
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def total(client, headers):
+    response = client.get("/contacts/stats", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["total"]
+
+
+def test_duplicates_and_merge(client, headers):
+    create(client, headers, "merged@example.com")
+    duplicate_id = create(client, headers, "merged+home@example.com", birthdate="1990-05-17",
+                          additional_info="met at work")
+    response = client.get("/contacts/duplicates", headers=headers)
+    assert response.status_code == 200, response.text
+    pair = response.json()[0]
+    assert pair["ids"][1] == duplicate_id
+    assert pair["reasons"] == ["email", "phone", "name"]
+    keep_id = pair["ids"][0]
+    response = client.post("/contacts/merge", headers=headers, json={"keep_id": keep_id, "merge_ids": [duplicate_id]})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["birthdate"] == "1990-05-17"
+    assert data["additional_info"] == "met at work"
+    assert client.get(f"/contacts/{duplicate_id}", headers=headers).status_code == 404
+    assert client.get("/contacts/duplicates", headers=headers).json() == []
+
+
+def test_merge_takes_phone(client, headers):
+    keep_id = create(client, headers, "nophone@example.com", phonenumber="000000000000")
+    merge_id = create(client, headers, "phone@example.com", phonenumber="+380671234567")
+    response = client.post("/contacts/merge", headers=headers, json={"keep_id": keep_id, "merge_ids": [merge_id]})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["phonenumber"] == "+380671234567"
+    assert data["phone_e164"] == "+380671234567"
+
+
+def test_merge_duplicate_ids(client, headers):
+    before = total(client, headers)
+    keep_id = create(client, headers, "twice1@example.com")
+    merge_id = create(client, headers, "twice2@example.com")
+    response = client.post("/contacts/merge", headers=headers,
+                           json={"keep_id": keep_id, "merge_ids": [merge_id, merge_id]})
+    assert response.status_code == 422, response.text
+    assert total(client, headers) == before + 2
+    assert client.get(f"/contacts/{merge_id}", headers=headers).status_code == 200
+
+
+def test_merged_contact_cannot_be_restored(client, headers):
+    keep_id = create(client, headers, "kept@example.com")
+    merge_id = create(client, headers, "gone@example.com")
+    response = client.post("/contacts/merge", headers=headers, json={"keep_id": keep_id, "merge_ids": [merge_id]})
+    assert response.status_code == 200, response.text
+    response = client.post(f"/contacts/{merge_id}/restore", headers=headers)
+    assert response.status_code == 404, response.text
+
+
+def test_merge_unknown_contact(client, headers):
+    response = client.post("/contacts/merge", headers=headers, json={"keep_id": 1, "merge_ids": [99999]})
+    assert response.status_code == 404, response.text
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select
+from src.database.models import Contact, ContactTombstone
+from src.repository.contacts import purge_deleted, purge_tombstones
+
+
+@pytest.fixture(scope="module")
+def headers(auth_headers):
+    return auth_headers("restorer")
+
+
+def create(client, headers, email):
+    response = client.post("/contacts/", headers=headers, json={
+        "first_name": "Soft", "last_name": "Deleted", "email": email, "phonenumber": "380501234567"})
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def test_delete_hides_and_restore_brings_back(client, headers):
+    contact_id = create(client, headers, "soft1@example.com")
+    client.put(f"/contacts/{contact_id}/tags", headers=headers, json={"tags": ["kept"]})
+    assert client.delete(f"/contacts/{contact_id}", headers=headers).status_code == 204
+    assert client.get(f"/contacts/{contact_id}", headers=headers).status_code == 404
+    assert contact_id not in [c["id"] for c in client.get("/contacts/", headers=headers).json()]
+    assert client.get("/contacts/tags", headers=headers).json()[0]["contact_count"] == 0
+
+    response = client.post(f"/contacts/{contact_id}/restore", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["tags"] == ["kept"]
+    assert client.get(f"/contacts/{contact_id}", headers=headers).status_code == 200
+    assert client.get("/contacts/tags", headers=headers).json()[0]["contact_count"] == 1
+
+
+def test_restore_live_contact_not_found(client, headers):
+    contact_id = create(client, headers, "soft2@example.com")
+    assert client.post(f"/contacts/{contact_id}/restore", headers=headers).status_code == 404
+
+
+def test_email_reused_after_delete(client, headers):
+    contact_id = create(client, headers, "soft3@example.com")
+    client.delete(f"/contacts/{contact_id}", headers=headers)
+    create(client, headers, "soft3@example.com")
+    response = client.post(f"/contacts/{contact_id}/restore", headers=headers)
+    assert response.status_code == 409, response.text
+
+
+def test_purge_removes_expired_contacts(client, headers, session):
+    contact_id = create(client, headers, "soft4@example.com")
+    client.delete(f"/contacts/{contact_id}", headers=headers)
+    assert purge_deleted(datetime.now() - timedelta(days=1), 100, session) == 0
+    removed = purge_deleted(datetime.now() + timedelta(days=1), 1, session)
+    assert removed == 1
+    while purge_deleted(datetime.now() + timedelta(days=1), 1, session):
+        pass
+    assert session.execute(select(Contact).where(Contact.id == contact_id)).scalar_one_or_none() is None
+    assert client.post(f"/contacts/{contact_id}/restore", headers=headers).status_code == 404
+
+
+def test_purge_removes_expired_tombstones(client, headers, session):
+    contact_id = create(client, headers, "soft5@example.com")
+    client.delete(f"/contacts/{contact_id}", headers=headers)
+    tombstones = select(ContactTombstone).where(ContactTombstone.contact_id == contact_id)
+    assert purge_tombstones(datetime.now() - timedelta(days=1), 100, session) == 0
+    assert session.execute(tombstones).first() is not None
+    while purge_tombstones(datetime.now() + timedelta(days=1), 1, session):
+        pass
+    assert session.execute(tombstones).first() is None
@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import select, update
+from src.database.models import ContactCounter, User
+from src.repository.counters import reconcile_counters
+
+
+@pytest.fixture(scope="module")
+def headers(auth_headers):
+    return auth_headers("counter")
+
+
+@pytest.fixture(scope="module")
+def owner(session, headers):
+    return session.scalar(select(User.id).where(User.email == "counter@example.com"))
+
+
+def create(client, headers, email, birthdate=None):
+    response = client.post("/contacts/", headers=headers, json={
+        "first_name": "Counted", "last_name": "Person", "email": email, "phonenumber": "380501234567",
+        "birthdate": birthdate})
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def stats(client, headers):
+    response = client.get("/contacts/stats", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_counters_follow_writes(client, headers):
+    assert stats(client, headers)["total"] == 0
+    first = create(client, headers, "count1@example.com", "1990-03-15")
+    create(client, headers, "count2@example.com", "1985-03-01")
+    create(client, headers, "count3@example.com")
+    result = stats(client, headers)
+    assert result["total"] == 3
+    assert result["birth_months"][2] == 2
+    assert result["without_birthdate"] == 1
+    assert result["added_last_7_days"] == result["added_last_30_days"] == 3
+
+    response = client.put(f"/contacts/{first}", headers=headers, json={
+        "first_name": "Counted", "last_name": "Person", "email": "count1@example.com", "phonenumber": "380501234567",
+        "birthdate": "1990-07-15", "additional_info": "moved"})
+    assert response.status_code == 200, response.text
+    assert stats(client, headers)["birth_months"][2:7] == [1, 0, 0, 0, 1]
+
+    client.delete(f"/contacts/{first}", headers=headers)
+    result = stats(client, headers)
+    assert result["total"] == 2 and result["birth_months"][6] == 0 and result["added_last_7_days"] == 2
+    client.post(f"/contacts/{first}/restore", headers=headers)
+    assert stats(client, headers)["total"] == 3
+
+
+def test_reconcile_fixes_drift(client, headers, session, owner):
+    expected = stats(client, headers)
+    session.execute(update(ContactCounter).where(ContactCounter.user_id == owner, ContactCounter.name == "total")
+                    .values(value=100))
+    session.execute(ContactCounter.__table__.delete().where(ContactCounter.user_id == owner,
+                                                            ContactCounter.name == "birth_month:03"))
+    session.commit()
+    assert reconcile_counters(owner, session) == 2
+    assert stats(client, headers) == expected
+    assert reconcile_counters(owner, session) == 0
@@ -0,0 +1,55 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def headers(auth_headers):
+    return auth_headers("tagger")
+
+
+@pytest.fixture(scope="module")
+def contact_ids(client, headers):
+    ids = []
+    for i in range(3):
+        response = client.post("/contacts/", headers=headers, json={
+            "first_name": "Tagged", "last_name": f"Person{i}", "email": f"tagged{i}@example.com",
+            "phonenumber": "380501234567"})
+        assert response.status_code == 201, response.text
+        ids.append(response.json()["id"])
+    return ids
+
+
+def tag_counts(client, headers):
+    response = client.get("/contacts/tags", headers=headers)
+    assert response.status_code == 200, response.text
+    return {tag["name"]: tag["contact_count"] for tag in response.json()}
+
+
+def test_set_tags(client, headers, contact_ids):
+    response = client.put(f"/contacts/{contact_ids[0]}/tags", headers=headers, json={"tags": ["Family", "work"]})
+    assert response.status_code == 200, response.text
+    assert response.json()["tags"] == ["family", "work"]
+    response = client.put(f"/contacts/{contact_ids[1]}/tags", headers=headers, json={"tags": ["family"]})
+    assert response.status_code == 200, response.text
+    assert tag_counts(client, headers) == {"family": 2, "work": 1}
+
+
+def test_filter_by_tag(client, headers, contact_ids):
+    response = client.get("/contacts/", headers=headers, params={"tag": "family"})
+    assert response.status_code == 200, response.text
+    assert sorted(c["id"] for c in response.json()) == contact_ids[:2]
+    response = client.get("/contacts/", headers=headers, params={"tag": "Work"})
+    assert [c["id"] for c in response.json()] == contact_ids[:1]
+
+
+def test_retag_and_delete_update_counts(client, headers, contact_ids):
+    response = client.put(f"/contacts/{contact_ids[0]}/tags", headers=headers, json={"tags": ["work", "gym"]})
+    assert response.json()["tags"] == ["gym", "work"]
+    assert tag_counts(client, headers) == {"family": 1, "gym": 1, "work": 1}
+    response = client.delete(f"/contacts/{contact_ids[0]}", headers=headers)
+    assert response.status_code == 204, response.text
+    assert tag_counts(client, headers) == {"family": 1, "gym": 0, "work": 0}
+
+
+def test_set_tags_unknown_contact(client, headers):
+    response = client.put("/contacts/99999/tags", headers=headers, json={"tags": ["x"]})
+    assert response.status_code == 404, response.text
@@ -0,0 +1,53 @@
+import pytest
+
+
+def test_metrics_endpoint(client):
+    response = client.get("/")
+    assert response.status_code == 200, response.text
+    response = client.get("/metrics")
+    assert response.status_code == 200, response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in response.text
+    assert "db_pool_connections" in response.text
+
+
+def test_metrics_use_route_template(client):
+    client.get("/contacts/12345")
+    response = client.get("/metrics")
+    assert 'route="/contacts/{contact_id}"' in response.text
+    assert 'route="/contacts/12345"' not in response.text
+
+
+def test_profile_debug_header(client, monkeypatch):
+    monkeypatch.setattr("src.services.profiling.profiler.enabled", True)
+    monkeypatch.setattr("src.services.profiling.profiler.debug_token", "secret")
+    response = client.get("/")
+    assert "server-timing" not in response.headers
+    response = client.get("/", headers={"X-Debug-Profile": "1", "X-Debug-Token": "secret"})
+    assert response.status_code == 200, response.text
+    assert response.headers["server-timing"].startswith("total;dur=")
+
+
+@pytest.mark.parametrize("token", [None, "wrong"])
+def test_profile_debug_header_needs_token(client, monkeypatch, token):
+    monkeypatch.setattr("src.services.profiling.profiler.enabled", True)
+    monkeypatch.setattr("src.services.profiling.profiler.debug_token", "secret")
+    headers = {"X-Debug-Profile": "1", "X-Debug-Explain": "1"} | ({"X-Debug-Token": token} if token else {})
+    response = client.get("/", headers=headers)
+    assert response.status_code == 200, response.text
+    assert "server-timing" not in response.headers
+
+
+def test_gauges_refreshed_in_multiprocess_mode(monkeypatch):
+    from prometheus_client import Gauge
+    from src.services import metrics
+
+    monkeypatch.setattr(metrics, "MULTIPROCESS", True)
+    monkeypatch.setattr(metrics, "_gauge_functions", [])
+    gauge = Gauge("test_multiprocess_gauge", "Gauge set on refresh", registry=None)
+    value = [3]
+    metrics.track_gauge(gauge, lambda: value[0])
+    metrics.refresh_gauges()
+    assert gauge._value.get() == 3
+    value[0] = 5
+    metrics.refresh_gauges()
+    assert gauge._value.get() == 5
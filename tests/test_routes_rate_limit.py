@@ -0,0 +1,65 @@
+import asyncio
+import uuid
+from unittest.mock import AsyncMock
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.login_guard import login_guard
+from src.services.rate_limit import dates_limit, default_limit, login_limit
+
+
+def test_login_rate_limit(client, monkeypatch):
+    monkeypatch.setattr(login_limit, "name", "login-" + uuid.uuid4().hex)
+    monkeypatch.setattr(login_limit, "times", 2)
+    email = f"{uuid.uuid4().hex}@example.com"
+    for _ in range(2):
+        response = client.post("/users/auth/login", data={"username": email, "password": "wrong"})
+        assert response.status_code == 401, response.text
+    response = client.post("/users/auth/login", data={"username": email, "password": "wrong"})
+    assert response.status_code == 429, response.text
+    assert int(response.headers["retry-after"]) > 0
+    assert response.headers["ratelimit-limit"] == "2"
+    assert response.headers["ratelimit-remaining"] == "0"
+
+
+def test_rate_limit_per_user(client, session):
+    email = f"{uuid.uuid4().hex}@example.com"
+    session.add(User(username="limited", email=email, password="x", confirmed=True))
+    session.commit()
+    token = asyncio.run(auth_service.create_access_token({"sub": email}))
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/dates/", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["ratelimit-limit"] == str(dates_limit.times)
+    remaining = int(response.headers["ratelimit-remaining"])
+    assert remaining == dates_limit.times - 1
+    response = client.get("/dates/", headers=headers)
+    assert int(response.headers["ratelimit-remaining"]) == remaining - 1
+
+
+def test_default_limit(client, monkeypatch):
+    monkeypatch.setattr(default_limit, "name", "default-" + uuid.uuid4().hex)
+    monkeypatch.setattr(default_limit, "times", 2)
+    for _ in range(2):
+        response = client.get("/")
+        assert response.status_code == 200, response.text
+        assert response.headers["ratelimit-limit"] == "2"
+    # the test client is not a trusted proxy, so its X-Forwarded-For does not open a new bucket
+    response = client.get("/", headers={"X-Forwarded-For": "198.51.100.1"})
+    assert response.status_code == 429, response.text
+    response = client.post("/users/auth/request_email", json={"email": "nobody@example.com"})
+    assert response.status_code == 429, response.text
+
+
+def test_login_lockout(client, monkeypatch):
+    monkeypatch.setattr(login_guard, "account_threshold", 2)
+    email = f"{uuid.uuid4().hex}@example.com"
+    for _ in range(2):
+        response = client.post("/users/auth/login", data={"username": email, "password": "wrong"})
+        assert response.status_code == 401, response.text
+    mock_get_user = AsyncMock()
+    monkeypatch.setattr("src.routes.users.repositories_users.get_user_by_email", mock_get_user)
+    response = client.post("/users/auth/login", data={"username": email, "password": "wrong"})
+    assert response.status_code == 429, response.text
+    assert response.json()["detail"] == "Too many failed login attempts"
+    assert 0 < int(response.headers["retry-after"]) <= login_guard.lockout
+    mock_get_user.assert_not_called()
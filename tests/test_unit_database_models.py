@@ -0,0 +1,29 @@
+import unittest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from src.database.models import Base, Contact, User
+
+
+class TestContactPartitionPruning(unittest.TestCase):
+    def setUp(self) -> None:
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+
+    def test_writes_filter_on_user_id(self):
+        with Session(self.engine) as db:
+            user = User(username="owner", email="owner@example.com", password="x")
+            contact = Contact(first_name="John", last_name="Doe", email="john@example.com",
+                              phonenumber="380501234567", user=user)
+            db.add(contact)
+            db.commit()
+            contact.first_name = "Jack"
+            db.commit()
+            db.delete(contact)
+            db.commit()
+        writes = [s for s in self.statements if s.startswith(("UPDATE contacts", "DELETE FROM contacts"))]
+        self.assertEqual(len(writes), 2)
+        for statement in writes:
+            self.assertIn("contacts.user_id = ?", statement)
@@ -0,0 +1,148 @@
+import unittest
+from collections import Counter
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import select
+from src.database.models import Base, Contact, ContactTombstone, Tag, User, contact_tags
+from src.database.shards import HashRing, ShardRouter, copy_user_data, delete_user_data
+
+
+class TestHashRing(unittest.TestCase):
+    def test_deterministic(self):
+        ring = HashRing(["shard0", "shard1", "shard2"])
+        self.assertEqual([ring.get(user_id) for user_id in range(100)],
+                         [HashRing(["shard0", "shard1", "shard2"]).get(user_id) for user_id in range(100)])
+
+    def test_spreads_users(self):
+        ring = HashRing(["shard0", "shard1", "shard2", "shard3"])
+        counts = Counter(ring.get(user_id) for user_id in range(10000))
+        self.assertEqual(set(counts), {"shard0", "shard1", "shard2", "shard3"})
+        self.assertTrue(all(1500 < count < 3500 for count in counts.values()))
+
+    def test_adding_shard_moves_only_its_users(self):
+        before, after = HashRing(["shard0", "shard1", "shard2"]), HashRing(["shard0", "shard1", "shard2", "shard3"])
+        moved = [user_id for user_id in range(10000) if before.get(user_id) != after.get(user_id)]
+        self.assertTrue(all(after.get(user_id) == "shard3" for user_id in moved))
+        self.assertLess(len(moved), 4000)
+
+
+class TestShardRouter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.router = ShardRouter(["sqlite://", "sqlite://"], cache_seconds=60)
+        self.redis = MagicMock()
+        self.pipe = MagicMock()
+        self.pipe.__aenter__ = AsyncMock(return_value=self.pipe)
+        self.pipe.__aexit__ = AsyncMock(return_value=False)
+        self.redis.pipeline.return_value = self.pipe
+
+    async def test_ring_placement(self):
+        self.pipe.execute = AsyncMock(return_value=[None, 0])
+        with patch("src.database.shards.get_redis", return_value=self.redis):
+            self.assertEqual(await self.router.locate(5), (self.router.ring.get(5), False))
+
+    async def test_directory_override_and_lock(self):
+        other = "shard1" if self.router.ring.get(5) == "shard0" else "shard0"
+        self.pipe.execute = AsyncMock(return_value=[other.encode(), 1])
+        with patch("src.database.shards.get_redis", return_value=self.redis):
+            self.assertEqual(await self.router.locate(5), (other, True))
+            await self.router.locate(5)
+        self.pipe.execute.assert_awaited_once()
+
+    async def test_unknown_shard_in_directory_falls_back_to_ring(self):
+        self.pipe.execute = AsyncMock(return_value=[b"shard9", 0])
+        with patch("src.database.shards.get_redis", return_value=self.redis):
+            self.assertEqual((await self.router.locate(5))[0], self.router.ring.get(5))
+
+
+class TestReplicateUser(unittest.TestCase):
+    def setUp(self) -> None:
+        self.router = ShardRouter(["sqlite://"])
+        self.db = self.router.sessions["shard0"]()
+        Base.metadata.create_all(bind=self.db.get_bind())
+        self.user = User(id=1, username="owner", email="owner@example.com", password="hash",
+                         avatar="https://example.com/a.png", created_at=datetime(2024, 1, 2), confirmed=False)
+
+    def tearDown(self) -> None:
+        self.db.close()
+
+    def replica(self) -> User:
+        self.db.expire_all()
+        return self.db.get(User, 1)
+
+    def test_copies_only_replicated_columns(self):
+        self.router.replicate_user("shard0", self.db, self.user)
+        replica = self.replica()
+        self.assertEqual((replica.email, replica.username, replica.avatar, replica.created_at, replica.confirmed),
+                         ("owner@example.com", "owner", "https://example.com/a.png", datetime(2024, 1, 2), False))
+        self.assertEqual(replica.password, "")
+
+    def test_refreshes_changed_user(self):
+        self.router.replicate_user("shard0", self.db, self.user)
+        self.user.confirmed = True
+        self.router.replicate_user("shard0", self.db, self.user)
+        self.assertTrue(self.replica().confirmed)
+
+    def test_unchanged_user_is_not_written(self):
+        self.router.replicate_user("shard0", self.db, self.user)
+        with patch("src.database.shards.write_user_replica") as write:
+            self.router.replicate_user("shard0", self.db, self.user)
+        write.assert_not_called()
+
+    def test_clears_credentials_replicated_before(self):
+        self.db.add(User(id=1, username="owner", email="owner@example.com", password="hash"))
+        self.db.commit()
+        self.router.replicate_user("shard0", self.db, self.user)
+        self.assertEqual(self.replica().password, "")
+
+
+class TestCopyUserData(unittest.TestCase):
+    def setUp(self) -> None:
+        self.router = ShardRouter(["sqlite://", "sqlite://"])
+        self.source, self.target = self.router.sessions["shard0"](), self.router.sessions["shard1"]()
+        for session in (self.source, self.target):
+            Base.metadata.create_all(bind=session.get_bind())
+        user = User(id=1, username="owner", email="owner@example.com", password="x", confirmed=True)
+        self.source.add(user)
+        self.source.add(Contact(id=10, first_name="Ivan", last_name="Petrenko", email="ivan@example.com",
+                                phonenumber="+380501234567", user_id=1))
+        self.source.add(Tag(id=3, name="work", contact_count=1, user_id=1))
+        self.source.add(ContactTombstone(contact_id=11, user_id=1))
+        self.source.flush()
+        self.source.execute(contact_tags.insert().values(tag_id=3, contact_id=10, user_id=1))
+        self.source.commit()
+        # the target already uses the tag id of the source
+        self.target.add(User(id=2, username="other", email="other@example.com", password="x", confirmed=True))
+        self.target.add(Tag(id=3, name="home", contact_count=0, user_id=2))
+        self.target.commit()
+
+    def tearDown(self) -> None:
+        self.source.close()
+        self.target.close()
+
+    def test_copy_keeps_contact_ids_and_remaps_tags(self):
+        copied = copy_user_data(1, self.source, self.target)
+        self.target.commit()
+        self.assertEqual(copied["contacts"], 1)
+        self.assertEqual(self.target.get(Contact, (10, 1)).email, "ivan@example.com")
+        tag = self.target.execute(select(Tag).where(Tag.user_id == 1)).scalar_one()
+        self.assertEqual(tag.name, "work")
+        self.assertNotEqual(tag.id, 3)
+        self.assertEqual(self.target.execute(select(contact_tags.c.tag_id)).scalars().all(), [tag.id])
+        self.assertEqual(self.target.execute(select(ContactTombstone.contact_id)).scalars().all(), [11])
+
+    def test_copy_leaves_credentials(self):
+        copy_user_data(1, self.source, self.target)
+        self.target.commit()
+        self.assertEqual(self.target.get(User, 1).password, "")
+
+    def test_copy_twice_replaces(self):
+        copy_user_data(1, self.source, self.target)
+        copy_user_data(1, self.source, self.target)
+        self.target.commit()
+        self.assertEqual(len(self.target.execute(select(Contact)).unique().scalars().all()), 1)
+
+    def test_delete_keeps_user(self):
+        delete_user_data(1, self.source)
+        self.source.commit()
+        self.assertEqual(self.source.execute(select(Contact)).unique().scalars().all(), [])
+        self.assertIsNotNone(self.source.get(User, 1))
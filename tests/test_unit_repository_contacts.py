@@ -33,6 +33,12 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertIsInstance(result, Contact)
         self.assertEqual(result.first_name, body.first_name)
 
+    async def test_create_contact_normalizes_phone(self):
+        body = ContactSchema(first_name="Jane", last_name="Doeno", email="jane.doe@example.com", phonenumber='380501234567')
+        result = create_contact(body, self.session, self.user)
+        self.assertEqual(result.phonenumber, '380501234567')
+        self.assertEqual(result.phone_e164, '+380501234567')
+
     async def test_update_contact(self):
         birthdate = datetime.datetime.strptime('2019-12-04', '%Y-%m-%d').date()
         body = ContactUpdate(first_name="Jane", last_name="Doeno", email="jane.doe@example.com", phonenumber='1234567890000', birthdate=birthdate, additional_info='qwwerttyuio')
@@ -2,8 +2,9 @@ import unittest
 from unittest.mock import MagicMock, patch, AsyncMock
 from sqlalchemy.orm import Session
 from src.database.models import User, Contact
-from src.repository.users import get_user_by_email, create_user, update_token, confirmed_email, update_avatar
+from src.repository.users import get_user_by_email, create_user, confirmed_email, update_avatar
 from src.schemas import UserSchema
+from src.services.avatar import gravatar_hash
 
 
 class TestUsers(unittest.IsolatedAsyncioTestCase):
@@ -15,7 +16,6 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
             email="com@com.com",
             password="string",
             avatar=None,
-            refresh_token=None,
             confirmed=True,
             created_at=None,
             updated_at=None
@@ -41,11 +41,12 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(hasattr(result, "id"))
         self.assertEqual(result.username,body.username)
 
-    async def test_update_token(self):
-        token = "secret_hash"
-        result = await update_token(self.user, token, self.session)
-        self.session.commit.assert_called_once()
-        self.assertEqual(self.user.refresh_token, token)
+    async def test_create_user_avatar_is_computed_locally(self):
+        body = UserSchema(username="stringg", email=" GCom@com.com ", password="string")
+        with patch('src.services.avatar.GravatarProvider.resolve') as mock:
+            result = await create_user(body, self.session)
+            mock.assert_not_called()
+        self.assertEqual(result.avatar, "https://www.gravatar.com/avatar/" + gravatar_hash("gcom@com.com"))
 
     async def test_confirmed_email(self):
         email = "com@com.com"
@@ -0,0 +1,74 @@
+import unittest
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from src.database.models import Base, Contact, User
+from src.repository.contacts import next_birthday
+from src.services.birthdays import BirthdayDigests
+
+
+class TestNextBirthday(unittest.TestCase):
+    def test_later_this_year_and_next_year(self):
+        self.assertEqual(next_birthday(date(1990, 12, 31), date(2026, 12, 30)), date(2026, 12, 31))
+        self.assertEqual(next_birthday(date(1990, 1, 2), date(2026, 12, 30)), date(2027, 1, 2))
+
+    def test_leap_day(self):
+        self.assertEqual(next_birthday(date(2000, 2, 29), date(2026, 2, 25)), date(2026, 2, 28))
+        self.assertEqual(next_birthday(date(2000, 2, 29), date(2028, 2, 25)), date(2028, 2, 29))
+
+
+class TestBirthdayDigests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        self.factory = sessionmaker(bind=engine)
+        with self.factory() as db:
+            db.add_all([User(id=1, username="alice", email="alice@example.com", password="x", confirmed=True),
+                        User(id=2, username="bob", email="bob@example.com", password="x", confirmed=True),
+                        User(id=3, username="carol", email="carol@example.com", password="x", confirmed=False)])
+            birthdays = [(1, "Ivan", date(1990, 1, 3)), (1, "Olha", date(1985, 12, 30)),
+                         (1, "Taras", date(1980, 2, 14)), (2, "Petro", date(2000, 12, 31)),
+                         (3, "Anna", date(1995, 1, 1))]
+            for index, (user_id, name, birthdate) in enumerate(birthdays):
+                db.add(Contact(first_name=name, last_name="Shevchenko", email=f"c{index}@example.com",
+                               phonenumber="+380501234567", birthdate=birthdate, user_id=user_id))
+            db.commit()
+        self.digests = BirthdayDigests()
+        self.digests.per_minute = 60000
+
+    def test_collect_groups_by_user_over_new_year(self):
+        digests = self.digests.collect(self.factory, date(2026, 12, 28))
+        self.assertEqual([digest["username"] for digest in digests], ["alice", "bob"])
+        self.assertEqual([birthday["name"] for birthday in digests[0]["birthdays"]],
+                         ["Olha Shevchenko", "Ivan Shevchenko"])
+        self.assertEqual(digests[0]["birthdays"][1]["age"], 37)
+
+    def redis(self) -> MagicMock:
+        r = MagicMock()
+        sent = set()
+        r.sismember = AsyncMock(side_effect=lambda key, user_id: user_id in sent)
+        r.sadd = AsyncMock(side_effect=lambda key, user_id: 0 if user_id in sent else sent.add(user_id) or 1)
+        r.expire, r.set = AsyncMock(), AsyncMock()
+        return r
+
+    async def test_run_sends_once_per_user(self):
+        r = self.redis()
+        with patch("src.services.birthdays.contact_databases", return_value=[self.factory]), \
+                patch("src.services.birthdays.send_birthday_digest", new_callable=AsyncMock) as send:
+            self.assertEqual(await self.digests.run(date(2026, 12, 28), r), 2)
+            self.assertEqual(await self.digests.run(date(2026, 12, 28), r), 0)
+        self.assertEqual([call.args[0] for call in send.await_args_list], ["alice@example.com", "bob@example.com"])
+
+    async def test_failed_send_is_retried(self):
+        r = self.redis()
+        with patch("src.services.birthdays.contact_databases", return_value=[self.factory]), \
+                patch("src.services.birthdays.send_birthday_digest", new_callable=AsyncMock,
+                      side_effect=[ConnectionError("smtp down"), None, None]) as send:
+            self.assertEqual(await self.digests.run(date(2026, 12, 28), r), 1)
+            r.set.assert_not_awaited()
+            self.assertEqual(await self.digests.run(date(2026, 12, 28), r), 1)
+            r.set.assert_awaited_once()
+        self.assertEqual([call.args[0] for call in send.await_args_list],
+                         ["alice@example.com", "bob@example.com", "alice@example.com"])
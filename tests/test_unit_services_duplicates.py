@@ -0,0 +1,36 @@
+import asyncio
+import datetime
+import unittest
+from unittest.mock import patch
+from src.services.duplicates import ContactRow, blocking_keys, find_duplicates, find_duplicates_async, shutdown
+
+
+class TestDuplicates(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        birthdate = datetime.date(1990, 5, 17)
+        self.rows = [
+            ContactRow(1, "John", "Doe", "john.doe@example.com", "+380501234567", birthdate),
+            ContactRow(2, "Jóhn", "Doe", "John.Doe+work@example.com", None, birthdate),
+            ContactRow(3, "Jane", "Smith", "jane@example.com", "+380501234567", None),
+            ContactRow(4, "Bob", "Stone", "bob@example.com", "+380671112233", None),
+        ]
+
+    def test_blocking_keys_are_normalized(self):
+        self.assertEqual(blocking_keys(self.rows[0])[0], blocking_keys(self.rows[1])[0])
+        self.assertIn("phone:+380501234567", blocking_keys(self.rows[2]))
+
+    def test_find_duplicates(self):
+        pairs = find_duplicates(self.rows)
+        self.assertEqual(pairs[0]["ids"], [1, 2])
+        self.assertEqual(pairs[0]["reasons"], ["email", "name", "birthdate"])
+        self.assertNotIn([3, 4], [pair["ids"] for pair in pairs])
+
+    def test_shared_phone_alone_is_below_threshold(self):
+        self.assertNotIn([1, 3], [pair["ids"] for pair in find_duplicates(self.rows)])
+        self.assertIn([1, 3], [pair["ids"] for pair in find_duplicates(self.rows, min_score=0.4)])
+
+    async def test_large_books_use_worker_process(self):
+        with patch("src.services.duplicates.PROCESS_THRESHOLD", 1):
+            pairs = await find_duplicates_async(self.rows)
+        shutdown()
+        self.assertEqual(pairs, find_duplicates(self.rows))
@@ -0,0 +1,51 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from src.services.events import ContactEvents
+
+
+class TestContactEvents(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.events = ContactEvents()
+        self.events.queue_size = 2
+        self.events.heartbeat = 0.05
+
+    async def test_publish_without_start_is_noop(self):
+        self.events.publish(1, "created", 10)
+        self.assertIsNone(self.events._outbox)
+
+    async def test_publish_sends_to_user_channel(self):
+        r = MagicMock()
+        r.publish = AsyncMock()
+        self.events._loop = asyncio.get_running_loop()
+        self.events._outbox = asyncio.Queue()
+        task = asyncio.create_task(self.events._publish_loop(r))
+        self.events.publish(7, "updated", 3)
+        await asyncio.sleep(0.01)
+        task.cancel()
+        r.publish.assert_awaited_once_with("contacts:7", json.dumps({"event": "updated", "id": 3}))
+
+    async def test_dispatch_only_to_owner(self):
+        mine, other = self.events.subscribe(1), self.events.subscribe(2)
+        self.events.dispatch(1, "a")
+        self.assertEqual(mine.get_nowait(), "a")
+        self.assertTrue(other.empty())
+
+    async def test_slow_stream_gets_resync(self):
+        queue = self.events.subscribe(1)
+        for message in ("a", "b", "c"):
+            self.events.dispatch(1, message)
+        self.assertEqual(json.loads(queue.get_nowait()), {"event": "resync"})
+        self.assertTrue(queue.empty())
+
+    async def test_stream_heartbeat_and_unsubscribe(self):
+        request = MagicMock()
+        request.is_disconnected = AsyncMock(return_value=False)
+        stream = self.events.stream(1, request)
+        self.assertTrue((await anext(stream)).startswith("retry:"))
+        self.events.dispatch(1, "x")
+        self.assertEqual(await anext(stream), "data: x\n\n")
+        self.assertEqual(await anext(stream), ": ping\n\n")
+        await stream.aclose()
+        self.assertNotIn(1, self.events.subscribers)
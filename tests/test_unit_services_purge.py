@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+from src.services.purge import LOCK_KEY, PurgeWorker, parse_hours
+
+
+class TestPurgeWindow(unittest.TestCase):
+    def setUp(self) -> None:
+        self.worker = PurgeWorker()
+
+    def test_parse_hours(self):
+        self.assertEqual(parse_hours("2-5"), (2, 5))
+        self.assertIsNone(parse_hours(""))
+        with self.assertRaises(ValueError):
+            parse_hours("25-3")
+
+    def test_window(self):
+        self.worker.hours = (2, 5)
+        self.assertTrue(self.worker.in_window(datetime(2026, 1, 1, 2, 0)))
+        self.assertFalse(self.worker.in_window(datetime(2026, 1, 1, 5, 0)))
+
+    def test_window_over_midnight(self):
+        self.worker.hours = (22, 4)
+        self.assertTrue(self.worker.in_window(datetime(2026, 1, 1, 23, 30)))
+        self.assertTrue(self.worker.in_window(datetime(2026, 1, 1, 1, 0)))
+        self.assertFalse(self.worker.in_window(datetime(2026, 1, 1, 12, 0)))
+
+    def test_no_window(self):
+        self.worker.hours = None
+        self.assertTrue(self.worker.in_window(datetime(2026, 1, 1, 12, 0)))
+
+
+class TestPurgeLock(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.worker = PurgeWorker()
+        self.worker.hours = None
+        self.worker.pause = 0
+        self.worker.batch_size = 2
+        self.redis = MagicMock(set=AsyncMock(return_value=True), expire=AsyncMock(), delete=AsyncMock())
+
+    async def run_loop(self):
+        async def sleep(seconds):
+            # the pause between batches passes, the wait for the next run stops the loop
+            if seconds == self.worker.interval:
+                raise asyncio.CancelledError
+
+        with patch("src.services.purge.asyncio.sleep", sleep):
+            with self.assertRaises(asyncio.CancelledError):
+                await self.worker._loop(self.redis)
+
+    async def test_lock_refreshed_per_batch_and_released(self):
+        with patch("src.services.purge.contact_databases", return_value=[MagicMock()]), \
+                patch.object(self.worker, "purge_chunk", side_effect=[2, 2, 1]):
+            await self.run_loop()
+        self.assertEqual(self.redis.expire.await_count, 3)
+        self.redis.expire.assert_awaited_with(LOCK_KEY, self.worker.lock_seconds)
+        self.redis.delete.assert_awaited_once_with(LOCK_KEY)
+
+    async def test_lock_released_when_run_fails(self):
+        with patch("src.services.purge.contact_databases", return_value=[MagicMock()]), \
+                patch.object(self.worker, "purge_chunk", side_effect=RuntimeError("database gone")):
+            await self.run_loop()
+        self.redis.delete.assert_awaited_once_with(LOCK_KEY)
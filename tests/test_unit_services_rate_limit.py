@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from starlette.datastructures import Headers
+from src.services.rate_limit import client_ip, parse_networks
+
+
+def request(peer: str, forwarded: str | None = None) -> MagicMock:
+    headers = Headers({"x-forwarded-for": forwarded} if forwarded is not None else {})
+    return MagicMock(client=MagicMock(host=peer), headers=headers)
+
+
+class TestClientIp(unittest.TestCase):
+    def setUp(self) -> None:
+        patcher = patch("src.services.rate_limit.TRUSTED_PROXIES", parse_networks("127.0.0.1, 10.0.0.0/8"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_untrusted_peer_ignores_header(self):
+        self.assertEqual(client_ip(request("203.0.113.7", "198.51.100.1")), "203.0.113.7")
+
+    def test_trusted_proxy(self):
+        self.assertEqual(client_ip(request("127.0.0.1", "198.51.100.1")), "198.51.100.1")
+
+    def test_spoofed_hops_before_the_proxy_are_ignored(self):
+        self.assertEqual(client_ip(request("127.0.0.1", "1.2.3.4, 198.51.100.1, 10.0.0.5")), "198.51.100.1")
+
+    def test_trusted_proxy_without_header(self):
+        self.assertEqual(client_ip(request("10.1.2.3")), "10.1.2.3")
+
+    def test_any_proxy(self):
+        with patch("src.services.rate_limit.TRUSTED_PROXIES", parse_networks("*")):
+            self.assertEqual(client_ip(request("203.0.113.7", "198.51.100.1, 10.0.0.5")), "198.51.100.1")
+
+    def test_parse_networks(self):
+        self.assertIsNone(parse_networks("*"))
+        self.assertEqual([str(network) for network in parse_networks("127.0.0.1,10.0.0.0/8")],
+                         ["127.0.0.1/32", "10.0.0.0/8"])
+        with self.assertRaises(ValueError):
+            parse_networks("localhost")